@@ -0,0 +1,482 @@
+import argparse
+import asyncio
+import logging
+import signal
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pydobot import Dobot
+from pydobot.dobot import MODE_PTP, DobotException, Joints, Pose, Position
+from pydobot.message import Message
+
+import pydobot_gripper
+import pydobot_suction
+from dobot_sim import SimulatedDobot
+from effectors import EFFECTORS, make_effector
+from motion import FORCE_STOP_CMD_ID, WAIT_CMD_ID
+from pallet import PalletLayout
+from palletizer import Palletizer
+from protocol import FrameParser
+
+EFFECTOR_BLOCKS = {"suction": pydobot_suction.BLOCKS, "gripper": pydobot_gripper.BLOCKS}
+
+
+def frame(msg_id, ctrl=0x00, params=b""):
+    """Build a pydobot Message"""
+    msg = Message()
+    msg.id = msg_id
+    msg.ctrl = ctrl
+    msg.params = bytearray(params)
+    return msg
+
+
+class SerialTransport:
+    """Non-blocking request/response over a serial port, driven by loop.add_reader
+
+    Requires a selectable file descriptor, so it works on POSIX serial
+    devices (/dev/ttyACM0, /dev/ttyUSB0, ptys) but not on Windows COM ports.
+    Replies carry no sequence number, so they are matched to requests in
+    order; after a reply timeout resync() drops what is still in flight.
+    """
+
+    def __init__(self, port, baudrate=115200, quiet=0.1):
+        """Open the port
+
+        quiet -- seconds without incoming bytes that end a resync
+        """
+        import serial  # only needed for hardware runs
+        self.serial = serial.Serial(port, baudrate=baudrate, timeout=0)
+        self.parser = FrameParser()
+        self.waiters = deque()
+        self.quiet = quiet
+        self.last_read = time.monotonic()
+        self.ready = asyncio.Event()
+        self.ready.set()
+        self.resyncs = 0
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.serial.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        data = self.serial.read(self.serial.in_waiting or 1)
+        self.last_read = time.monotonic()
+        if not self.ready.is_set():
+            return  # resynchronising: everything still arriving answers a lost request
+        for reply in self.parser.feed(data):
+            # Requests that timed out may still get a (late) reply; skip them
+            while self.waiters and self.waiters[0][1].done():
+                self.waiters.popleft()
+            if not self.waiters:
+                continue
+            msg_id, future = self.waiters[0]
+            if reply.id == msg_id:
+                self.waiters.popleft()
+                future.set_result(reply)
+
+    async def request(self, msg):
+        await self.ready.wait()
+        future = self.loop.create_future()
+        self.waiters.append((msg.id, future))
+        self.serial.write(msg.bytes())
+        return await future
+
+    async def resync(self, limit=2.0):
+        """Fail every request in flight and discard replies until the line goes quiet
+
+        A reply that arrives after its request timed out would otherwise be
+        taken for the next request with the same id, shifting every reply
+        after it by one. New requests wait until the resync is done; it
+        gives up waiting for silence after `limit` seconds.
+        """
+        if not self.ready.is_set():
+            await self.ready.wait()  # another request is already resynchronising
+            return
+        self.ready.clear()
+        self.resyncs += 1
+        for _, future in self.waiters:
+            if not future.done():
+                future.set_exception(DobotException("Reply lost; request dropped while resynchronising"))
+        self.waiters.clear()
+        self.last_read = time.monotonic()
+        deadline = self.last_read + limit
+        while time.monotonic() - self.last_read < self.quiet and time.monotonic() < deadline:
+            await asyncio.sleep(self.quiet / 4)
+        self.parser = FrameParser()
+        self.ready.set()
+
+    def close(self):
+        self.loop.remove_reader(self.serial.fileno())
+        for _, future in self.waiters:
+            future.cancel()
+        self.waiters.clear()
+        self.serial.close()
+
+
+class SimulatedTransport:
+    """Serve requests from a SimulatedDobot, waiting out its serial delay with asyncio.sleep"""
+
+    def __init__(self, sim=None):
+        self.sim = sim or SimulatedDobot()
+        self.lock = asyncio.Lock()
+
+    async def request(self, msg):
+        # One exchange at a time, like the single serial line being modelled
+        async with self.lock:
+            reply, delay = self.sim.respond(msg)
+            await asyncio.sleep(delay)
+        return reply
+
+    async def resync(self):
+        pass  # replies are returned in-line; none can arrive late
+
+    def close(self):
+        self.sim.close()
+
+
+class AsyncDobot:
+    """Awaitable Dobot driver: commands never block the event loop
+
+    Mirrors the pydobot.Dobot calls the palletizers use (move_to, suck,
+    grip, get_pose, queue control), so pose polling, an e-stop watcher
+    and command submission can all run as tasks on one loop.
+    """
+
+    def __init__(self, transport, timeout=2.0, poll_interval=0.02):
+        """Wrap an open transport
+
+        timeout       -- seconds to wait for the reply to a single request
+        poll_interval -- seconds between queue index polls in wait_for_cmd
+        """
+        self.transport = transport
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    @classmethod
+    async def open(cls, port=None, sim=False, **kwargs):
+        """Connect to a serial port (or the simulator) and reset the controller queue"""
+        transport = SimulatedTransport() if sim else SerialTransport(port)
+        device = cls(transport, **kwargs)
+        await device.initialize()
+        return device
+
+    async def initialize(self):
+        """Same start-up sequence as pydobot.Dobot.__init__"""
+        await self.start_queue()
+        await self.clear_queue()
+        await self.send(frame(80, 0x03, struct.pack("<8f", *[200.0] * 8)))
+        await self.set_coordinate_params(200, 200)
+        await self.set_jump_params(10, 200)
+        await self.set_common_params(100, 100)
+        if await self.get_alarms():
+            await self.clear_alarms()
+
+    async def send(self, msg):
+        """Send one frame and return its reply; a timeout resynchronises the transport"""
+        try:
+            return await asyncio.wait_for(self.transport.request(msg), self.timeout)
+        except asyncio.TimeoutError:
+            await self.transport.resync()
+            raise DobotException(f"No response to command {msg.id}") from None
+
+    async def _queued(self, msg_id, params):
+        reply = await self.send(frame(msg_id, 0x03, params))
+        return struct.unpack_from("<I", reply.params, 0)[0]
+
+    async def move_to(self, x, y, z, r=0.0, mode=MODE_PTP.MOVJ_XYZ):
+        return await self._queued(84, struct.pack("<B4f", mode, x, y, z, r))
+
+    async def suck(self, enable):
+        return await self._queued(62, bytes([0x01, 0x01 if enable else 0x00]))
+
+    async def grip(self, enable):
+        return await self._queued(63, bytes([0x01, 0x01 if enable else 0x00]))
+
+    async def dwell(self, seconds):
+        """Queue a controller-side wait (SetWAITCmd)"""
+        return await self._queued(WAIT_CMD_ID, struct.pack("<I", int(round(seconds * 1000))))
+
+    async def set_jump_params(self, jump, limit):
+        return await self._queued(82, struct.pack("<2f", jump, limit))
+
+    async def set_coordinate_params(self, velocity, acceleration):
+        return await self._queued(81, struct.pack("<4f", velocity, velocity, acceleration, acceleration))
+
+    async def set_common_params(self, velocity, acceleration):
+        return await self._queued(83, struct.pack("<2f", velocity, acceleration))
+
+    async def get_pose(self):
+        reply = await self.send(frame(10))
+        values = struct.unpack_from("<8f", reply.params, 0)
+        return Pose(Position(*values[:4]), Joints(*values[4:]))
+
+    async def get_alarms(self):
+        reply = await self.send(frame(20))
+        return {i for i in range(len(reply.params) * 8) if reply.params[i // 8] & (1 << (i % 8))}
+
+    async def clear_alarms(self):
+        await self.send(frame(20, 0x01))
+
+    async def current_index(self):
+        reply = await self.send(frame(246))
+        return struct.unpack_from("<I", reply.params, 0)[0]
+
+    async def wait_for_cmd(self, index, timeout=None):
+        """Yield to the loop until queue index `index` has been executed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while await self.current_index() < index:
+            if deadline is not None and time.monotonic() > deadline:
+                raise DobotException(f"Command {index} did not complete in time")
+            await asyncio.sleep(self.poll_interval)
+
+    async def start_queue(self):
+        await self.send(frame(240, 0x01))
+
+    async def stop_queue(self):
+        """Stop the queue once the command in progress has finished"""
+        await self.send(frame(241, 0x01))
+
+    async def force_stop_queue(self):
+        """Stop the queue at once, cutting short the command in progress"""
+        await self.send(frame(FORCE_STOP_CMD_ID, 0x01))
+
+    async def clear_queue(self):
+        await self.send(frame(245, 0x01))
+
+    async def abort(self):
+        """Stop the arm and drop everything still queued"""
+        await self.force_stop_queue()
+        await self.clear_queue()
+        await self.start_queue()
+
+    def close(self):
+        self.transport.close()
+
+
+class LoopDobot(Dobot):
+    """pydobot.Dobot whose frames are exchanged by an AsyncDobot on an event loop
+
+    Every pydobot call ends in _send_command(), so the blocking Palletizer
+    engine can drive the arm from a worker thread while the loop keeps
+    serving telemetry and the e-stop. Once `stopped` is set every further
+    command raises, so a run on the worker thread unwinds at its next
+    request instead of queueing more motion.
+    """
+
+    def __init__(self, device, loop):
+        self.logger = logging.Logger(__name__)
+        self._lock = threading.RLock()
+        self.device = device
+        self.loop = loop
+        self.stopped = threading.Event()
+
+    async def _send(self, msg):
+        # Checked again on the loop, so a frame scheduled before the e-stop cannot follow its abort
+        if self.stopped.is_set():
+            raise DobotException("Emergency stop")
+        return await self.device.send(msg)
+
+    def _send_command(self, msg):
+        if self.stopped.is_set():
+            raise DobotException("Emergency stop")
+        return asyncio.run_coroutine_threadsafe(self._send(msg), self.loop).result()
+
+    def close(self):
+        pass  # the AsyncDobot owns the connection
+
+
+class AsyncPalletizer:
+    """Async transfer/return cycle for either end effector on an AsyncDobot
+
+    The passes are run by the shared palletizer.Palletizer engine (planning,
+    pipelined queueing, pose convergence, journal, workspace map, speed
+    profiles, adaptive dwell) on one worker thread, talking to the arm
+    through a LoopDobot; pose polling and the e-stop stay on the loop.
+    The engine is blocking code, so this one thread is the price of not
+    keeping a second, awaitable copy of it: every frame still goes over
+    the loop's transport, but the pass waits for its replies off the loop.
+    """
+
+    def __init__(self, device, effector="suction", blocks=None, verbose=True, **options):
+        """Set up a palletizer on a connected AsyncDobot
+
+        effector -- effectors.EndEffector driver or its name; also picks the
+                    calibrated block table (by name) when blocks is None
+        blocks   -- block dicts or a PalletLayout
+        options  -- other palletizer.Palletizer arguments (safe_height, jump,
+                    on_the_fly, workspace, journal, ...)
+        """
+        self.device = device
+        self.effector = make_effector(effector)
+        if blocks is None:
+            blocks = EFFECTOR_BLOCKS[self.effector.name]
+        self.blocks = blocks if isinstance(blocks, PalletLayout) else PalletLayout.from_blocks(blocks)
+        self.verbose = verbose
+        self.options = options
+        self.bridge = None
+        self.palletizer = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="palletizer")
+        self.stopped = asyncio.Event()
+
+    def _engine(self):
+        # Built on the worker thread: connecting sends commands, which must not block the loop
+        if self.palletizer is None:
+            self.palletizer = Palletizer(port="asyncio driver", device=self.bridge, effector=self.effector,
+                                         blocks=self.blocks, verbose=self.verbose, **self.options)
+        return self.palletizer
+
+    async def _run(self, call):
+        """Run call(palletizer) on the worker thread"""
+        loop = asyncio.get_running_loop()
+        if self.bridge is None:
+            self.bridge = LoopDobot(self.device, loop)
+        return await loop.run_in_executor(self.executor, lambda: call(self._engine()))
+
+    async def transfer_blocks(self):
+        return await self._run(lambda palletizer: palletizer.transfer_blocks())
+
+    async def return_blocks(self):
+        return await self._run(lambda palletizer: palletizer.return_blocks())
+
+    async def run_complete_cycle(self, pause=3.0):
+        """Async Palletizer.run_complete_cycle; stopped by emergency_stop()"""
+        print("=== DOBOT PALLETIZATION CYCLE ===")
+        start_time = time.time()
+        self.stopped.clear()
+        if self.bridge is not None:
+            self.bridge.stopped.clear()
+        cycle = asyncio.ensure_future(self._cycle(pause))
+        stop = asyncio.ensure_future(self.stopped.wait())
+        try:
+            await asyncio.wait([cycle, stop], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+        if self.stopped.is_set():
+            # The pass on the worker thread fails at its next command; let it unwind
+            await asyncio.gather(cycle, return_exceptions=True)
+            print("Cycle stopped")
+            return None
+        try:
+            transferred, returned = cycle.result()
+        except Exception as e:
+            print(f"Error during cycle: {e}")
+            await self.emergency_stop()
+            return None
+        if returned is None:
+            print("No blocks were transferred successfully. Skipping return operation.")
+            return None
+
+        total_time = time.time() - start_time
+        print(f"\n=== CYCLE RESULTS ===")
+        print(f"Blocks transferred: {transferred}/{len(self.blocks)}")
+        print(f"Blocks returned: {returned}/{len(self.blocks)}")
+        print(f"Total cycle time: {total_time:.2f} seconds")
+        return {"transferred": transferred, "returned": returned, "time": total_time}
+
+    async def _cycle(self, pause):
+        transferred = await self.transfer_blocks()
+        if transferred == 0 or self.stopped.is_set():
+            return transferred, None
+        print(f"\nPausing for {pause:g} seconds before return operation...")
+        try:
+            await asyncio.wait_for(self.stopped.wait(), pause)
+        except asyncio.TimeoutError:
+            pass
+        if self.stopped.is_set():
+            return transferred, None
+        return transferred, await self.return_blocks()
+
+    async def abort_queue(self):
+        """Drop queued commands and release the effector, straight from the loop"""
+        try:
+            await self.device.abort()
+            await self.release()
+        except DobotException as e:
+            print(f"  Error aborting queue: {e}")
+
+    async def emergency_stop(self):
+        """Stop a running cycle, abort queued motion and release the effector"""
+        print("\n!!! EMERGENCY STOP !!!")
+        self.stopped.set()
+        if self.bridge is not None:
+            self.bridge.stopped.set()
+        await self.abort_queue()
+
+    async def release(self):
+        """Switch the end effector off"""
+        return await self.effector.actuate(self.device, False)
+
+    async def disconnect(self):
+        """Release the tool, park at the safe position (unless stopped) and close the journal"""
+        if self.palletizer is None or self.stopped.is_set():
+            await self.release()
+        if self.palletizer is not None:
+            await self._run(lambda palletizer: palletizer.disconnect())
+        self.executor.shutdown()
+
+    async def watch_pose(self, interval=0.5, callback=None):
+        """Poll the pose every `interval` seconds until cancelled"""
+        while True:
+            pose = await self.device.get_pose()
+            if callback is not None:
+                callback(pose)
+            await asyncio.sleep(interval)
+
+
+async def run(args):
+    device = await AsyncDobot.open(args.port, sim=args.sim)
+    palletizer = AsyncPalletizer(device, effector=args.effector, jump=args.jump, clearance=args.clearance,
+                                 on_the_fly=args.on_the_fly, workspace=args.workspace or None,
+                                 speed_profiles=args.speed_profiles or None,
+                                 journal=f"async_{args.effector}_job.journal" if args.resume else None)
+
+    def show(pose):
+        x, y, z, r = pose.position
+        print(f"  [pose] x={x:.1f} y={y:.1f} z={z:.1f} r={r:.1f}")
+
+    # Telemetry and the Ctrl+C e-stop share the loop; only the palletizer engine runs on a worker thread
+    telemetry = asyncio.ensure_future(palletizer.watch_pose(args.telemetry, show if args.telemetry_log else None))
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, lambda: asyncio.ensure_future(palletizer.emergency_stop()))
+    except NotImplementedError:
+        pass  # Windows event loops: Ctrl+C raises KeyboardInterrupt instead
+    try:
+        return await palletizer.run_complete_cycle(pause=args.pause)
+    finally:
+        telemetry.cancel()
+        await asyncio.gather(telemetry, return_exceptions=True)
+        await palletizer.disconnect()
+        device.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a palletizing cycle on the asyncio driver")
+    parser.add_argument("--effector", choices=sorted(EFFECTORS), default="suction")
+    parser.add_argument("--port", default="/dev/ttyACM0")
+    parser.add_argument("--sim", action="store_true", help="use the simulated Dobot")
+    parser.add_argument("--jump", action="store_true", help="use jump (arc) moves")
+    parser.add_argument("--clearance", type=float, help="per-leg traverse clearance in mm")
+    parser.add_argument("--on-the-fly", type=float, metavar="MM",
+                        help="switch the tool this far from the pick/drop while still moving")
+    parser.add_argument("--workspace", action="store_true",
+                        help="track placed blocks and traverse only as high as they require")
+    parser.add_argument("--speed-profiles", action="store_true",
+                        help="fast traverses, gentle carrying and a slow final approach onto each block")
+    parser.add_argument("--resume", action="store_true", help="journal progress and continue an interrupted job")
+    parser.add_argument("--pause", type=float, default=3.0, help="seconds between transfer and return")
+    parser.add_argument("--telemetry", type=float, default=0.5, help="pose polling interval in seconds")
+    parser.add_argument("--telemetry-log", action="store_true", help="print every polled pose")
+    args = parser.parse_args(argv)
+    try:
+        results = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n\nKeyboard interrupt detected...")
+        results = None
+    print("\n=== SUCCESS ===" if results else "\n=== FAILED ===")
+    return results
+
+
+if __name__ == "__main__":
+    main()
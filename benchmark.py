@@ -0,0 +1,265 @@
+import argparse
+import csv
+import json
+import math
+import subprocess
+import time
+from collections import defaultdict
+
+import pydobot_gripper
+import pydobot_suction
+from dobot_sim import SimulatedDobot, SimulatedSerialPort
+from motion import SERIAL_PHASE
+from trajectory import PHASES
+
+EFFECTORS = {
+    "suction": pydobot_suction.DobotPalletizer,
+    "gripper": pydobot_gripper.DobotPalletizer,
+}
+
+# Block layouts --compare can run every effector over
+LAYOUTS = {
+    "suction": pydobot_suction.BLOCKS,
+    "gripper": pydobot_gripper.BLOCKS,
+}
+
+CSV_FIELDS = ["effector", "metric", "count", "total", "mean", "p50", "p95", "max"]
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100) of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    low = math.floor(position)
+    high = math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def describe(values):
+    """count/total/mean/p50/p95/max for a list of durations"""
+    total = sum(values)
+    return {
+        "count": len(values),
+        "total": total,
+        "mean": total / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def git_commit():
+    """Short hash of the checked-out commit, so results can be compared across commits"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PhaseRecorder:
+    """Collect per-phase durations reported by MotionSequencer.on_phase"""
+
+    def __init__(self, scale=1.0):
+        """scale converts wall-clock seconds to device seconds (SimulatedDobot.time_scale)"""
+        self.scale = scale
+        self.samples = defaultdict(list)
+
+    def __call__(self, phase, seconds):
+        self.samples[phase].append(seconds * self.scale)
+
+
+def run_benchmark(effector="suction", cycles=1, sim=True, port=None, time_scale=1.0,
+                  verbose=False, layout=None, pty=False, **options):
+    """Run transfer + return passes for `cycles` cycles and return the results dict
+
+    layout names the LAYOUTS entry to run over (default: the effector's own
+    blocks). pty serves the simulator on a pseudo-terminal so the run goes
+    through the real serial driver (see fast_protocol). Extra keyword
+    options are passed to DobotPalletizer (pipelined, jump, ...).
+    """
+    palletizer_cls = EFFECTORS[effector]
+    scale = time_scale if sim else 1.0
+    recorder = PhaseRecorder(scale)
+    cycle_times = []
+    blocks_moved = 0
+
+    device = SimulatedDobot(time_scale=time_scale) if sim else None
+    server = None
+    if device is not None and pty:
+        server = SimulatedSerialPort(device)
+        port = server.name
+    kwargs = dict(options, device=None if server else device, verbose=verbose)
+    if port:
+        kwargs["port"] = port
+    if layout is not None:
+        kwargs["blocks"] = LAYOUTS[layout]
+    palletizer = palletizer_cls(**kwargs)
+    palletizer.motion.on_phase = recorder
+    # Keep phase timestamps at the same device-time resolution when sped up
+    palletizer.motion.poll_interval /= scale
+    try:
+        for _ in range(cycles):
+            start = time.perf_counter()
+            blocks_moved += palletizer.transfer_blocks()
+            blocks_moved += palletizer.return_blocks()
+            cycle_times.append((time.perf_counter() - start) * scale)
+    finally:
+        palletizer.disconnect()
+        if server is not None:
+            server.close()
+
+    busy = sum(cycle_times)
+    return {
+        "effector": effector,
+        "layout": layout or effector,
+        "dwell": palletizer.actuation_dwell,
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "cycles": cycles,
+        "sim": sim,
+        "options": {key: value for key, value in options.items() if not callable(value)},
+        "blocks": blocks_moved,
+        "blocks_per_minute": blocks_moved * 60.0 / busy if busy else 0.0,
+        "cycle": describe(cycle_times),
+        "phases": {phase: describe(recorder.samples.get(phase, []))
+                   for phase in PHASES + (SERIAL_PHASE,)},
+        "counters": dict(palletizer.tracer.counters),
+        # Blocks the simulator saw dragged off before they settled (None on hardware)
+        "slips": getattr(device, "slip_count", None),
+    }
+
+
+def write_json(results, path):
+    """Write a list of benchmark result dicts as JSON"""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+
+
+def write_csv(results, path):
+    """Write one row per effector and metric (cycle or phase)"""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for result in results:
+            rows = [("cycle", result["cycle"])] + list(result["phases"].items())
+            for metric, stats in rows:
+                writer.writerow(dict(stats, effector=result["effector"], metric=metric))
+
+
+def print_report(result):
+    """Print a human readable summary of one benchmark result"""
+    print(f"\n=== {result['effector'].upper()} BENCHMARK ({result['cycles']} cycles) ===")
+    print(f"Blocks moved: {result['blocks']}  ({result['blocks_per_minute']:.1f} blocks/min)")
+    cycle = result["cycle"]
+    print(f"Cycle time: p50 {cycle['p50']:.2f}s  p95 {cycle['p95']:.2f}s  max {cycle['max']:.2f}s")
+    if result.get("slips") is not None:
+        print(f"Slipped blocks: {result['slips']}")
+    print(f"{'phase':<10}{'count':>7}{'total':>10}{'p50':>9}{'p95':>9}{'max':>9}")
+    for phase, stats in result["phases"].items():
+        print(f"{phase:<10}{stats['count']:>7}{stats['total']:>10.3f}"
+              f"{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['max']:>9.3f}")
+
+
+def compare_effectors(layout="suction", cycles=1, sim=True, port=None, time_scale=1.0,
+                      verbose=False, before_run=None, **options):
+    """Benchmark every end effector over the same block layout, so only the tool differs
+
+    before_run(effector) is called ahead of each run (e.g. to prompt for a
+    tool change on hardware). Returns one results dict per effector.
+    """
+    results = []
+    for effector in EFFECTORS:
+        if before_run is not None:
+            before_run(effector)
+        results.append(run_benchmark(effector, cycles=cycles, sim=sim, port=port, time_scale=time_scale,
+                                     verbose=verbose, layout=layout, **options))
+    return results
+
+
+def print_comparison(results):
+    """Side-by-side cycle and per-phase time (per cycle) of compare_effectors() results"""
+    names = [result["effector"] for result in results]
+    print(f"\n=== END EFFECTOR COMPARISON ({results[0]['layout']} layout, {results[0]['cycles']} cycles) ===")
+    print(f"{'metric':<12}" + "".join(f"{name:>10}" for name in names) + f"{'delta':>10}")
+    rows = [("cycle p50", [result["cycle"]["p50"] for result in results]),
+            ("dwell", [result["dwell"] for result in results])]
+    for phase in results[0]["phases"]:
+        rows.append((phase, [result["phases"][phase]["total"] / result["cycles"] for result in results]))
+    for metric, values in rows:
+        print(f"{metric:<12}" + "".join(f"{value:>10.3f}" for value in values)
+              + f"{values[-1] - values[0]:>+10.3f}")
+    print(f"{'blocks/min':<12}" + "".join(f"{result['blocks_per_minute']:>10.1f}" for result in results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark palletizer cycle time")
+    parser.add_argument("--effector", choices=sorted(EFFECTORS) + ["both"], default="both")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--hardware", action="store_true", help="use a real Dobot instead of the simulator")
+    parser.add_argument("--port", help="serial port for --hardware runs")
+    parser.add_argument("--time-scale", type=float, default=10.0, help="simulator speed-up factor")
+    parser.add_argument("--step", action="store_true", help="disable pipelined block submission")
+    parser.add_argument("--jump", action="store_true", help="use jump (arc) moves")
+    parser.add_argument("--clearance", type=float, help="per-leg traverse clearance in mm")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--csv", help="write results to this CSV file")
+    parser.add_argument("--verbose", action="store_true", help="show palletizer console output")
+    parser.add_argument("--adaptive-dwell", metavar="PATH",
+                        help="learn grab/release dwells, persisted in this JSON file")
+    parser.add_argument("--on-the-fly", type=float, metavar="MM",
+                        help="switch the tool this far from the pick/drop while still moving")
+    parser.add_argument("--workspace", action="store_true",
+                        help="track placed blocks and traverse only as high as they require")
+    parser.add_argument("--speed-profiles", action="store_true",
+                        help="fast traverses, gentle carrying and a slow final approach onto each block")
+    parser.add_argument("--fast", action="store_true",
+                        help="use the lean FastDobot serial protocol (hardware or --pty runs)")
+    parser.add_argument("--pty", action="store_true",
+                        help="serve the simulator on a pseudo-terminal and go through the serial driver")
+    parser.add_argument("--compare", choices=sorted(LAYOUTS), metavar="LAYOUT",
+                        help="run every end effector over the same block layout and compare them")
+    args = parser.parse_args(argv)
+    options = dict(pipelined=not args.step, jump=args.jump, clearance=args.clearance,
+                   adaptive_dwell=args.adaptive_dwell, on_the_fly=args.on_the_fly,
+                   workspace=args.workspace or None, fast_protocol=args.fast,
+                   speed_profiles=args.speed_profiles or None)
+
+    if args.pty:
+        options["pty"] = True
+
+    if args.compare:
+        before_run = None
+        if args.hardware:
+            before_run = lambda effector: input(f"Mount the {effector} and press Enter...")
+        results = compare_effectors(args.compare, cycles=args.cycles, sim=not args.hardware, port=args.port,
+                                    time_scale=args.time_scale, verbose=args.verbose,
+                                    before_run=before_run, **options)
+        print_comparison(results)
+        if args.json:
+            write_json(results, args.json)
+        if args.csv:
+            write_csv(results, args.csv)
+        return results
+
+    effectors = sorted(EFFECTORS) if args.effector == "both" else [args.effector]
+    results = []
+    for effector in effectors:
+        result = run_benchmark(effector, cycles=args.cycles, sim=not args.hardware, port=args.port,
+                               time_scale=args.time_scale, verbose=args.verbose, **options)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        write_json(results, args.json)
+        print(f"\nResults written to {args.json}")
+    if args.csv:
+        write_csv(results, args.csv)
+        print(f"Results written to {args.csv}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
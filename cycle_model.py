@@ -0,0 +1,378 @@
+import argparse
+import itertools
+import json
+import os
+
+from dobot_sim import HOME_POSE
+from effectors import make_effector
+from jobfile import PASSES, JobFileError, compile_job, read_job_file
+from kinematics import inverse_kinematics_batch, joint_move_times, joint_travel
+from trajectory import (ACTUATE, DEFAULT_ACCELERATION, DEFAULT_VELOCITY, GRAB, JUMP, MOVE, PHASES,
+                        RELEASE, RELEASE_PHASE, SETTLE, segment_time)
+
+# Calibrated model parameters
+MODEL_PATH = os.path.expanduser("~/.cache/dobot_cycle_model.json")
+
+DWELL_PHASES = (ACTUATE, RELEASE_PHASE)
+MOTION_PHASES = tuple(phase for phase in PHASES if phase not in DWELL_PHASES)
+
+# What-if parameters that are not job file [motion] keys
+MODEL_PARAMS = ("velocity", "acceleration")
+
+
+class CycleModel:
+    """Predict pipelined palletizing time from the trajectory plans of a job
+
+    Each move takes its kinematic time - synchronised MOVJ joint time,
+    or the lift/arc/descend of a JUMP, as the controller plans them -
+    times `motion_scale`, plus `move_overhead`. Each grab/release costs
+    its dwell plus `actuation_overhead`, and each pass `pass_overhead`.
+    The defaults are the bare kinematics; calibrate() fits the factors
+    to recorded benchmark runs.
+    """
+
+    def __init__(self, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION, motion_scale=1.0,
+                 move_overhead=0.0, actuation_overhead=0.0, pass_overhead=0.0, runs=0):
+        """Create a model
+
+        velocity, acceleration -- joint limits (deg/s, deg/s^2); also used as the
+                                  linear limits (mm/s, mm/s^2) of jump lifts and descents
+        runs                   -- number of recorded runs the factors were fitted to
+        """
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.motion_scale = motion_scale
+        self.move_overhead = move_overhead
+        self.actuation_overhead = actuation_overhead
+        self.pass_overhead = pass_overhead
+        self.runs = runs
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Model saved by save(), or an uncalibrated one if there is none"""
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def with_limits(self, velocity=None, acceleration=None):
+        """Copy of the model with other joint limits (for what-if sweeps)"""
+        params = self.as_dict()
+        if velocity is not None:
+            params["velocity"] = velocity
+        if acceleration is not None:
+            params["acceleration"] = acceleration
+        return CycleModel(**params)
+
+    def kinematic_times(self, plan, start=HOME_POSE):
+        """Kinematic seconds of every step of a plan (0 for grab/release/settle steps)"""
+        # Joint moves between consecutive waypoints; a jump contributes its lift, arc and descent
+        points = [tuple(start)]
+        for step in plan.steps:
+            if step.kind == JUMP:
+                previous = points[-1]
+                peak = max(step.height, previous[2], step.z)
+                points.append((previous[0], previous[1], peak, previous[3]))
+                points.append((step.x, step.y, peak, step.r))
+            if step.kind in (MOVE, JUMP):
+                points.append((step.x, step.y, step.z, step.r))
+        joints, errors = inverse_kinematics_batch(points)
+        if errors:
+            index, reason = min(errors.items())
+            raise ValueError(f"Waypoint {points[index][:3]} is unreachable: {reason}")
+        moves = iter(joint_move_times(joint_travel(joints), self.velocity, self.acceleration))
+        times = []
+        position = points[0]
+        for step in plan.steps:
+            if step.kind == MOVE:
+                times.append(next(moves))
+            elif step.kind == JUMP:
+                # The controller lifts and descends in straight lines, not as joint moves
+                peak = max(step.height, position[2], step.z)
+                next(moves)
+                arc = next(moves)
+                next(moves)
+                times.append(segment_time(peak - position[2], self.velocity, self.acceleration) + arc +
+                             segment_time(peak - step.z, self.velocity, self.acceleration))
+            else:
+                times.append(0.0)
+                continue
+            position = (step.x, step.y, step.z, step.r)
+        return times
+
+    def step_times(self, plan, dwell, latency=0.0, start=HOME_POSE):
+        """(step, predicted seconds, kinematic seconds) for every step of a plan
+
+        latency -- tool switching time an on-the-fly lead move can hide (plan.lead)
+        """
+        result = []
+        previous_move = 0.0
+        for step, kinematic in zip(plan.steps, self.kinematic_times(plan, start)):
+            if step.kind in (MOVE, JUMP):
+                seconds = self.motion_scale * kinematic + self.move_overhead
+                previous_move = kinematic
+            elif step.kind in (GRAB, RELEASE):
+                seconds = self.actuation_overhead + (dwell if plan.lead is None else 0.0)
+            elif step.kind == SETTLE:
+                seconds = max(dwell - min(previous_move, latency), 0.0)
+            else:
+                seconds = 0.0
+            result.append((step, seconds, kinematic))
+        return result
+
+    def predict(self, job):
+        """Predicted time of a jobfile.CompiledJob: total, per pass, per block and per phase
+
+        Returns {"total", "passes": {name: {"total", "blocks": {block_num: seconds},
+        "phases": {phase: seconds}}}}.
+        """
+        effector = make_effector(job.effector)
+        dwell = job.motion["actuation_dwell"]
+        if dwell is None:
+            dwell = effector.dwell
+        start = HOME_POSE
+        passes = {}
+        for name in PASSES:
+            entry = job.passes[name]
+            plan, order = entry["plan"], entry["order"]
+            blocks = {}
+            phases = dict.fromkeys(PHASES, 0.0)
+            grabs = -1
+            for step, seconds, _ in self.step_times(plan, dwell, effector.latency, start):
+                if step.kind == GRAB:
+                    grabs += 1
+                # Steps leading up to a grab belong to the block being fetched
+                block_num = order[min(max(grabs, 0), len(order) - 1)] + 1
+                blocks[block_num] = blocks.get(block_num, 0.0) + seconds
+                if step.phase in phases:
+                    phases[step.phase] += seconds
+            if plan.position is not None:
+                start = plan.position
+            passes[name] = {"total": sum(blocks.values()) + self.pass_overhead, "blocks": blocks,
+                            "phases": phases}
+        return {"total": sum(entry["total"] for entry in passes.values()), "passes": passes}
+
+    def calibrate(self, runs):
+        """Fit the overhead factors to recorded runs; returns the relative error before and after
+
+        runs -- (job, measured) pairs: a jobfile.CompiledJob and the benchmark
+                result dict recorded for it (see benchmark_job())
+        """
+        motion, dwells, residuals = [], [], []
+        before = self._error(runs)
+        for job, measured in runs:
+            cycles = measured["cycles"]
+            effector = make_effector(job.effector)
+            dwell = job.motion["actuation_dwell"]
+            if dwell is None:
+                dwell = effector.dwell
+            raw = {phase: [0.0, 0, 0.0, 0] for phase in PHASES}  # kinematic, moves, dwell, actions
+            start = HOME_POSE
+            bare = CycleModel(self.velocity, self.acceleration)
+            for name in PASSES:
+                plan = job.passes[name]["plan"]
+                for step, seconds, kinematic in bare.step_times(plan, dwell, effector.latency, start):
+                    if step.phase not in raw:
+                        continue
+                    entry = raw[step.phase]
+                    if step.kind in (MOVE, JUMP):
+                        entry[0] += kinematic
+                        entry[1] += 1
+                    else:
+                        entry[2] += seconds
+                        entry[3] += step.kind in (GRAB, RELEASE)
+                start = plan.position or start
+            for phase, (kinematic, moves, dwell_total, actions) in raw.items():
+                recorded = measured["phases"].get(phase)
+                if recorded is None or not recorded["count"]:
+                    continue
+                seconds = recorded["total"] / cycles
+                if phase in MOTION_PHASES and moves:
+                    motion.append((kinematic, moves, seconds))
+                elif phase in DWELL_PHASES and actions:
+                    dwells.append((actions, seconds - dwell_total))
+        if motion:
+            self.motion_scale, self.move_overhead = _fit_line(motion)
+        if dwells:
+            self.actuation_overhead = max(sum(extra for _, extra in dwells) / sum(n for n, _ in dwells), 0.0)
+        # Whatever the phases do not account for (queue start-up, final waits) is spread per pass
+        self.pass_overhead = 0.0
+        for job, measured in runs:
+            residuals.append((measured["cycle"]["mean"] - self.predict(job)["total"]) / len(PASSES))
+        if residuals:
+            self.pass_overhead = max(sum(residuals) / len(residuals), 0.0)
+        self.runs = len(runs)
+        return before, self._error(runs)
+
+    def _error(self, runs):
+        """Mean relative error of the predicted cycle time over recorded runs"""
+        errors = [abs(self.predict(job)["total"] - measured["cycle"]["mean"]) / measured["cycle"]["mean"]
+                  for job, measured in runs if measured["cycle"]["mean"]]
+        return sum(errors) / len(errors) if errors else 0.0
+
+
+def _fit_line(samples):
+    """Least-squares (scale, overhead) for seconds = scale * kinematic + overhead * moves"""
+    sxx = sum(k * k for k, _, _ in samples)
+    sxn = sum(k * n for k, n, _ in samples)
+    snn = sum(n * n for _, n, _ in samples)
+    sxy = sum(k * y for k, _, y in samples)
+    sny = sum(n * y for _, n, y in samples)
+    det = sxx * snn - sxn * sxn
+    if abs(det) < 1e-9 * max(sxx * snn, 1e-9):
+        return (sxy / sxx if sxx else 1.0), 0.0
+    scale = (sxy * snn - sny * sxn) / det
+    overhead = (sny * sxx - sxy * sxn) / det
+    if overhead < 0:
+        return sxy / sxx, 0.0
+    return scale, overhead
+
+
+def layout_spec(effector, blocks, **motion):
+    """Job spec (as in a job file) for an effector and a list of block dicts"""
+    return {"effector": effector, "motion": motion, "blocks": [dict(block) for block in blocks]}
+
+
+def benchmark_job(result, layouts):
+    """Rebuild the compiled job a benchmark.py result was recorded for
+
+    layouts -- block lists by layout name (benchmark.LAYOUTS). Returns None
+               for runs the model does not cover (step mode, adaptive dwell,
+               speed profiles).
+    """
+    options = result.get("options", {})
+    if not options.get("pipelined", True) or options.get("adaptive_dwell") or options.get("speed_profiles"):
+        return None
+    motion = {"actuation_dwell": result["dwell"], "jump": bool(options.get("jump")),
+              "clearance": options.get("clearance"), "on_the_fly": options.get("on_the_fly"),
+              "workspace": bool(options.get("workspace"))}
+    return compile_job(layout_spec(result["effector"], layouts[result["layout"]], **motion))
+
+
+def sweep(spec, grid, model):
+    """Predict every combination of the values in `grid` and return them fastest first
+
+    grid -- {parameter: [values]} over job [motion] keys (safe_height, clearance,
+            jump, ordering, actuation_dwell, on_the_fly, workspace) and the
+            model's joint limits (velocity, acceleration)
+    Returns a list of {"params", "total", "error"} dicts; configurations with
+    an unreachable waypoint have total None and the reason in error.
+    """
+    names = list(grid)
+    results = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        motion = dict(spec.get("motion", {}))
+        motion.update({key: value for key, value in params.items() if key not in MODEL_PARAMS})
+        candidate = dict(spec, motion=motion)
+        limits = model.with_limits(params.get("velocity"), params.get("acceleration"))
+        try:
+            total, error = limits.predict(compile_job(candidate))["total"], None
+        except (JobFileError, ValueError) as e:
+            total, error = None, str(e)
+        results.append({"params": params, "total": total, "error": error})
+    results.sort(key=lambda entry: (entry["total"] is None, entry["total"] or 0.0))
+    return results
+
+
+def _values(text):
+    """Parse a comma separated sweep list: numbers, on/off, none"""
+    values = []
+    for item in text.split(","):
+        item = item.strip().lower()
+        if item in ("on", "true", "yes"):
+            values.append(True)
+        elif item in ("off", "false", "no"):
+            values.append(False)
+        elif item == "none":
+            values.append(None)
+        else:
+            values.append(float(item) if "." in item else int(item))
+    return values
+
+
+def _load_spec(source, layouts):
+    if source in layouts:
+        return layout_spec(source, layouts[source])
+    return read_job_file(source)
+
+
+def print_prediction(prediction):
+    print(f"Predicted cycle: {prediction['total']:.2f}s")
+    for name, entry in prediction["passes"].items():
+        blocks = "  ".join(f"#{block}: {seconds:.2f}s" for block, seconds in sorted(entry["blocks"].items()))
+        print(f"  {name}: {entry['total']:.2f}s  ({blocks})")
+        print("    " + "  ".join(f"{phase} {seconds:.2f}s" for phase, seconds in entry["phases"].items()))
+
+
+def main(argv=None):
+    from benchmark import LAYOUTS
+
+    parser = argparse.ArgumentParser(description="Predict palletizing cycle time and sweep what-if parameters")
+    parser.add_argument("--model", default=MODEL_PATH, help="calibrated model file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    predict = commands.add_parser("predict", help="predict one job")
+    predict.add_argument("job", help="job file, or a layout name (suction, gripper)")
+    calibrate = commands.add_parser("calibrate", help="fit the model to benchmark.py --json results")
+    calibrate.add_argument("results", nargs="+")
+    what_if = commands.add_parser("sweep", help="predict every combination of parameters")
+    what_if.add_argument("job", help="job file, or a layout name (suction, gripper)")
+    for name in ("safe_height", "clearance", "jump", "ordering", "actuation_dwell", "on_the_fly",
+                 "workspace") + MODEL_PARAMS:
+        what_if.add_argument("--" + name.replace("_", "-"), type=_values, metavar="A,B,...")
+    what_if.add_argument("--top", type=int, default=10, help="configurations to list")
+    args = parser.parse_args(argv)
+
+    model = CycleModel.load(args.model)
+    if args.command == "calibrate":
+        runs = []
+        for path in args.results:
+            with open(path) as f:
+                for result in json.load(f):
+                    job = benchmark_job(result, LAYOUTS)
+                    if job is not None:
+                        runs.append((job, result))
+        if not runs:
+            print("No pipelined, fixed-dwell runs to calibrate against")
+            return None
+        before, after = model.calibrate(runs)
+        model.save(args.model)
+        print(f"Calibrated on {len(runs)} runs: mean error {before:.1%} -> {after:.1%}")
+        print(json.dumps(model.as_dict(), indent=2))
+        return model
+
+    spec = _load_spec(args.job, LAYOUTS)
+    if args.command == "predict":
+        prediction = model.predict(compile_job(spec))
+        print_prediction(prediction)
+        return prediction
+
+    grid = {name: getattr(args, name) for name in vars(args)
+            if name not in ("model", "command", "job", "top") and getattr(args, name) is not None}
+    results = sweep(spec, grid, model)
+    if not model.runs:
+        print("Note: uncalibrated model (bare kinematics); run `calibrate` on recorded runs first")
+    print(f"{'predicted':>10}  parameters")
+    for entry in results[:args.top]:
+        params = ", ".join(f"{key}={value}" for key, value in entry["params"].items())
+        total = f"{entry['total']:.2f}s" if entry["total"] is not None else "unreachable"
+        print(f"{total:>10}  {params}")
+    best = results[0] if results and results[0]["total"] is not None else None
+    if best is not None:
+        print(f"Fastest: {', '.join(f'{key}={value}' for key, value in best['params'].items())} "
+              f"(~{best['total']:.2f}s per cycle)")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import getpass
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from pydobot import Dobot
+
+import pydobot_gripper
+import pydobot_suction
+from dobot_sim import SimulatedDobot
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"dobot-{getpass.getuser()}.sock")
+
+PALLETIZERS = {
+    "suction": pydobot_suction.DobotPalletizer,
+    "gripper": pydobot_gripper.DobotPalletizer,
+}
+
+JOB_OPERATIONS = {
+    "cycle": "run_complete_cycle",
+    "transfer": "transfer_blocks",
+    "return": "return_blocks",
+}
+
+
+class DaemonError(Exception):
+    pass
+
+
+class DobotDaemon:
+    """Own one Dobot connection and serve it to local clients over a Unix socket
+
+    The protocol is JSON lines: each request is {"op": ..., ...params} and
+    each reply is {"ok": true, ...} or {"ok": false, "error": ...}. Pose and
+    status queries are answered while a palletizing job is running; only
+    one job runs at a time.
+    """
+
+    def __init__(self, device, socket_path=DEFAULT_SOCKET):
+        self.device = device
+        self.socket_path = socket_path
+        self.palletizers = {}
+        self.job_lock = threading.Lock()
+        self.job = None
+        self.started = time.time()
+        self.requests = 0
+        self.server = None
+        self.stopping = False
+
+    def palletizer(self, effector, **options):
+        """Palletizer for an effector, built once and reused for later jobs"""
+        if effector not in PALLETIZERS:
+            raise DaemonError(f"Unknown effector {effector!r}")
+        key = (effector, tuple(sorted(options.items())))
+        if key not in self.palletizers:
+            self.palletizers[key] = PALLETIZERS[effector](device=self.device, verbose=False, **options)
+        return self.palletizers[key]
+
+    def handle(self, request):
+        """Answer one decoded request"""
+        self.requests += 1
+        op = request.get("op")
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise DaemonError(f"Unknown op {op!r}")
+        params = {key: value for key, value in request.items() if key != "op"}
+        return handler(**params)
+
+    def op_ping(self):
+        return {}
+
+    def op_pose(self):
+        pose, joints = self.device.get_pose()
+        return {"pose": list(pose), "joints": list(joints)}
+
+    def op_alarms(self):
+        return {"alarms": sorted(int(alarm) for alarm in self.device.get_alarms())}
+
+    def op_status(self):
+        return {"port": getattr(self.device, "port", None), "job": self.job,
+                "uptime": time.time() - self.started, "requests": self.requests}
+
+    def op_move(self, x, y, z, r=0.0, wait=True):
+        with self.job_lock:
+            index = self.device.move_to(x, y, z, r)
+            if wait:
+                self.device.wait_for_cmd(index)
+        return {"index": index}
+
+    def op_suck(self, enable):
+        with self.job_lock:
+            return {"index": self.device.suck(bool(enable))}
+
+    def op_grip(self, enable):
+        with self.job_lock:
+            return {"index": self.device.grip(bool(enable))}
+
+    def op_job(self, effector="suction", operation="cycle", options=None):
+        if operation not in JOB_OPERATIONS:
+            raise DaemonError(f"Unknown operation {operation!r}")
+        if not self.job_lock.acquire(blocking=False):
+            raise DaemonError(f"Busy running {self.job}")
+        try:
+            self.job = f"{effector} {operation}"
+            palletizer = self.palletizer(effector, **(options or {}))
+            result = getattr(palletizer, JOB_OPERATIONS[operation])()
+            if operation == "transfer":
+                result = {"transferred": result}
+            elif operation == "return":
+                result = {"returned": result}
+            return {"result": result, "counters": dict(palletizer.tracer.counters)}
+        finally:
+            self.job = None
+            self.job_lock.release()
+
+    def op_shutdown(self):
+        # The handler stops the server once this reply has been sent
+        self.stopping = True
+        return {}
+
+    def serve_forever(self):
+        """Listen on the socket until a shutdown request arrives"""
+        if os.path.exists(self.socket_path):
+            try:
+                DobotClient(self.socket_path).ping()
+            except OSError:
+                os.unlink(self.socket_path)  # stale socket from a crashed daemon
+            else:
+                raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        reply = dict(daemon.handle(json.loads(line)), ok=True)
+                    except DaemonError as e:
+                        reply = {"ok": False, "error": str(e)}
+                    except Exception as e:
+                        reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    self.wfile.write(json.dumps(reply).encode() + b"\n")
+                    self.wfile.flush()
+                    if daemon.stopping:
+                        threading.Thread(target=daemon.server.shutdown, daemon=True).start()
+                        return
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        print(f"Dobot daemon listening on {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.device.close()
+            print("Dobot daemon stopped")
+
+
+class DobotClient:
+    """Connection to a running DobotDaemon"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        """timeout -- seconds to wait for a reply (None waits for jobs to finish)"""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.file = self.sock.makefile("rwb")
+
+    def call(self, op, **params):
+        self.file.write(json.dumps(dict(params, op=op)).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise DaemonError("Daemon closed the connection")
+        reply = json.loads(line)
+        if not reply.pop("ok"):
+            raise DaemonError(reply["error"])
+        return reply
+
+    def ping(self):
+        return self.call("ping")
+
+    def get_pose(self):
+        """(position, joints) lists, like Dobot.get_pose()"""
+        reply = self.call("pose")
+        return reply["pose"], reply["joints"]
+
+    def status(self):
+        return self.call("status")
+
+    def move_to(self, x, y, z, r=0.0, wait=True):
+        return self.call("move", x=x, y=y, z=z, r=r, wait=wait)["index"]
+
+    def suck(self, enable):
+        return self.call("suck", enable=enable)["index"]
+
+    def grip(self, enable):
+        return self.call("grip", enable=enable)["index"]
+
+    def run_job(self, effector="suction", operation="cycle", **options):
+        return self.call("job", effector=effector, operation=operation, options=options)
+
+    def shutdown(self):
+        return self.call("shutdown")
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-lived Dobot connection daemon and client")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="open the arm and serve requests")
+    serve.add_argument("--port", default="/dev/ttyACM0")
+    serve.add_argument("--sim", action="store_true", help="serve a simulated Dobot")
+    commands.add_parser("pose", help="print the current pose")
+    commands.add_parser("status", help="print daemon status")
+    commands.add_parser("stop", help="shut the daemon down")
+    job = commands.add_parser("job", help="run a palletizing job")
+    job.add_argument("effector", choices=sorted(PALLETIZERS))
+    job.add_argument("operation", choices=sorted(JOB_OPERATIONS), nargs="?", default="cycle")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        device = SimulatedDobot() if args.sim else Dobot(port=args.port)
+        DobotDaemon(device, args.socket).serve_forever()
+        return None
+
+    with DobotClient(args.socket) as client:
+        if args.command == "pose":
+            reply = client.get_pose()
+            print("Pose:", reply[0])
+        elif args.command == "status":
+            reply = client.status()
+            print(json.dumps(reply, indent=2))
+        elif args.command == "stop":
+            reply = client.shutdown()
+        else:
+            reply = client.run_job(args.effector, args.operation)
+            print(json.dumps(reply, indent=2))
+    return reply
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+import logging
+import math
+import os
+import select
+import struct
+import threading
+import time
+from collections import deque
+from threading import RLock
+
+from pydobot.dobot import Dobot, DobotException, MAX_QUEUE_LEN, MODE_PTP
+from pydobot.message import Message
+
+from kinematics import UnreachableError, inverse_kinematics
+from protocol import PTP_CMD, PTP_PARAMS, FrameParser
+from trajectory import segment_time
+
+HOME_POSE = (300.0, 0.0, 50.0, 0.0)
+
+# Seconds the suction valve / gripper servo takes to switch once commanded
+ACTUATION_TIME = 0.05
+
+# Seconds a block needs after the suction (62) / gripper (63) switched before the
+# arm may move off; leaving sooner counts as a slipped pick or dragged drop
+SETTLE_TIME = {62: 0.15, 63: 0.1}
+
+# Moves within this many mm of where the tool switched (the last mm of an on-the-fly
+# descent, a short lift off a drop) don't disturb a settling block
+SLIP_CLEARANCE = 20.0
+
+# Alarm raised by the controller for an unreachable target (Alarm.PLAN_INV_LIMIT)
+ALARM_INV_LIMIT = 0x12
+
+JOINT_MODES = (MODE_PTP.MOVJ_XYZ, MODE_PTP.JUMP_XYZ)
+
+
+class SimCommand:
+    """One entry in the simulated controller queue"""
+    __slots__ = ("index", "msg_id", "params", "queued_at", "start", "duration", "begin", "target")
+
+    def __init__(self, index, msg_id, params, queued_at):
+        self.index = index
+        self.msg_id = msg_id
+        self.params = params
+        self.queued_at = queued_at
+        self.start = None
+        self.duration = 0.0
+        self.begin = None
+        self.target = None
+
+
+class SimulatedDobot(Dobot):
+    """Drop-in replacement for pydobot.Dobot that simulates the arm
+
+    Every pydobot call ends up in _send_command(), which is answered by a
+    model of the controller: a bounded command queue executed in order,
+    point-to-point moves timed from joint velocity/acceleration limits,
+    and a per-command serial round-trip delay.
+    """
+
+    def __init__(self, port=None, latency=0.002, baudrate=115200, time_scale=1.0,
+                 pose=HOME_POSE, queue_size=MAX_QUEUE_LEN, clock=time.monotonic):
+        """Create a simulated arm
+
+        latency    -- fixed serial round-trip overhead per command in seconds
+        baudrate   -- serial link speed used to time frame transfers
+        time_scale -- simulated seconds per wall-clock second (10 runs 10x faster)
+        pose       -- initial (x, y, z, r) of the end effector
+        queue_size -- capacity of the controller command queue
+        """
+        self.logger = logging.Logger(__name__)
+        self._lock = RLock()
+        self.port = port or "sim"
+        self.latency = latency
+        self.baudrate = baudrate
+        self.time_scale = time_scale
+        self.queue_size = queue_size
+        self._clock = clock
+        self._origin = clock()
+
+        self.position = tuple(pose)
+        self.joints = inverse_kinematics(*pose)
+        self.joint_velocity = [200.0] * 4
+        self.joint_acceleration = [200.0] * 4
+        self.coordinate_velocity = 200.0
+        self.coordinate_acceleration = 200.0
+        self.velocity_ratio = 100.0
+        self.acceleration_ratio = 100.0
+        self.jump_height = 10.0
+        self.jump_limit = 200.0
+        self.suction = False
+        self.gripper = False
+        self.alarms = set()
+        self.settle_time = dict(SETTLE_TIME)
+        self.last_actuation = None
+        self.slips = []
+        self.slip_count = 0
+
+        self.queue = deque()
+        self.executing = True
+        self.stopping = False
+        self.next_index = 1
+        self.current_index = 0
+        self.ready_at = 0.0
+        self.commands_sent = 0
+        self.closed = False
+
+    def now(self):
+        """Current simulated time in seconds"""
+        return (self._clock() - self._origin) * self.time_scale
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+
+    def _send_command(self, msg):
+        with self._lock:
+            reply, delay = self.respond(msg)
+            time.sleep(delay)
+            return reply
+
+    def respond(self, msg):
+        """Answer one request frame; returns (reply, wall-clock seconds the exchange takes)
+
+        Split out of _send_command so non-blocking callers (async_dobot) can
+        wait out the serial delay themselves.
+        """
+        with self._lock:
+            if self.closed:
+                raise DobotException("Simulated device is closed")
+            request = msg.bytes()
+            self.commands_sent += 1
+            self._advance(self.now())
+
+            if msg.ctrl & 0x02:
+                params = self._enqueue(msg)
+            else:
+                params = self._immediate(msg)
+
+            reply = Message()
+            reply.id = msg.id
+            reply.ctrl = msg.ctrl
+            reply.params = bytearray(params)
+
+            transfer = (len(request) + len(reply.bytes())) * 10 / self.baudrate
+            return reply, (self.latency + transfer) / self.time_scale
+
+    def _enqueue(self, msg):
+        if len(self.queue) >= self.queue_size:
+            raise DobotException("Command queue is full")
+        command = SimCommand(self.next_index, msg.id, bytes(msg.params), self.now())
+        self.queue.append(command)
+        self.next_index += 1
+        return struct.pack('<Q', command.index)
+
+    def _immediate(self, msg):
+        if msg.id == 10:
+            x, y, z, r = self._current_position()
+            joints = self.joints
+            try:
+                joints = inverse_kinematics(x, y, z, r)
+            except UnreachableError:
+                pass
+            return struct.pack('<8f', x, y, z, r, *joints)
+        if msg.id == 20:
+            if msg.ctrl & 0x01:
+                self.alarms.clear()
+                return b""
+            bitmap = bytearray(16)
+            for alarm in self.alarms:
+                bitmap[alarm // 8] |= 1 << (alarm % 8)
+            return bytes(bitmap)
+        if msg.id == 246:
+            return struct.pack('<Q', self.current_index)
+        if msg.id == 240:
+            self.executing = True
+            self.stopping = False
+            self.ready_at = self.now()
+        elif msg.id == 241:
+            # The command in progress still runs to completion
+            head = self.queue[0] if self.queue else None
+            if self.executing and head is not None and head.start is not None and head.start <= self.now():
+                self.stopping = True
+            else:
+                self.executing = False
+        elif msg.id == 242:
+            # Force stop: the arm halts where it is and the command in progress is abandoned
+            if self.executing and self.queue:
+                self.position = self._current_position()
+                try:
+                    self.joints = inverse_kinematics(*self.position)
+                except UnreachableError:
+                    pass
+                self.queue[0].start = None  # restarted from scratch if execution resumes
+            self.executing = False
+            self.stopping = False
+        elif msg.id == 245:
+            # A command still finishing after a plain stop is already executing, not queued
+            running = [self.queue[0]] if self.stopping and self.queue else []
+            self.queue = deque(running)
+        return b""
+
+    def move_many(self, points, mode=MODE_PTP.MOVJ_XYZ):
+        """Queue several (x, y, z, r) moves as one batched write; returns their queue indices
+
+        Models fast_dobot.FastDobot.move_many: the frames share one serial
+        round trip, so only the first pays the fixed latency.
+        """
+        with self._lock:
+            indices = []
+            delay = 0.0
+            for x, y, z, r in points:
+                msg = Message()
+                msg.id = PTP_CMD
+                msg.ctrl = 0x03
+                msg.params = bytearray(PTP_PARAMS.pack(mode, x, y, z, r))
+                reply, seconds = self.respond(msg)
+                indices.append(self._extract_cmd_index(reply))
+                delay += seconds if len(indices) == 1 else seconds - self.latency / self.time_scale
+            time.sleep(delay)
+            return indices
+    
+    def take_slips(self):
+        """Queue indices of suck/grip commands the arm moved away from too soon, since the last call"""
+        with self._lock:
+            self._advance(self.now())
+            slips, self.slips = self.slips, []
+            return slips
+
+    def _advance(self, now):
+        """Execute every queued command that has finished by `now`"""
+        while self.executing and self.queue:
+            command = self.queue[0]
+            if command.start is None:
+                self._begin(command, max(self.ready_at, command.queued_at))
+            end = command.start + command.duration
+            if end > now:
+                break
+            self._finish(command)
+            self.current_index = command.index
+            self.ready_at = end
+            self.queue.popleft()
+            if self.stopping:
+                self.executing = False
+                self.stopping = False
+
+    def _begin(self, command, start):
+        command.start = start
+        command.begin = self.position
+        if command.msg_id == 84:
+            mode = command.params[0]
+            target = struct.unpack_from('<4f', command.params, 1)
+            try:
+                inverse_kinematics(*target)
+            except UnreachableError:
+                # The controller rejects the move with an alarm and stays put
+                self.alarms.add(ALARM_INV_LIMIT)
+                return
+            command.target = target
+            command.duration = self._move_time(self.position, target, mode)
+            if self.last_actuation is not None:
+                index, msg_id, settling_since, origin = self.last_actuation
+                if math.dist(target[:3], origin[:3]) > SLIP_CLEARANCE:
+                    if start - settling_since < self.settle_time[msg_id]:
+                        self.slips.append(index)
+                        self.slip_count += 1
+                    self.last_actuation = None
+                elif target[2] < command.begin[2]:
+                    # Still closing onto the block: it only starts settling on contact
+                    self.last_actuation[2] = max(settling_since, start + command.duration)
+        elif command.msg_id in (62, 63):
+            command.duration = ACTUATION_TIME
+        elif command.msg_id == 110:
+            command.duration = struct.unpack_from('<I', command.params, 0)[0] / 1000.0
+
+    def _finish(self, command):
+        params = command.params
+        if command.target is not None:
+            self.position = command.target
+            self.joints = inverse_kinematics(*command.target)
+        elif command.msg_id in (62, 63):
+            attr = "suction" if command.msg_id == 62 else "gripper"
+            # Switching to the state the tool is already in leaves nothing to settle
+            if getattr(self, attr) != bool(params[1]):
+                self.last_actuation = [command.index, command.msg_id, command.start + command.duration,
+                                       self.position]
+            setattr(self, attr, bool(params[1]))
+        elif command.msg_id == 80:
+            values = struct.unpack_from('<8f', params, 0)
+            self.joint_velocity = list(values[:4])
+            self.joint_acceleration = list(values[4:])
+        elif command.msg_id == 81:
+            self.coordinate_velocity, _, self.coordinate_acceleration, _ = struct.unpack_from('<4f', params, 0)
+        elif command.msg_id == 82:
+            self.jump_height, self.jump_limit = struct.unpack_from('<2f', params, 0)
+        elif command.msg_id == 83:
+            self.velocity_ratio, self.acceleration_ratio = struct.unpack_from('<2f', params, 0)
+
+    def _current_position(self):
+        """Commanded position interpolated through any move in progress"""
+        if self.queue and self.executing:
+            command = self.queue[0]
+            if command.target is not None and command.duration > 0:
+                fraction = (self.now() - command.start) / command.duration
+                if 0 < fraction < 1:
+                    return tuple(a + (b - a) * fraction for a, b in zip(command.begin, command.target))
+        return self.position
+
+    def _joint_time(self, start, end):
+        """Synchronised joint-space move time, limited by the slowest joint"""
+        ratio_v = self.velocity_ratio / 100.0
+        ratio_a = self.acceleration_ratio / 100.0
+        a = inverse_kinematics(*start)
+        b = inverse_kinematics(*end)
+        return max(segment_time(abs(b[i] - a[i]),
+                                self.joint_velocity[i] * ratio_v,
+                                self.joint_acceleration[i] * ratio_a) for i in range(4))
+
+    def _linear_time(self, distance):
+        return segment_time(distance,
+                            self.coordinate_velocity * self.velocity_ratio / 100.0,
+                            self.coordinate_acceleration * self.acceleration_ratio / 100.0)
+
+    def _move_time(self, start, target, mode):
+        if mode == MODE_PTP.JUMP_XYZ:
+            peak = max(min(start[2] + self.jump_height, self.jump_limit), start[2], target[2])
+            top_start = (start[0], start[1], peak, start[3])
+            top_end = (target[0], target[1], peak, target[3])
+            return (self._linear_time(peak - start[2]) +
+                    self._joint_time(top_start, top_end) +
+                    self._linear_time(peak - target[2]))
+        if mode in JOINT_MODES:
+            return self._joint_time(start, target)
+        distance = sum((b - a) ** 2 for a, b in zip(start[:3], target[:3])) ** 0.5
+        return self._linear_time(distance)
+
+
+class SimulatedSerialPort:
+    """Serve a SimulatedDobot on a pseudo-terminal (POSIX only)
+
+    `name` is a real tty path, so unmodified serial code - pydobot.Dobot,
+    fast_dobot.FastDobot, async_dobot's SerialTransport - talks to the
+    simulator through the same frames and syscalls as to the arm. Replies
+    are held back by the simulator's serial delay unless realtime is False.
+    """
+
+    def __init__(self, sim=None, realtime=True):
+        import tty  # POSIX only; keeps the simulator importable on Windows
+        self.sim = sim or SimulatedDobot()
+        self.realtime = realtime
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.parser = FrameParser()
+        self.requests = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name="sim-serial", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return  # pty closed
+            for msg in self.parser.feed(data):
+                self.requests += 1
+                try:
+                    reply, delay = self.sim.respond(msg)
+                except DobotException:
+                    continue  # no reply, like a controller rejecting the frame
+                if self.realtime:
+                    time.sleep(delay)
+                os.write(self.master, reply.bytes())
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
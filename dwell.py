@@ -0,0 +1,96 @@
+import json
+import os
+
+# Learned dwells, keyed by effector/layout scope, block number and action
+CACHE_PATH = os.path.expanduser("~/.cache/dobot_dwell.json")
+
+GRAB = "grab"
+RELEASE = "release"
+
+
+class AdaptiveDwell:
+    """Learn the shortest reliable grab/release dwell per effector, block and action
+
+    Each entry starts at the effector's declared dwell. After `confirm`
+    successes in a row the dwell shrinks by `step`; a failure raises the
+    entry's floor to the failing dwell plus `margin` and backs the dwell
+    off by `backoff`, so the dwell settles just above the shortest value
+    seen to fail. Entries are saved as JSON so later runs start where the
+    last one left off.
+    """
+
+    def __init__(self, path=CACHE_PATH, confirm=3, step=0.15, margin=0.25, backoff=2.0,
+                 minimum=0.02, maximum=3.0):
+        """Load learned values from `path` (None keeps them in memory only)
+
+        confirm -- successes needed before each decrease
+        step    -- fraction the dwell shrinks by after `confirm` successes
+        margin  -- fraction added to a failing dwell to form the new floor
+        backoff -- factor the dwell grows by after a failure
+        minimum -- absolute lower bound in seconds
+        maximum -- absolute upper bound in seconds
+        """
+        self.path = path
+        self.confirm = confirm
+        self.step = step
+        self.margin = margin
+        self.backoff = backoff
+        self.minimum = minimum
+        self.maximum = maximum
+        self.entries = {}
+        self.dirty = False
+        if path:
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def _entry(self, scope, block, action, default):
+        blocks = self.entries.setdefault(scope, {})
+        actions = blocks.setdefault(str(block), {})
+        if action not in actions:
+            actions[action] = {"dwell": default, "floor": 0.0, "streak": 0, "failures": 0}
+        return actions[action]
+
+    def dwell(self, scope, block, action, default, floor=0.0):
+        """Seconds to wait after `action` on `block`
+
+        default -- starting dwell for an unseen entry
+        floor   -- lower bound imposed by the caller (e.g. the tool's switching latency)
+        """
+        entry = self._entry(scope, block, action, default)
+        return min(self.maximum, max(entry["dwell"], entry["floor"], floor, self.minimum))
+
+    def report(self, scope, block, action, ok, default):
+        """Feed back whether the block survived `action` with its current dwell"""
+        entry = self._entry(scope, block, action, default)
+        if ok:
+            entry["streak"] += 1
+            if entry["streak"] >= self.confirm:
+                entry["streak"] = 0
+                entry["dwell"] = max(entry["floor"], self.minimum, entry["dwell"] * (1.0 - self.step))
+        else:
+            entry["failures"] += 1
+            entry["streak"] = 0
+            entry["floor"] = min(self.maximum, max(entry["floor"], entry["dwell"] * (1.0 + self.margin)))
+            entry["dwell"] = min(self.maximum, max(entry["floor"], entry["dwell"] * self.backoff))
+        self.dirty = True
+
+    def learned(self, scope):
+        """{block: {action: dwell}} for one scope"""
+        return {block: {action: entry["dwell"] for action, entry in actions.items()}
+                for block, actions in self.entries.get(scope, {}).items()}
+
+    def save(self):
+        """Write the learned values if anything changed"""
+        if not self.path or not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
+        except OSError:
+            pass  # learning is only an optimisation
@@ -0,0 +1,80 @@
+class EndEffector:
+    """Driver for one end effector: how to switch it and how long to wait for it
+
+    The dwell queued after each grab or release is latency + settle:
+    latency is the time from the I/O command until the tool has actually
+    engaged or let go, settle the extra time the block needs before the
+    arm may move off. The defaults add up to the 2 s the original scripts
+    slept after each suck/grip; shorten them only from measurements on the
+    arm (a pick_check with dwell.AdaptiveDwell, or a fixed actuation_dwell).
+    """
+
+    name = None
+    label = None
+    # Message id of the tool's queued I/O command
+    command = None
+    # Whether per-position "r" values turn the tool (otherwise the palletizer rotation is used)
+    block_rotation = False
+
+    def __init__(self, latency=0.3, settle=1.7):
+        self.latency = latency
+        self.settle = settle
+
+    @property
+    def dwell(self):
+        """Seconds to wait after each grab or release"""
+        return self.latency + self.settle
+
+    def actuate(self, device, enable):
+        """Queue the on/off command on a pydobot-compatible device; returns its queue index"""
+        raise NotImplementedError
+
+    def pose(self, pos, rotation):
+        """(x, y, z, r) the tool is commanded to for a block position dict"""
+        if self.block_rotation:
+            return (pos["x"], pos["y"], pos["z"], pos.get("r", rotation))
+        return (pos["x"], pos["y"], pos["z"], rotation)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(latency={self.latency}, settle={self.settle})"
+
+
+class SuctionCup(EndEffector):
+    """Vacuum cup: the pump needs time to build (or vent) vacuum; the cup ignores block rotation"""
+
+    name = "suction"
+    label = "Suction"
+    command = 62
+
+    def __init__(self, latency=0.3, settle=1.7):
+        super().__init__(latency, settle)
+
+    def actuate(self, device, enable):
+        return device.suck(enable)
+
+
+class Gripper(EndEffector):
+    """Servo jaws: most of the wait is jaw travel; the jaws are turned to each position's r"""
+
+    name = "gripper"
+    label = "Grip"
+    command = 63
+    block_rotation = True
+
+    def __init__(self, latency=0.35, settle=1.65):
+        super().__init__(latency, settle)
+
+    def actuate(self, device, enable):
+        return device.grip(enable)
+
+
+EFFECTORS = {effector.name: effector for effector in (SuctionCup, Gripper)}
+
+
+def make_effector(effector):
+    """EndEffector instance from a name ("suction", "gripper") or an existing driver"""
+    if isinstance(effector, EndEffector):
+        return effector
+    if effector not in EFFECTORS:
+        raise ValueError(f"Unknown end effector {effector!r}, expected one of {', '.join(EFFECTORS)}")
+    return EFFECTORS[effector]()
@@ -0,0 +1,157 @@
+import argparse
+import time
+
+from pydobot.dobot import Dobot, DobotException, Joints, MODE_PTP, Pose, Position
+from pydobot.message import Message
+
+from protocol import (CTRL_QUEUED, CTRL_READ, GET_POSE, GRIPPER, INDEX_REPLY, MAX_BATCH, POSE_REPLY,
+                      PTP_CMD, PTP_PARAMS, QUEUED_CMD_INDEX, SUCTION_CUP, TOOL_PARAMS, FrameReader,
+                      FrameWriter)
+
+
+class FastDobot(Dobot):
+    """pydobot.Dobot with a lean serial path for the commands a run repeats
+
+    move_to, suck, grip, get_pose and the queue index poll pack their
+    frames straight into a preallocated buffer and parse replies through
+    a memoryview, with no Message objects and no input flush per call.
+    move_many() writes several moves in one write() and then collects
+    their replies. Every other command keeps pydobot's implementation,
+    routed through the same buffers by _send_command().
+    """
+
+    def __init__(self, port=None, timeout=1.0):
+        """Open the port like pydobot.Dobot
+
+        timeout -- seconds to wait for each reply (pydobot waits forever)
+        """
+        self.timeout = timeout
+        self.writer = FrameWriter()
+        self.reader = None
+        super().__init__(port)
+
+    def _exchange(self, msg_id):
+        """Write every pending frame at once and return the params of the reply to `msg_id`"""
+        with self._lock:
+            if self.reader is None:
+                self._ser.timeout = self.timeout
+                self.reader = FrameReader(self._ser)
+            self._ser.write(self.writer.take())
+            try:
+                return self.reader.read_reply(msg_id)
+            except TimeoutError:
+                # A late reply could be mistaken for the next request's: start clean
+                self._ser.reset_input_buffer()
+                raise DobotException("No response!") from None
+
+    def _queued(self, msg_id):
+        return INDEX_REPLY.unpack_from(self._exchange(msg_id))[0]
+
+    def _send_command(self, msg):
+        with self._lock:
+            self.writer.add_params(msg.id, msg.ctrl, msg.params)
+            params = self._exchange(msg.id)
+            reply = bytearray(b"\xaa\xaa")
+            reply.extend((2 + len(params), msg.id, msg.ctrl))
+            reply.extend(params)
+            reply.append(0)
+            return Message(reply)
+
+    def move_to(self, x, y, z, r=0., mode=MODE_PTP.MOVJ_XYZ):
+        with self._lock:
+            self.writer.add(PTP_CMD, CTRL_QUEUED, PTP_PARAMS, mode, x, y, z, r)
+            return self._queued(PTP_CMD)
+
+    def move_many(self, points, mode=MODE_PTP.MOVJ_XYZ):
+        """Queue several (x, y, z, r) moves, MAX_BATCH frames per write; returns their queue indices"""
+        indices = []
+        points = list(points)
+        with self._lock:
+            for start in range(0, len(points), MAX_BATCH):
+                batch = points[start:start + MAX_BATCH]
+                for x, y, z, r in batch:
+                    self.writer.add(PTP_CMD, CTRL_QUEUED, PTP_PARAMS, mode, x, y, z, r)
+                indices.append(self._queued(PTP_CMD))
+                for _ in batch[1:]:
+                    indices.append(INDEX_REPLY.unpack_from(self.reader.read_reply(PTP_CMD))[0])
+        return indices
+
+    def suck(self, enable):
+        with self._lock:
+            self.writer.add(SUCTION_CUP, CTRL_QUEUED, TOOL_PARAMS, 1, 1 if enable else 0)
+            return self._queued(SUCTION_CUP)
+
+    def grip(self, enable):
+        with self._lock:
+            self.writer.add(GRIPPER, CTRL_QUEUED, TOOL_PARAMS, 1, 1 if enable else 0)
+            return self._queued(GRIPPER)
+
+    def get_pose(self):
+        with self._lock:
+            self.writer.add(GET_POSE, CTRL_READ)
+            values = POSE_REPLY.unpack_from(self._exchange(GET_POSE))
+        return Pose(Position(*values[:4]), Joints(*values[4:]))
+
+    def _get_queued_cmd_current_index(self):
+        with self._lock:
+            self.writer.add(QUEUED_CMD_INDEX, CTRL_READ)
+            return self._queued(QUEUED_CMD_INDEX)
+
+
+def command_rate(device, count):
+    """Commands per second for each hot command on a connected device"""
+    x, y, z, r = 300.0, 0.0, 50.0, 0.0
+    tests = {
+        "move_to": lambda: device.move_to(x, y, z, r),
+        "suck": lambda: device.suck(False),
+        "get_pose": device.get_pose,
+        "queue_index": device._get_queued_cmd_current_index,
+    }
+    if hasattr(device, "move_many"):
+        tests[f"move_many x{MAX_BATCH}"] = lambda: device.move_many([(x, y, z, r)] * MAX_BATCH)
+    rates = {}
+    for name, call in tests.items():
+        commands = MAX_BATCH if name.startswith("move_many") else 1
+        start = time.perf_counter()
+        for _ in range(count):
+            call()
+        rates[name] = count * commands / (time.perf_counter() - start)
+        # Keep the controller queue from filling up between tests
+        device._set_queued_cmd_clear()
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pydobot's serial path with FastDobot's")
+    parser.add_argument("--port", help="benchmark a real Dobot on this port (default: simulator on a pty)")
+    parser.add_argument("--count", type=int, default=300, help="calls per command")
+    args = parser.parse_args(argv)
+
+    server = None
+    port = args.port
+    if port is None:
+        from dobot_sim import SimulatedDobot, SimulatedSerialPort
+        # Host-side overhead only: instant replies and a controller that never falls behind
+        server = SimulatedSerialPort(SimulatedDobot(latency=0.0, time_scale=1e6), realtime=False)
+        port = server.name
+    try:
+        results = {}
+        for name, cls in (("pydobot", Dobot), ("fast", FastDobot)):
+            device = cls(port=port)
+            try:
+                results[name] = command_rate(device, args.count)
+            finally:
+                device.close()
+    finally:
+        if server is not None:
+            server.close()
+
+    print(f"{'command':<16}{'pydobot/s':>12}{'fast/s':>12}{'speed-up':>10}")
+    for command, rate in results["fast"].items():
+        base = results["pydobot"].get(command, results["pydobot"]["move_to"])
+        print(f"{command:<16}{base:>12.0f}{rate:>12.0f}{rate / base:>9.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
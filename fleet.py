@@ -0,0 +1,296 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pydobot_gripper
+import pydobot_suction
+from dobot_sim import SimulatedDobot
+from pallet import PalletLayout
+from pydobot_port import locate_dobots
+
+EFFECTORS = {
+    "suction": (pydobot_suction.DobotPalletizer, pydobot_suction.BLOCKS),
+    "gripper": (pydobot_gripper.DobotPalletizer, pydobot_gripper.BLOCKS),
+}
+
+OPERATIONS = ("transfer", "return", "cycle")
+
+
+class CollisionZone:
+    """Axis-aligned region of the shared workspace (world frame, mm) only one arm may work in
+
+    Ownership is managed by FleetController under its scheduling lock.
+    """
+
+    def __init__(self, name, xmin, ymin, xmax, ymax):
+        self.name = name
+        self.bounds = (xmin, ymin, xmax, ymax)
+        self.owner = None
+        self.claims = 0
+
+    def overlaps(self, box):
+        xmin, ymin, xmax, ymax = self.bounds
+        return box[0] <= xmax and box[2] >= xmin and box[1] <= ymax and box[3] >= ymin
+
+
+class PalletJob:
+    """A transfer, return or full cycle over a pallet layout, optionally pinned to one arm"""
+
+    def __init__(self, name, blocks, operation="cycle", arm=None):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation {operation!r}, expected one of {OPERATIONS}")
+        self.name = name
+        self.blocks = blocks if isinstance(blocks, PalletLayout) else PalletLayout.from_blocks(blocks)
+        self.operation = operation
+        self.arm = arm
+        self.result = None
+
+    def footprint(self, offset=(0.0, 0.0), margin=0.0):
+        """World-frame bounding box (xmin, ymin, xmax, ymax) of every pick/drop point
+
+        Moves run in straight lines between these points, so the box also
+        covers the traverses between them.
+        """
+        xs = []
+        ys = []
+        for pick, drop in self.blocks.poses():
+            for x, y in (pick[:2], drop[:2]):
+                xs.append(x + offset[0])
+                ys.append(y + offset[1])
+        return (min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+
+class FleetArm:
+    """One arm of the fleet: a DobotPalletizer plus its placement in the shared workspace"""
+
+    def __init__(self, name, port=None, effector="suction", offset=(0.0, 0.0), device=None, **options):
+        """Connect a palletizer for this arm
+
+        port    -- serial port (ignored when device is given)
+        offset  -- (x, y) of the arm base in the shared world frame, in mm
+        options -- extra DobotPalletizer keyword arguments
+        """
+        palletizer_cls, _ = EFFECTORS[effector]
+        self.name = name
+        self.effector = effector
+        self.offset = offset
+        kwargs = dict(options, device=device)
+        if port:
+            kwargs["port"] = port
+        kwargs.setdefault("verbose", False)
+        self.palletizer = palletizer_cls(**kwargs)
+        self.jobs = 0
+        self.blocks = 0
+        self.busy_time = 0.0
+        self.zone_wait = 0.0
+
+    def run(self, job):
+        """Run one job on this arm and return the number of blocks moved"""
+        palletizer = self.palletizer
+        palletizer.set_layout(job.blocks)
+        if job.operation == "transfer":
+            moved = palletizer.transfer_blocks()
+        elif job.operation == "return":
+            moved = palletizer.return_blocks()
+        else:
+            moved = palletizer.transfer_blocks()
+            if moved:
+                moved += palletizer.return_blocks()
+        return moved
+
+    def disconnect(self):
+        self.palletizer.disconnect()
+
+
+class FleetController:
+    """Schedule pallet jobs across several arms, one worker thread per arm"""
+
+    def __init__(self, arms, zones=(), margin=20.0):
+        """Create a controller
+
+        zones  -- CollisionZone objects shared between the arms
+        margin -- mm added around a job's footprint (tool and block size)
+        """
+        self.arms = list(arms)
+        self.zones = list(zones)
+        self.margin = margin
+        self.pending = []
+        self.completed = []
+        self.condition = threading.Condition()
+        self.output_lock = threading.Lock()
+        self.elapsed = 0.0
+
+    def submit(self, job):
+        with self.condition:
+            if job.arm is not None and job.arm not in {arm.name for arm in self.arms}:
+                raise ValueError(f"Job {job.name} is pinned to unknown arm {job.arm}")
+            self.pending.append(job)
+            self.condition.notify_all()
+        return job
+
+    def log(self, message):
+        with self.output_lock:
+            print(message)
+
+    def zones_for(self, job, arm):
+        """Collision zones a job on `arm` passes through"""
+        box = job.footprint(arm.offset, self.margin)
+        return [zone for zone in self.zones if zone.overlaps(box)]
+
+    def _next_job(self, arm):
+        """Claim the first job this arm can run whose zones are all free
+
+        Zones are claimed together under the scheduling lock, so arms never
+        deadlock on each other and an arm blocked on one zone picks up any
+        other runnable job first. Returns (job, zones), or (None, None) once
+        nothing is left for this arm.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            while True:
+                eligible = [job for job in self.pending if job.arm in (None, arm.name)]
+                if not eligible:
+                    return None, None
+                for job in eligible:
+                    zones = self.zones_for(job, arm)
+                    if all(zone.owner is None for zone in zones):
+                        self.pending.remove(job)
+                        for zone in zones:
+                            zone.owner = arm.name
+                            zone.claims += 1
+                        arm.zone_wait += time.perf_counter() - start
+                        return job, zones
+                self.condition.wait()
+
+    def _release(self, zones):
+        with self.condition:
+            for zone in zones:
+                zone.owner = None
+            self.condition.notify_all()
+
+    def _work(self, arm):
+        while True:
+            job, zones = self._next_job(arm)
+            if job is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.log(f"[{arm.name}] {job.name}: {job.operation} of {len(job.blocks)} blocks"
+                         + (f" (holding {', '.join(zone.name for zone in zones)})" if zones else ""))
+                moved = arm.run(job)
+                error = None
+            except Exception as e:
+                moved = 0
+                error = str(e)
+            finally:
+                self._release(zones)
+            duration = time.perf_counter() - start
+            arm.jobs += 1
+            arm.blocks += moved
+            arm.busy_time += duration
+            job.result = {"arm": arm.name, "blocks": moved, "time": duration, "error": error}
+            self.log(f"[{arm.name}] {job.name}: {moved} blocks in {duration:.2f}s"
+                     + (f" - error: {error}" if error else ""))
+            with self.condition:
+                self.completed.append(job)
+                self.condition.notify_all()
+
+    def run(self):
+        """Run every submitted job to completion and return the aggregate stats"""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.arms), thread_name_prefix="arm") as pool:
+            for future in [pool.submit(self._work, arm) for arm in self.arms]:
+                future.result()
+        self.elapsed = time.perf_counter() - start
+        return self.stats()
+
+    def stats(self):
+        """Throughput and utilisation per arm and for the whole fleet"""
+        blocks = sum(arm.blocks for arm in self.arms)
+        elapsed = self.elapsed or 1e-9
+        return {
+            "elapsed": self.elapsed,
+            "jobs": len(self.completed),
+            "failed_jobs": sum(1 for job in self.completed if job.result["error"]),
+            "blocks": blocks,
+            "blocks_per_minute": blocks * 60.0 / elapsed,
+            "arms": {arm.name: {
+                "jobs": arm.jobs,
+                "blocks": arm.blocks,
+                "blocks_per_minute": arm.blocks * 60.0 / elapsed,
+                "utilisation": arm.busy_time / elapsed,
+                "zone_wait": arm.zone_wait,
+            } for arm in self.arms},
+            "zones": {zone.name: {"claims": zone.claims} for zone in self.zones},
+        }
+
+    def disconnect(self):
+        for arm in self.arms:
+            arm.disconnect()
+
+
+def discover_arms(effector="suction", spacing=0.0, **options):
+    """Build a FleetArm for every port that answers as a Dobot"""
+    return [FleetArm(f"arm{i + 1}", port=device, effector=effector, offset=(0.0, spacing * i), **options)
+            for i, device in enumerate(locate_dobots(all_ports=True))]
+
+
+def simulated_arms(count, effector="suction", spacing=0.0, time_scale=1.0, **options):
+    """Build `count` FleetArms on simulated Dobots, `spacing` mm apart along y"""
+    return [FleetArm(f"sim{i + 1}", effector=effector, offset=(0.0, spacing * i),
+                     device=SimulatedDobot(time_scale=time_scale), **options)
+            for i in range(count)]
+
+
+def print_stats(stats):
+    print(f"\n=== FLEET RESULTS ===")
+    print(f"Jobs: {stats['jobs']} ({stats['failed_jobs']} failed)  Blocks: {stats['blocks']}  "
+          f"Time: {stats['elapsed']:.2f}s  ({stats['blocks_per_minute']:.1f} blocks/min)")
+    for name, arm in stats["arms"].items():
+        print(f"  {name}: {arm['jobs']} jobs, {arm['blocks']} blocks, "
+              f"{arm['blocks_per_minute']:.1f} blocks/min, {arm['utilisation']:.0%} busy, "
+              f"{arm['zone_wait']:.2f}s waiting for zones")
+
+
+def parse_zone(text):
+    name, _, bounds = text.rpartition("=")
+    values = [float(v) for v in bounds.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("zone must be [name=]xmin,ymin,xmax,ymax")
+    return CollisionZone(name or bounds, *values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run pallet jobs across several Dobots")
+    parser.add_argument("--effector", choices=sorted(EFFECTORS), default="suction")
+    parser.add_argument("--sim", type=int, metavar="N", help="use N simulated arms instead of discovering hardware")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="simulator speed-up factor")
+    parser.add_argument("--spacing", type=float, default=0.0, help="mm between neighbouring arm bases (along y)")
+    parser.add_argument("--zone", type=parse_zone, action="append", default=[],
+                        help="shared collision zone as [name=]xmin,ymin,xmax,ymax in world mm")
+    parser.add_argument("--jobs", type=int, default=1, help="cycle jobs per arm")
+    args = parser.parse_args(argv)
+
+    if args.sim:
+        arms = simulated_arms(args.sim, args.effector, args.spacing, args.time_scale)
+    else:
+        arms = discover_arms(args.effector, args.spacing)
+    if not arms:
+        print("No Dobots found")
+        return None
+
+    controller = FleetController(arms, args.zone)
+    blocks = EFFECTORS[args.effector][1]
+    for i in range(args.jobs * len(arms)):
+        controller.submit(PalletJob(f"job{i + 1}", blocks))
+    try:
+        stats = controller.run()
+        print_stats(stats)
+        return stats
+    finally:
+        controller.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,79 @@
 from serial.tools import list_ports
 from pydobot import Dobot
+import argparse
 import time
 
+from dobot_daemon import DEFAULT_SOCKET, DobotClient
+from dobot_sim import SimulatedDobot
+from telemetry import PoseSampler
+
 #Pick the first port automatically (or manually select from printed list)
 
-# Connect Dobot
-device = Dobot(port="/dev/ttyACM0")
+def connect(port="/dev/ttyACM0", sim=False, daemon=None):
+    """Connect to a Dobot, a simulated one when sim is set, or a running dobot_daemon socket"""
+    if daemon:
+        return DobotClient(daemon)
+    if sim:
+        return SimulatedDobot(port=port)
+    return Dobot(port=port)
+
+def stream(device, rate=None, duration=5.0, log_path=None):
+    """Sample the pose on a background thread, printing the latest sample once a second"""
+    with PoseSampler(device, rate=rate, log_path=log_path) as sampler:
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            time.sleep(min(1.0, max(end - time.monotonic(), 0)))
+            sample = sampler.latest()
+            if sample:
+                print(f"  t={sample[0]:.3f} x={sample[1]:.2f} y={sample[2]:.2f} z={sample[3]:.2f} r={sample[4]:.2f}")
+    print(f"Streamed {sampler.ring.count} samples ({sampler.achieved_rate:.0f} Hz, {sampler.errors} errors)")
+    return sampler
+
+def main(device=None, argv=None):
+    """Print the current pose of a connected (or injected) Dobot"""
+    parser = argparse.ArgumentParser(description="Read the current Dobot pose")
+    parser.add_argument("--port", default="/dev/ttyACM0")
+    parser.add_argument("--sim", action="store_true", help="use the simulated Dobot")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_SOCKET, metavar="SOCKET",
+                        help="ask a running dobot_daemon instead of opening the port")
+    parser.add_argument("--stream", action="store_true", help="stream pose telemetry instead of one reading")
+    parser.add_argument("--rate", type=float, default=0, help="samples per second when streaming (0 = as fast as possible)")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to stream for")
+    parser.add_argument("--log", help="binary pose log (memory-mapped) to write while streaming")
+    args = parser.parse_args(argv)
+
+    # Connect Dobot
+    if device is None:
+        device = connect(args.port, args.sim, args.daemon)
+
+    if device:
+
+        try:
+            print("Dobot connected successfully!")
 
-if device:
+            if args.stream:
+                stream(device, args.rate or None, args.duration, args.log)
 
-    try:
-        print("Dobot connected successfully!")
+            # Get pose
+            pose, joints = device.get_pose()
+            print("Pose:", pose)
 
-        # Get pose
-        pose, joints = device.get_pose()
-        print("Pose:", pose)
+            # Move test
+            # device.move_to(x + 20, y, z, r)
+            # time.sleep(2)
+            # device.move_to(x, y, z, r)
 
-        # Move test
-        # device.move_to(x + 20, y, z, r)
-        # time.sleep(2)
-        # device.move_to(x, y, z, r)
+            device.close()
 
-        device.close()
+        except Exception as e:
+            print(e)
+            device.close()
 
-    except Exception as e:
-        print(e)
-        device.close()
+        # finally:
+        #      device.close()
 
-    # finally:
-    #      device.close()
+    else:
+        print("Could not connect to Dobot")
 
-else:
-    print("Could not connect to Dobot")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Device methods traced by InstrumentedDevice (everything that talks to the arm)
+DEVICE_COMMANDS = frozenset([
+    "move_to", "move_many", "suck", "grip", "get_pose", "get_alarms", "clear_alarms", "wait_for_cmd",
+    "speed", "home", "close", "_send_command", "_get_queued_cmd_current_index",
+    "_set_ptp_jump_params", "_set_ptp_common_params", "_set_ptp_coordinate_params", "_set_ptp_joint_params",
+    "_set_queued_cmd_start_exec", "_set_queued_cmd_stop_exec", "_set_queued_cmd_clear",
+])
+
+
+class RingBufferSink:
+    """Keep the most recent records in memory"""
+
+    def __init__(self, capacity=10000):
+        self.buffer = deque(maxlen=capacity)
+
+    def write(self, record):
+        self.buffer.append(record)
+
+    def records(self):
+        return list(self.buffer)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """Append records to a JSON-lines file, writing in batches"""
+
+    def __init__(self, path, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+        self.file = open(path, "a")
+
+    def write(self, record):
+        with self.lock:
+            self.pending.append(json.dumps(record, default=str))
+            if len(self.pending) >= self.batch_size:
+                self._write_pending()
+
+    def _write_pending(self):
+        if self.pending:
+            self.file.write("\n".join(self.pending) + "\n")
+            self.pending = []
+
+    def flush(self):
+        with self.lock:
+            self._write_pending()
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class LoggingSink:
+    """Forward records to a standard library logger"""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger("dobot")
+        self.level = level
+
+    def write(self, record):
+        if record["type"] == "event":
+            self.logger.info(record["name"])
+        elif self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s %s %s", record["type"], record["name"],
+                            record.get("dur", record.get("value", "")))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConsoleSink:
+    """Print event messages from a background thread so callers never block on the console"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="console-sink", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            if message is not None:
+                print(message, flush=True)
+            self.queue.task_done()
+            if message is None:
+                return
+
+    def write(self, record):
+        if record["type"] == "event":
+            self.queue.put(record["name"])
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+
+class Tracer:
+    """Timed spans, counters and log events fanned out to pluggable sinks"""
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+        return sink
+
+    def emit(self, record):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def _record(self, kind, name, **fields):
+        fields.update(type=kind, name=name, ts=time.perf_counter_ns() / 1000.0,
+                      pid=self.pid, tid=threading.get_ident())
+        return fields
+
+    @contextmanager
+    def span(self, name, **args):
+        """Time the enclosed block; exceptions are counted as `<name>.errors`"""
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        except Exception as e:
+            args["error"] = repr(e)
+            self.count(f"{name}.errors")
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            self.emit({"type": "span", "name": name, "ts": start / 1000.0, "dur": (end - start) / 1000.0,
+                       "pid": self.pid, "tid": threading.get_ident(), "args": args})
+
+    def count(self, name, n=1):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[name] += n
+            value = self.counters[name]
+        self.emit(self._record("counter", name, value=value))
+
+    def event(self, message, **args):
+        """Record a log message (printed by a ConsoleSink if one is attached)"""
+        self.emit(self._record("event", message, args=args))
+
+    def records(self):
+        """Records held by the first in-memory ring buffer sink"""
+        for sink in self.sinks:
+            if isinstance(sink, RingBufferSink):
+                return sink.records()
+        return []
+
+    def export_chrome_trace(self, path, records=None):
+        """Write records in the Chrome trace-event format (chrome://tracing, Perfetto)"""
+        with open(path, "w") as f:
+            json.dump(chrome_trace(self.records() if records is None else records), f)
+        return path
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def chrome_trace(records):
+    """Convert tracer records to a Chrome trace-event dict"""
+    events = []
+    for record in records:
+        base = {"name": record["name"], "ts": record["ts"], "pid": record["pid"], "tid": record["tid"]}
+        if record["type"] == "span":
+            events.append(dict(base, ph="X", dur=record["dur"], cat="device", args=record["args"]))
+        elif record["type"] == "counter":
+            events.append(dict(base, ph="C", args={"value": record["value"]}))
+        else:
+            events.append(dict(base, ph="i", s="t", args=record.get("args", {})))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class InstrumentedDevice:
+    """Proxy around a Dobot device that wraps every command in a tracer span"""
+
+    def __init__(self, device, tracer):
+        self._device = device
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        attr = getattr(self._device, name)
+        if name not in DEVICE_COMMANDS or not callable(attr):
+            return attr
+        tracer = self._tracer
+
+        def traced(*args, **kwargs):
+            with tracer.span(f"device.{name.lstrip('_')}"):
+                return attr(*args, **kwargs)
+        return traced
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from dobot_sim import SimulatedDobot
+from effectors import EFFECTORS, make_effector
+from kinematics import inverse_kinematics_batch
+from ordering import BlockOrderer
+from pallet import GridPattern, PalletLayout
+from palletizer import Palletizer
+from speed import SpeedProfiles
+from trajectory import TrajectoryPlan, plan_moves
+from workspace import HeightMap
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Compiled plans, one JSON file per job file hash
+CACHE_DIR = os.path.expanduser("~/.cache/dobot_plans")
+
+# Bump when the compiled format or the planner changes, so old cache entries are ignored
+PLAN_FORMAT = 4
+
+PASSES = ("transfer", "return")
+
+# Job file [motion] keys: DobotPalletizer keyword -> (accepted types, default)
+MOTION_PARAMS = {
+    "safe_height": ((int, float), 50),
+    "rotation": ((int, float), 0),
+    "tolerance": ((int, float), 0.5),
+    "timeout": ((int, float), 15.0),
+    "actuation_dwell": ((int, float, type(None)), None),
+    "pipelined": (bool, True),
+    "clearance": ((int, float, type(None)), None),
+    "jump": (bool, False),
+    "ordering": (bool, False),
+    "on_the_fly": ((int, float, type(None)), None),
+    "workspace": (bool, False),
+    "speed_profiles": (bool, False),
+}
+
+GRID_KEYS = {"origin", "pitch", "rows", "cols", "layers", "layer_height", "rotation"}
+
+
+class JobFileError(ValueError):
+    pass
+
+
+def read_job_file(path):
+    """Parse a .toml or .json job file into a dict"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise JobFileError(f"{path}: reading TOML needs Python 3.11+ or the tomli package")
+        try:
+            return tomllib.loads(data.decode())
+        except tomllib.TOMLDecodeError as e:
+            raise JobFileError(f"{path}: {e}") from None
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise JobFileError(f"{path}: {e}") from None
+
+
+def _check_keys(where, table, allowed):
+    unknown = set(table) - set(allowed)
+    if unknown:
+        raise JobFileError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+
+
+def _number(where, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise JobFileError(f"{where}: expected a number, got {value!r}")
+    return float(value)
+
+
+def _position(where, pos):
+    if not isinstance(pos, dict):
+        raise JobFileError(f"{where}: expected a table with x, y, z")
+    _check_keys(where, pos, ("x", "y", "z", "r"))
+    for axis in ("x", "y", "z"):
+        if axis not in pos:
+            raise JobFileError(f"{where}: missing {axis}")
+    return {axis: _number(f"{where}.{axis}", value) for axis, value in pos.items()}
+
+
+def _block(where, block):
+    if not isinstance(block, dict):
+        raise JobFileError(f"{where}: expected a table with pick and drop, got {block!r}")
+    _check_keys(where, block, ("pick", "drop"))
+    return {"pick": _position(f"{where}.pick", block.get("pick")),
+            "drop": _position(f"{where}.drop", block.get("drop"))}
+
+
+def _grid(where, table):
+    if not isinstance(table, dict):
+        raise JobFileError(f"{where}: expected a grid table")
+    _check_keys(where, table, GRID_KEYS)
+    try:
+        return GridPattern(**table)
+    except (TypeError, ValueError) as e:
+        raise JobFileError(f"{where}: {e}") from None
+
+
+def parse_job(spec, name="job"):
+    """Validate a job dict and normalise it to plain values
+
+    Returns {"effector", "port", "motion", "blocks"} where blocks is the
+    legacy list of {"pick": {...}, "drop": {...}} dicts. Raises
+    JobFileError describing the first problem found.
+    """
+    _check_keys(name, spec, ("effector", "port", "motion", "blocks", "pallet"))
+    effector = spec.get("effector", "suction")
+    if effector not in EFFECTORS:
+        raise JobFileError(f"{name}: effector must be one of {', '.join(EFFECTORS)}, got {effector!r}")
+    port = spec.get("port")
+    if port is not None and not isinstance(port, str):
+        raise JobFileError(f"{name}: port must be a string")
+
+    motion = spec.get("motion", {})
+    if not isinstance(motion, dict):
+        raise JobFileError(f"{name}.motion: expected a table")
+    _check_keys(f"{name}.motion", motion, MOTION_PARAMS)
+    params = {}
+    for key, (types, default) in MOTION_PARAMS.items():
+        value = motion.get(key, default)
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            raise JobFileError(f"{name}.motion.{key}: invalid value {value!r}")
+        params[key] = value
+
+    if ("blocks" in spec) == ("pallet" in spec):
+        raise JobFileError(f"{name}: give exactly one of blocks or pallet")
+    if "blocks" in spec:
+        if not isinstance(spec["blocks"], list):
+            raise JobFileError(f"{name}.blocks: expected an array of tables")
+        blocks = [_block(f"{name}.blocks[{i}]", block) for i, block in enumerate(spec["blocks"])]
+    else:
+        pallet = spec["pallet"]
+        if not isinstance(pallet, dict):
+            raise JobFileError(f"{name}.pallet: expected a table with pick and drop grids")
+        _check_keys(f"{name}.pallet", pallet, ("pick", "drop"))
+        try:
+            layout = PalletLayout.from_grids(_grid(f"{name}.pallet.pick", pallet.get("pick")),
+                                             _grid(f"{name}.pallet.drop", pallet.get("drop")))
+        except ValueError as e:
+            raise JobFileError(f"{name}.pallet: {e}") from None
+        blocks = list(layout)
+    if not blocks:
+        raise JobFileError(f"{name}: no blocks to move")
+    return {"effector": effector, "port": port, "motion": params, "blocks": blocks}
+
+
+class CompiledJob:
+    """A validated job plus the visiting order and trajectory of each pass"""
+
+    def __init__(self, effector, port, motion, blocks, passes, digest=None):
+        self.effector = effector
+        self.port = port
+        self.motion = motion
+        self.blocks = PalletLayout.from_blocks(blocks)
+        self.passes = passes
+        self.digest = digest
+
+    def pose(self, pos):
+        """(x, y, z, r) of a block position the way the job's palletizer sees it"""
+        return make_effector(self.effector).pose(pos, self.motion["rotation"])
+
+    def pass_moves(self, name):
+        """(pick, drop) position dicts of a pass, in layout order"""
+        layout = self.blocks if name == "transfer" else self.blocks.reversed()
+        return [(block["pick"], block["drop"]) for block in layout]
+
+    def summary(self):
+        dwell = self.motion["actuation_dwell"]
+        if dwell is None:
+            dwell = make_effector(self.effector).dwell
+        lines = [f"{self.effector} job, {len(self.blocks)} blocks"]
+        for name in PASSES:
+            lines.append(f"  {name}: {self.passes[name]['plan'].summary(dwell=dwell)}")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {
+            "format": PLAN_FORMAT,
+            "effector": self.effector,
+            "port": self.port,
+            "motion": self.motion,
+            "blocks": list(self.blocks),
+            "passes": {name: {"order": entry["order"], "plan": entry["plan"].as_dict()}
+                       for name, entry in self.passes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data, digest=None):
+        passes = {name: {"order": entry["order"], "plan": TrajectoryPlan.from_dict(entry["plan"])}
+                  for name, entry in data["passes"].items()}
+        return cls(data["effector"], data["port"], data["motion"], data["blocks"], passes, digest)
+
+
+def compile_job(spec, name="job", digest=None):
+    """Validate a job dict, then order, plan and reachability-check both passes"""
+    job = CompiledJob(**parse_job(spec, name), passes={}, digest=digest)
+    motion = job.motion
+    orderer = BlockOrderer() if motion["ordering"] else None
+    # Blocks start at their picks; the return pass starts where the transfer left them
+    workspace = HeightMap().load(job.blocks) if motion["workspace"] else None
+    for pass_name in PASSES:
+        moves = [(job.pose(pick), job.pose(drop)) for pick, drop in job.pass_moves(pass_name)]
+        order = orderer.order(moves) if orderer else list(range(len(moves)))
+        plan = plan_moves((moves[i] for i in order), safe_height=motion["safe_height"],
+                          clearance=motion["clearance"], jump=motion["jump"], lead=motion["on_the_fly"],
+                          workspace=workspace)
+        # Step-by-step mode always travels at safe_height
+        points = plan.waypoints() + [(x, y, motion["safe_height"], r)
+                                     for move in moves for x, y, _, r in move]
+        _, errors = inverse_kinematics_batch(points)
+        if errors:
+            index, reason = min(errors.items())
+            x, y, z, _ = points[index]
+            raise JobFileError(f"{name}: {pass_name} waypoint ({x:.1f}, {y:.1f}, {z:.1f}) "
+                               f"is unreachable: {reason}")
+        job.passes[pass_name] = {"order": order, "plan": plan}
+    return job
+
+
+def file_digest(path):
+    """Cache key of a job file: hash of its bytes and the plan format"""
+    digest = hashlib.sha256(f"plan-format-{PLAN_FORMAT}\n".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_job(path, cache_dir=CACHE_DIR, use_cache=True):
+    """Compiled job for a job file, reusing the cached compile when the file is unchanged"""
+    digest = file_digest(path)
+    cache_path = os.path.join(cache_dir, f"{digest}.json")
+    if use_cache:
+        try:
+            with open(cache_path) as f:
+                data = json.load(f)
+            if data.get("format") == PLAN_FORMAT:
+                return CompiledJob.from_dict(data, digest)
+        except (OSError, ValueError, KeyError):
+            pass  # missing or damaged entry: compile again
+    job = compile_job(read_job_file(path), os.path.basename(path), digest)
+    if use_cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path + ".tmp", "w") as f:
+                json.dump(job.as_dict(), f)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass  # the cache is only an optimisation
+    return job
+
+
+def build_palletizer(job, device=None, **options):
+    """Palletizer configured from a compiled job, with its plans preloaded"""
+    kwargs = dict(job.motion)
+    kwargs["ordering"] = BlockOrderer() if kwargs["ordering"] else None
+    kwargs["workspace"] = HeightMap() if kwargs["workspace"] else None
+    kwargs["speed_profiles"] = SpeedProfiles() if kwargs["speed_profiles"] else None
+    if job.port:
+        kwargs["port"] = job.port
+    kwargs.update(options)
+    palletizer = Palletizer(device=device, effector=job.effector, blocks=job.blocks, **kwargs)
+    palletizer.load_plans(job)
+    return palletizer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile and run declarative palletizing job files")
+    parser.add_argument("command", choices=("check", "run"))
+    parser.add_argument("job", help="job file (.toml or .json)")
+    parser.add_argument("--sim", action="store_true", help="run on the simulated Dobot")
+    parser.add_argument("--no-cache", action="store_true", help="always recompile the job")
+    args = parser.parse_args(argv)
+
+    try:
+        job = load_job(args.job, use_cache=not args.no_cache)
+    except (OSError, JobFileError) as e:
+        print(f"Invalid job: {e}")
+        sys.exit(1)
+    print(job.summary())
+    if args.command == "check":
+        return job
+
+    palletizer = build_palletizer(job, device=SimulatedDobot() if args.sim else None)
+    try:
+        return palletizer.run_complete_cycle()
+    except KeyboardInterrupt:
+        palletizer.emergency_stop()
+    finally:
+        palletizer.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+
+# Block events recorded by the palletizers
+GRABBED = "grabbed"
+RELEASED = "released"
+DROPPED = "dropped"
+
+# Where a block is according to the journal
+AT_PICK = "pick"
+AT_DROP = "drop"
+HELD = "held"
+
+PASSES = ("transfer", "return")
+
+
+def layout_fingerprint(layout):
+    """Short hash of a PalletLayout's poses, so a journal is only resumed for the same pallet"""
+    digest = hashlib.sha1(repr(list(layout.poses())).encode())
+    return digest.hexdigest()[:16]
+
+
+class JobJournal:
+    """Append-only JSON-lines record of block events for crash recovery
+
+    Each line is one event: {"p": pass, "b": block number, "e": event}.
+    Events are buffered and written with a single flush + fsync per
+    commit(), so a batch of blocks completing together costs one sync.
+    The first line identifies the pallet layout the events belong to.
+    Each block's current state is kept up to date as events are loaded
+    and recorded, so lookups do not replay the event list.
+    """
+
+    def __init__(self, path, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.events = []
+        # block -> (location, pass) for blocks with events; held blocks in the order grabbed
+        self.states = {}
+        self.holding = {}
+        self.buffer = []
+        self.syncs = 0
+        header, end = self._load()
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            # Cut off a torn final write, or the next event would be glued onto it
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        self.file = open(path, "a")
+        if header is None or (fingerprint is not None and header.get("layout") != fingerprint):
+            self.reset()
+
+    def _load(self):
+        """Read existing events; returns (header record or None, byte offset after the last intact line)"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None, 0
+        header = None
+        end = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("unterminated line")
+                record = json.loads(line)
+            except ValueError:
+                break  # torn final write from a crash; everything before it is intact
+            end += len(line)
+            if header is None:
+                header = record
+            else:
+                self.events.append((record["p"], record["b"], record["e"]))
+                self._apply(record["p"], record["b"], record["e"])
+        return header, end
+
+    def _apply(self, pass_name, block, event):
+        """Update a block's state for one event"""
+        if event == GRABBED:
+            state = (HELD, pass_name)
+        elif event == RELEASED:
+            state = (AT_DROP if pass_name == "transfer" else AT_PICK, None)
+        elif event == DROPPED:
+            # Released mid-move by an emergency stop; assumed put back at its source
+            state = (AT_PICK if pass_name == "transfer" else AT_DROP, None)
+        else:
+            return
+        self.states[block] = state
+        self.holding.pop(block, None)
+        if state[0] == HELD:
+            self.holding[block] = pass_name
+
+    def reset(self):
+        """Start an empty journal for the current layout"""
+        self.file.seek(0)
+        self.file.truncate()
+        self.events = []
+        self.states = {}
+        self.holding = {}
+        self.buffer = [json.dumps({"layout": self.fingerprint})]
+        self.commit()
+
+    def record(self, pass_name, block, event):
+        """Buffer one event; it is durable once commit() returns"""
+        self.events.append((pass_name, block, event))
+        self._apply(pass_name, block, event)
+        self.buffer.append(json.dumps({"p": pass_name, "b": block, "e": event}, separators=(",", ":")))
+
+    def commit(self):
+        """Write and fsync every buffered event"""
+        if not self.buffer:
+            return
+        self.file.write("\n".join(self.buffer) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer = []
+        self.syncs += 1
+
+    def state(self, block):
+        """(location, pass) of a block: AT_PICK, AT_DROP, or HELD during `pass`"""
+        return self.states.get(block, (AT_PICK, None))
+
+    def held_block(self):
+        """(pass, block) of the block the effector grabbed last and still holds, or None"""
+        if not self.holding:
+            return None
+        block = next(reversed(self.holding))
+        return self.holding[block], block
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.commit()
+        self.file.close()
@@ -0,0 +1,126 @@
+import math
+from array import array
+
+from trajectory import segment_time
+
+# Dobot Magician Lite geometry (mm)
+REAR_ARM = 150.0
+FORE_ARM = 150.0
+TOOL_OFFSET = 85.0
+
+# Approximate joint limits in degrees: (min, max) for J1..J4
+JOINT_LIMITS = ((-135.0, 135.0), (-5.0, 85.0), (-10.0, 90.0), (-145.0, 145.0))
+
+
+class UnreachableError(ValueError):
+    """Raised when a Cartesian target is outside the arm's workspace"""
+    pass
+
+
+def inverse_kinematics(x, y, z, r=0.0):
+    """Return joint angles (j1, j2, j3, j4) in degrees for a Cartesian pose
+
+    j1 is the base yaw, j2 the rear arm angle from vertical, j3 the forearm
+    angle below horizontal and j4 the end effector rotation relative to j1.
+    """
+    radius = math.hypot(x, y) - TOOL_OFFSET
+    reach = math.hypot(radius, z)
+    if reach > REAR_ARM + FORE_ARM or reach < abs(REAR_ARM - FORE_ARM) or reach == 0:
+        raise UnreachableError(f"({x:.1f}, {y:.1f}, {z:.1f}) is outside the arm's reach")
+
+    rear = math.atan2(z, radius) + math.acos(
+        (REAR_ARM ** 2 + reach ** 2 - FORE_ARM ** 2) / (2 * REAR_ARM * reach))
+    elbow_r = REAR_ARM * math.cos(rear)
+    elbow_z = REAR_ARM * math.sin(rear)
+    fore = math.atan2(elbow_z - z, radius - elbow_r)
+
+    j1 = math.degrees(math.atan2(y, x))
+    joints = (j1, 90.0 - math.degrees(rear), math.degrees(fore), r - j1)
+    for i, (angle, (low, high)) in enumerate(zip(joints, JOINT_LIMITS), start=1):
+        if not low <= angle <= high:
+            raise UnreachableError(f"J{i} = {angle:.1f} deg is outside [{low}, {high}]")
+    return joints
+
+
+def forward_kinematics(j1, j2, j3, j4=0.0):
+    """Return the Cartesian pose (x, y, z, r) for joint angles in degrees"""
+    rear = math.radians(90.0 - j2)
+    fore = math.radians(j3)
+    radius = REAR_ARM * math.cos(rear) + FORE_ARM * math.cos(fore) + TOOL_OFFSET
+    z = REAR_ARM * math.sin(rear) - FORE_ARM * math.sin(fore)
+    base = math.radians(j1)
+    return (radius * math.cos(base), radius * math.sin(base), z, j1 + j4)
+
+
+def inverse_kinematics_batch(points):
+    """Joint angles for many (x, y, z, r) points in one pass, without raising
+
+    Returns (joints, errors): joints is an array('d') holding j1..j4 for
+    each point in order (NaN for unreachable points) and errors maps the
+    index of each unreachable point to the reason.
+    """
+    hypot, atan2, acos, degrees = math.hypot, math.atan2, math.acos, math.degrees
+    cos, sin = math.cos, math.sin
+    rear_sq = REAR_ARM ** 2
+    fore_sq = FORE_ARM ** 2
+    max_reach = REAR_ARM + FORE_ARM
+    min_reach = abs(REAR_ARM - FORE_ARM)
+    (j1_low, j1_high), (j2_low, j2_high), (j3_low, j3_high), (j4_low, j4_high) = JOINT_LIMITS
+    nan = math.nan
+    joints = array("d")
+    append = joints.extend
+    errors = {}
+
+    for index, (x, y, z, r) in enumerate(points):
+        radius = hypot(x, y) - TOOL_OFFSET
+        reach = hypot(radius, z)
+        if reach > max_reach or reach < min_reach or reach == 0:
+            errors[index] = f"outside the arm's reach ({reach:.1f} mm from the shoulder)"
+            append((nan, nan, nan, nan))
+            continue
+        rear = atan2(z, radius) + acos((rear_sq + reach * reach - fore_sq) / (2 * REAR_ARM * reach))
+        fore = atan2(REAR_ARM * sin(rear) - z, radius - REAR_ARM * cos(rear))
+        j1 = degrees(atan2(y, x))
+        j2 = 90.0 - degrees(rear)
+        j3 = degrees(fore)
+        j4 = r - j1
+        if not (j1_low <= j1 <= j1_high and j2_low <= j2 <= j2_high and
+                j3_low <= j3 <= j3_high and j4_low <= j4 <= j4_high):
+            for i, (angle, (low, high)) in enumerate(zip((j1, j2, j3, j4), JOINT_LIMITS), start=1):
+                if not low <= angle <= high:
+                    errors[index] = f"J{i} = {angle:.1f} deg is outside [{low}, {high}]"
+                    break
+            append((nan, nan, nan, nan))
+            continue
+        append((j1, j2, j3, j4))
+    return joints, errors
+
+
+def check_reachable(points):
+    """List of (index, point, reason) for every point the arm cannot reach"""
+    points = list(points)
+    _, errors = inverse_kinematics_batch(points)
+    return [(index, points[index], reason) for index, reason in sorted(errors.items())]
+
+
+def joint_travel(joints):
+    """Per-move joint travel between consecutive solutions of inverse_kinematics_batch
+
+    Returns an array('d') with |dj1|..|dj4| (degrees) for each of the
+    len(joints) / 4 - 1 moves.
+    """
+    travel = array("d")
+    for i in range(4, len(joints), 4):
+        travel.extend((abs(joints[i] - joints[i - 4]), abs(joints[i + 1] - joints[i - 3]),
+                       abs(joints[i + 2] - joints[i - 2]), abs(joints[i + 3] - joints[i - 1])))
+    return travel
+
+
+def joint_move_times(travel, velocity=200.0, acceleration=200.0):
+    """Synchronised MOVJ time of each move in a joint_travel() array
+
+    All joints finish together, so each move takes as long as its slowest
+    joint; velocity/acceleration are the per-joint limits (deg/s, deg/s^2).
+    """
+    return array("d", (max(segment_time(travel[i + k], velocity, acceleration) for k in range(4))
+                       for i in range(0, len(travel), 4)))
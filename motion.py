@@ -0,0 +1,274 @@
+import math
+import struct
+import time
+from collections import deque
+
+from pydobot.dobot import MAX_QUEUE_LEN, MODE_PTP
+from pydobot.message import Message
+
+# Dobot protocol command for a queued controller-side wait (SetWAITCmd)
+WAIT_CMD_ID = 110
+
+# Dobot protocol command that halts the queue mid-command (SetQueuedCmdForceStopExec);
+# the plain stop (241) lets the command in progress run to completion first
+FORCE_STOP_CMD_ID = 242
+
+# Phase name reported for the host-side serial round trip of each command
+SERIAL_PHASE = "serial"
+
+
+class MotionTimeout(Exception):
+    """Raised when a queued command does not complete within the timeout"""
+    pass
+
+
+class MotionSequencer:
+    """Sequence motion on the Dobot by waiting on queued-command completion"""
+
+    def __init__(self, device, tolerance=0.5, timeout=15.0, poll_interval=0.02,
+                 max_queued=MAX_QUEUE_LEN - 2, tracer=None):
+        """Wrap a connected Dobot device
+
+        tolerance     -- max distance (mm) between commanded and reported pose
+        timeout       -- max seconds the controller may go without finishing a command
+                         while it is being waited on
+        poll_interval -- seconds between queue index / pose polls
+        max_queued    -- commands allowed in flight before submission blocks
+        tracer        -- optional instrumentation.Tracer for retry/timeout counters
+        """
+        self.device = device
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_queued = max_queued
+        self.tracer = tracer
+        self.pending = deque()
+        self.last_index = None
+        self.target = None
+        self.jump_params = None
+        self.speed_params = None
+
+        # Optional callback(phase, seconds) fed with per-phase execution times
+        self.on_phase = None
+        self.labels = {}
+        self.mark = None
+
+        # Optional callback(payloads) called with the checkpoints the controller
+        # has passed, all at once per poll so they can be persisted together
+        self.on_complete = None
+        self.checkpoints = deque()
+
+    def _submit(self, send, phase=None):
+        """Send one queued command, blocking only if the controller queue is full"""
+        while len(self.pending) >= self.max_queued:
+            self._wait_index(self.pending.popleft(), self.timeout)
+        sent_at = time.perf_counter()
+        self.last_index = send()
+        if self.on_phase is not None:
+            self.on_phase(SERIAL_PHASE, time.perf_counter() - sent_at)
+            if phase is not None:
+                if not self.labels:
+                    self.mark = sent_at
+                self.labels[self.last_index] = phase
+        self.pending.append(self.last_index)
+        return self.last_index
+
+    def _record_phases(self, index):
+        """Attribute the time since the last completion to each finished phase"""
+        now = time.perf_counter()
+        for done in sorted(i for i in self.labels if i <= index):
+            self.on_phase(self.labels.pop(done), now - self.mark)
+            self.mark = now
+
+    def move_to(self, x, y, z, r=0, phase=None):
+        """Queue a point-to-point move and return its queue index"""
+        self.target = (x, y, z)
+        return self._submit(lambda: self.device.move_to(x, y, z, r), phase)
+
+    def move_many(self, moves):
+        """Queue (x, y, z, r, phase) moves back to back and return the last queue index
+
+        Devices with a batched move_many (fast_dobot.FastDobot, the simulator)
+        get each run of moves that fits the controller queue in one write.
+        """
+        moves = list(moves)
+        if not hasattr(self.device, "move_many"):
+            for x, y, z, r, phase in moves:
+                self.move_to(x, y, z, r, phase)
+            return self.last_index
+        while moves:
+            while len(self.pending) >= self.max_queued:
+                self._wait_index(self.pending.popleft(), self.timeout)
+            room = self.max_queued - len(self.pending)
+            batch, moves = moves[:room], moves[room:]
+            sent_at = time.perf_counter()
+            indices = self.device.move_many([move[:4] for move in batch])
+            if self.on_phase is not None:
+                elapsed = (time.perf_counter() - sent_at) / len(batch)
+                for index, move in zip(indices, batch):
+                    self.on_phase(SERIAL_PHASE, elapsed)
+                    if move[4] is not None:
+                        if not self.labels:
+                            self.mark = sent_at
+                        self.labels[index] = move[4]
+            self.pending.extend(indices)
+            self.last_index = indices[-1]
+            self.target = batch[-1][:3]
+        return self.last_index
+
+    def jump_to(self, x, y, z, r, height, phase=None):
+        """Queue a JUMP move that lifts to `height`, traverses and descends"""
+        start_z = self.target[2] if self.target is not None else z
+        params = (max(height - min(start_z, z), 0), height)
+        if self.jump_params != params:
+            self._submit(lambda: self.device._extract_cmd_index(
+                self.device._set_ptp_jump_params(*params)))
+            self.jump_params = params
+        self.target = (x, y, z)
+        return self._submit(lambda: self.device.move_to(x, y, z, r, mode=MODE_PTP.JUMP_XYZ), phase)
+
+    def set_limits(self, joint_velocity, joint_acceleration, linear_velocity, linear_acceleration):
+        """Queue the PTP joint and coordinate limits the speed ratios are taken of"""
+        joint = [joint_velocity] * 4 + [joint_acceleration] * 4
+        self._submit(lambda: self.device._extract_cmd_index(self.device._set_ptp_joint_params(*joint)))
+        return self._submit(lambda: self.device._extract_cmd_index(
+            self.device._set_ptp_coordinate_params(linear_velocity, linear_acceleration)))
+
+    def set_speed(self, velocity, acceleration):
+        """Queue new velocity/acceleration ratios (%) for the moves after it, if they changed"""
+        params = (velocity, acceleration)
+        if self.speed_params != params:
+            self._submit(lambda: self.device._extract_cmd_index(
+                self.device._set_ptp_common_params(*params)))
+            self.speed_params = params
+        return self.last_index
+
+    def actuate(self, command, enable, phase=None):
+        """Queue an end effector command (device.suck / device.grip)"""
+        return self._submit(lambda: command(enable), phase)
+
+    def dwell(self, seconds, phase=None):
+        """Queue a controller-side wait so the host never blocks on a sleep"""
+        if seconds <= 0:
+            if phase is not None and self.last_index in self.labels:
+                self.labels[self.last_index] = phase
+            return self.last_index
+        msg = Message()
+        msg.id = WAIT_CMD_ID
+        msg.ctrl = 0x03
+        msg.params = bytearray(struct.pack('I', int(round(seconds * 1000))))
+        return self._submit(lambda: self.device._extract_cmd_index(self.device._send_command(msg)), phase)
+
+    def checkpoint(self, payload, index=None):
+        """Report `payload` to on_complete once queue index `index` (default: the last) has run"""
+        self.checkpoints.append((self.last_index if index is None else index, payload))
+
+    def current_index(self):
+        """Return the index of the last command the controller has completed"""
+        index = self.device._get_queued_cmd_current_index()
+        if self.labels:
+            self._record_phases(index)
+        if self.checkpoints and self.checkpoints[0][0] <= index:
+            done = []
+            while self.checkpoints and self.checkpoints[0][0] <= index:
+                done.append(self.checkpoints.popleft()[1])
+            if self.on_complete is not None:
+                self.on_complete(done)
+        return index
+
+    def wait(self, index=None, timeout=None):
+        """Block until queued command `index` (default: the last one) has run
+
+        Waits on the controller's queue index first, then for the reported
+        pose to settle within `tolerance` of the last commanded target.
+        `timeout` bounds each command rather than the whole wait, so a long
+        batch in flight takes as long as its commands need.
+        Returns the elapsed wait time in seconds.
+        """
+        if index is None:
+            index = self.last_index
+        if timeout is None:
+            timeout = self.timeout
+        start = time.monotonic()
+
+        if index is not None:
+            self._wait_index(index, timeout)
+            while self.pending and self.pending[0] <= index:
+                self.pending.popleft()
+
+        if self.target is not None and not self.pending:
+            self.wait_for_pose(self.target, timeout)
+
+        return time.monotonic() - start
+
+    def _wait_index(self, index, timeout):
+        """Poll the controller until queue index `index` has been reached
+
+        Fails once the controller has gone `timeout` seconds without
+        finishing a command; every command it finishes restarts the clock.
+        """
+        deadline = time.monotonic() + timeout
+        reached = None
+        while True:
+            current = self.current_index()
+            if current >= index:
+                return
+            if current != reached:
+                if reached is not None:
+                    deadline = time.monotonic() + timeout
+                reached = current
+            elif time.monotonic() > deadline:
+                self._count("motion.timeouts")
+                raise MotionTimeout(f"Command {index} did not complete in time (stuck after {current})")
+            self._count("motion.index_retries")
+            time.sleep(self.poll_interval)
+
+    def _count(self, name):
+        if self.tracer is not None:
+            self.tracer.count(name)
+
+    def abort(self):
+        """Stop execution and drop everything still queued on the controller
+
+        The queue is force-stopped, cutting short the command in progress,
+        so the index read next is final: nothing after it completes later.
+        Returns that index of the last command the controller finished
+        (None if it could not be read). Checkpoints up to it are reported
+        first. The arm position is unknown afterwards (`target` is None).
+        """
+        msg = Message()
+        msg.id = FORCE_STOP_CMD_ID
+        msg.ctrl = 0x01
+        self.device._send_command(msg)
+        try:
+            index = self.current_index()
+        except Exception:
+            index = None
+        self.device._set_queued_cmd_clear()
+        self.device._set_queued_cmd_start_exec()
+        self.pending.clear()
+        self.labels.clear()
+        self.checkpoints.clear()
+        self.last_index = None
+        self.target = None
+        self.jump_params = None
+        self.speed_params = None
+        return index
+
+    def wait_for_pose(self, target, timeout=None):
+        """Block until the reported position is within tolerance of `target`"""
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            position = self.device.get_pose().position
+            error = math.sqrt((position.x - target[0]) ** 2 +
+                              (position.y - target[1]) ** 2 +
+                              (position.z - target[2]) ** 2)
+            if error <= self.tolerance:
+                return error
+            if time.monotonic() > deadline:
+                self._count("motion.timeouts")
+                raise MotionTimeout(f"Pose did not converge to {target} (error {error:.2f} mm)")
+            self._count("motion.pose_retries")
+            time.sleep(self.poll_interval)
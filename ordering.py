@@ -0,0 +1,190 @@
+import itertools
+import math
+
+# Block counts up to this size are ordered by exact search
+EXACT_LIMIT = 10
+
+# Points closer than this in x/y (mm) are treated as the same stack
+STACK_RADIUS = 10.0
+
+# mm of travel one degree of end effector rotation is considered worth
+ROTATION_WEIGHT = 0.5
+
+
+def _cost(a, b, rotation_weight):
+    """Travel cost between two (x, y, z, r) poses"""
+    return math.dist(a[:3], b[:3]) + rotation_weight * abs(a[3] - b[3])
+
+
+def stacking_dependencies(moves, radius=STACK_RADIUS):
+    """Derive {index: indices that must go first} from stacked pick/drop points
+
+    A drop sitting on top of another drop must be placed after it, and a
+    pick sitting on top of another pick must be taken before it.
+    """
+    after = {}
+    for i, (pick_i, drop_i) in enumerate(moves):
+        for j, (pick_j, drop_j) in enumerate(moves):
+            if i == j:
+                continue
+            if math.dist(drop_i[:2], drop_j[:2]) <= radius and drop_i[2] > drop_j[2]:
+                after.setdefault(i, set()).add(j)
+            if math.dist(pick_i[:2], pick_j[:2]) <= radius and pick_i[2] < pick_j[2]:
+                after.setdefault(i, set()).add(j)
+    return after
+
+
+class BlockOrderer:
+    """Choose the visiting order of (pick, drop) moves to minimise travel"""
+
+    def __init__(self, exact_limit=EXACT_LIMIT, rotation_weight=ROTATION_WEIGHT, max_passes=50):
+        """Configure the search
+
+        exact_limit     -- largest batch solved exactly (Held-Karp)
+        rotation_weight -- mm-equivalent cost per degree of r change
+        max_passes      -- cap on 2-opt improvement passes for large batches
+        """
+        self.exact_limit = exact_limit
+        self.rotation_weight = rotation_weight
+        self.max_passes = max_passes
+
+    def route_cost(self, moves, order, start=None):
+        """Total travel for visiting `moves` in `order`, starting at `start`"""
+        total = 0.0
+        position = start
+        for i in order:
+            pick, drop = moves[i]
+            if position is not None:
+                total += _cost(position, pick, self.rotation_weight)
+            total += _cost(pick, drop, self.rotation_weight)
+            position = drop
+        return total
+
+    def order(self, moves, start=None, after=None):
+        """Return a list of indices into `moves` giving the visiting order
+
+        moves -- sequence of (pick, drop) pairs of (x, y, z, r) tuples
+        start -- optional (x, y, z, r) pose the arm starts from
+        after -- optional {index: set of indices that must be placed first};
+                 derived from stacked pick/drop points when omitted
+        """
+        n = len(moves)
+        if after is None:
+            after = stacking_dependencies(moves)
+        if n <= 1:
+            return list(range(n))
+        if n <= self.exact_limit:
+            return self._exact(moves, start, after)
+        return self._two_opt(moves, self._nearest_neighbour(moves, start, after), start, after)
+
+    def _allowed(self, order, after):
+        """Check an order against the stacking dependencies"""
+        placed = set()
+        for i in order:
+            if not after.get(i, set()) <= placed:
+                return False
+            placed.add(i)
+        return True
+
+    def _exact(self, moves, start, after):
+        """Held-Karp dynamic programme over subsets of blocks"""
+        n = len(moves)
+        w = self.rotation_weight
+        need = [sum(1 << d for d in after.get(i, ())) for i in range(n)]
+        # best[(mask, last)] = (cost, previous last)
+        best = {}
+        for i in range(n):
+            if need[i]:
+                continue
+            cost = _cost(moves[i][0], moves[i][1], w)
+            if start is not None:
+                cost += _cost(start, moves[i][0], w)
+            best[(1 << i, i)] = (cost, None)
+
+        for size in range(2, n + 1):
+            for mask, last in [key for key in best if bin(key[0]).count("1") == size - 1]:
+                base = best[(mask, last)][0]
+                for i in range(n):
+                    if mask & (1 << i) or need[i] & ~mask:
+                        continue
+                    cost = base + _cost(moves[last][1], moves[i][0], w) + _cost(moves[i][0], moves[i][1], w)
+                    key = (mask | (1 << i), i)
+                    if key not in best or cost < best[key][0]:
+                        best[key] = (cost, last)
+
+        full = (1 << n) - 1
+        ends = [(best[(full, i)][0], i) for i in range(n) if (full, i) in best]
+        if not ends:
+            raise ValueError("Stacking dependencies contain a cycle")
+        order, mask, last = [], full, min(ends)[1]
+        while last is not None:
+            order.append(last)
+            mask, last = mask & ~(1 << last), best[(mask, last)][1]
+        return order[::-1]
+
+    def _nearest_neighbour(self, moves, start, after):
+        remaining = set(range(len(moves)))
+        placed = set()
+        order = []
+        position = start
+        while remaining:
+            ready = [i for i in remaining if after.get(i, set()) <= placed]
+            if not ready:
+                raise ValueError("Stacking dependencies contain a cycle")
+            if position is None:
+                nxt = min(ready)
+            else:
+                nxt = min(ready, key=lambda i: _cost(position, moves[i][0], self.rotation_weight))
+            order.append(nxt)
+            remaining.discard(nxt)
+            placed.add(nxt)
+            position = moves[nxt][1]
+        return order
+
+    def _two_opt(self, moves, order, start, after):
+        w = self.rotation_weight
+        n = len(order)
+
+        def link(a, b):
+            return _cost(moves[a][1], moves[b][0], w)
+
+        def entry(k, target):
+            if k > 0:
+                return link(order[k - 1], target)
+            return _cost(start, moves[target][0], w) if start is not None else 0.0
+
+        def prefix_sums():
+            # Links between consecutive blocks in both directions, so the cost
+            # change of reversing any segment is O(1)
+            forward, backward = [0.0], [0.0]
+            for k in range(n - 1):
+                forward.append(forward[-1] + link(order[k], order[k + 1]))
+                backward.append(backward[-1] + link(order[k + 1], order[k]))
+            return forward, backward
+
+        for _ in range(self.max_passes):
+            forward, backward = prefix_sums()
+            improved = False
+            for i in range(n - 1):
+                for j in range(i + 2, n + 1):
+                    old = entry(i, order[i]) + forward[j - 1] - forward[i]
+                    new = entry(i, order[j - 1]) + backward[j - 1] - backward[i]
+                    if j < n:
+                        old += link(order[j - 1], order[j])
+                        new += link(order[i], order[j])
+                    if new < old - 1e-9:
+                        candidate = order[:i] + order[i:j][::-1] + order[j:]
+                        if after and not self._allowed(candidate, after):
+                            continue
+                        order, improved = candidate, True
+                        forward, backward = prefix_sums()
+            if not improved:
+                break
+        return order
+
+
+def order_moves(moves, start=None, after=None, orderer=None):
+    """Return `moves` reordered for minimum travel (see BlockOrderer.order)"""
+    moves = list(moves)
+    orderer = orderer or BlockOrderer()
+    return [moves[i] for i in orderer.order(moves, start=start, after=after)]
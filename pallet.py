@@ -0,0 +1,134 @@
+import math
+from array import array
+
+# Floats stored per slot: pick x, y, z, r followed by drop x, y, z, r
+SLOT_SIZE = 8
+AXES = ("x", "y", "z", "r")
+
+# Marks a rotation that was not specified (the palletizer's default applies)
+NO_ROTATION = math.nan
+
+
+class GridPattern:
+    """Regular rows x cols x layers arrangement of slots"""
+
+    def __init__(self, origin, pitch, rows, cols, layers=1, layer_height=0.0, rotation=None):
+        """Describe the grid
+
+        origin       -- (x, y, z) of the first slot on the bottom layer
+        pitch        -- (dx, dy) spacing between rows and columns in mm
+        layer_height -- z spacing between layers in mm
+        rotation     -- None, a single r for every slot, or one r per layer
+        """
+        if rows < 1 or cols < 1 or layers < 1:
+            raise ValueError("rows, cols and layers must be at least 1")
+        self.origin = tuple(origin)
+        self.pitch = tuple(pitch)
+        self.rows = rows
+        self.cols = cols
+        self.layers = layers
+        self.layer_height = layer_height
+        if rotation is None or isinstance(rotation, (int, float)):
+            rotation = [NO_ROTATION if rotation is None else float(rotation)] * layers
+        if len(rotation) != layers:
+            raise ValueError(f"Expected {layers} layer rotations, got {len(rotation)}")
+        self.rotation = list(rotation)
+
+    def __len__(self):
+        return self.rows * self.cols * self.layers
+
+    def fill(self, data, offset):
+        """Write every slot pose into `data` starting at float `offset`, SLOT_SIZE apart"""
+        x0, y0, z0 = self.origin
+        dx, dy = self.pitch
+        i = offset
+        for layer in range(self.layers):
+            z = z0 + layer * self.layer_height
+            r = self.rotation[layer]
+            for row in range(self.rows):
+                x = x0 + row * dx
+                for col in range(self.cols):
+                    data[i] = x
+                    data[i + 1] = y0 + col * dy
+                    data[i + 2] = z
+                    data[i + 3] = r
+                    i += SLOT_SIZE
+
+
+class PalletLayout:
+    """Array-backed list of pick/drop slot pairs
+
+    All poses live in one flat array of doubles, so building and iterating
+    a layout is O(n) with no per-slot objects.
+    """
+
+    def __init__(self, data=None, swapped=False):
+        self.data = data if data is not None else array('d')
+        if len(self.data) % SLOT_SIZE:
+            raise ValueError("Layout data must hold whole slots")
+        self.swapped = swapped
+
+    @classmethod
+    def allocate(cls, count):
+        """Create a layout with `count` zeroed slots"""
+        return cls(array('d', [0.0]) * (count * SLOT_SIZE))
+
+    @classmethod
+    def from_grids(cls, pick, drop):
+        """Pair two GridPattern objects slot for slot"""
+        if len(pick) != len(drop):
+            raise ValueError(f"Pick grid has {len(pick)} slots but drop grid has {len(drop)}")
+        layout = cls.allocate(len(pick))
+        pick.fill(layout.data, 0)
+        drop.fill(layout.data, 4)
+        return layout
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """Build a layout from the legacy list of {"pick": {...}, "drop": {...}} dicts"""
+        data = array('d')
+        for block in blocks:
+            for key in ("pick", "drop"):
+                pos = block[key]
+                data.extend((pos["x"], pos["y"], pos["z"], pos.get("r", NO_ROTATION)))
+        return cls(data)
+
+    def __len__(self):
+        return len(self.data) // SLOT_SIZE
+
+    def reversed(self):
+        """Return the return-pass mapping (pick and drop swapped) sharing the same data"""
+        return PalletLayout(self.data, not self.swapped)
+
+    def pose(self, index, which):
+        """Return slot `index` pick (which=0) or drop (which=1) as an (x, y, z, r) tuple"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("slot index out of range")
+        start = index * SLOT_SIZE + 4 * (which ^ self.swapped)
+        return tuple(self.data[start:start + 4])
+
+    def poses(self):
+        """Iterate (pick, drop) pairs of (x, y, z, r) tuples"""
+        data = self.data
+        first, second = (4, 0) if self.swapped else (0, 4)
+        for start in range(0, len(data), SLOT_SIZE):
+            yield (tuple(data[start + first:start + first + 4]),
+                   tuple(data[start + second:start + second + 4]))
+
+    @staticmethod
+    def _as_dict(pose):
+        pos = dict(zip(AXES, pose))
+        if pos["r"] != pos["r"]:
+            del pos["r"]
+        return pos
+
+    def __getitem__(self, index):
+        """Return slot `index` in the legacy {"pick": {...}, "drop": {...}} form"""
+        return {"pick": self._as_dict(self.pose(index, 0)),
+                "drop": self._as_dict(self.pose(index, 1))}
+
+    def __iter__(self):
+        for pick, drop in self.poses():
+            yield {"pick": self._as_dict(pick), "drop": self._as_dict(drop)}
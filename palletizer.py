@@ -0,0 +1,977 @@
+import queue
+import time
+
+from dwell import GRAB as GRAB_ACTION, RELEASE as RELEASE_ACTION, AdaptiveDwell
+from effectors import make_effector
+from fast_dobot import FastDobot
+from instrumentation import ConsoleSink, InstrumentedDevice, RingBufferSink, Tracer
+from journal import AT_DROP, AT_PICK, DROPPED, GRABBED, HELD, RELEASED, JobJournal, layout_fingerprint
+from kinematics import inverse_kinematics_batch, joint_move_times, joint_travel
+from motion import MotionSequencer
+from pallet import PalletLayout
+from pydobot import Dobot
+from speed import APPROACH as FINAL_APPROACH, CARRY, PLACE, TRAVEL, SpeedProfiles
+from stream import BUFFER_SIZE, MoveBuffer
+from trajectory import (ACTUATE, APPROACH, DESCEND, GRAB, JUMP, LIFT, MOVE, RELEASE,
+                        RELEASE_PHASE, SETTLE, TRAVERSE, TrajectoryPlan, plan_moves)
+from workspace import HeightMap
+
+# Operation name of blocks moved by run_stream
+STREAM = "stream"
+
+
+class Palletizer:
+    """Transfer/return palletizing engine shared by every end effector
+
+    The end effector driver (effectors.py) decides how the tool is switched,
+    how long each grab/release dwell lasts and whether block rotations are
+    honoured; sequencing, planning, journalling and tracing live here once.
+    """
+
+    def __init__(self, port="/dev/ttyACM0", safe_height=50, rotation=0, device=None,
+                 tolerance=0.5, timeout=15.0, actuation_dwell=None, pipelined=True,
+                 clearance=None, jump=False, ordering=None,
+                 verbose=True, tracer=None, journal=None, effector="suction", blocks=(),
+                 adaptive_dwell=None, pick_check=None, on_the_fly=None, workspace=None,
+                 fast_protocol=False, speed_profiles=None):
+        """Initialize Dobot connection and parameters
+
+        device          -- optional pre-built Dobot-compatible device (e.g. a simulator)
+        tolerance       -- pose convergence tolerance in mm for completed moves
+        timeout         -- max seconds to wait for any single queued command
+        actuation_dwell -- controller-side wait after each grab/release in seconds
+                           (None uses the end effector's latency + settle)
+        pipelined       -- queue whole block sequences and wait once per batch
+        clearance       -- per-leg traverse height above the higher endpoint
+                           (None keeps every traverse at safe_height)
+        jump            -- use single JUMP (arc) moves between pick and drop points
+        ordering        -- optional ordering.BlockOrderer used to choose the visiting
+                           order of each transfer/return pass
+        verbose         -- print progress messages (from a background thread)
+        tracer          -- optional instrumentation.Tracer shared with other components
+        journal         -- optional path of a journal.JobJournal file; finished blocks
+                           are recorded there and a rerun resumes where the last run stopped
+        effector        -- effectors.EndEffector driver, or its name ("suction", "gripper")
+        blocks          -- PalletLayout or list of {"pick": {...}, "drop": {...}} dicts
+        adaptive_dwell  -- optional dwell.AdaptiveDwell, or the path of its JSON file, that
+                           learns the shortest reliable grab/release dwell per block; it
+                           only adapts with pick feedback, otherwise actuation_dwell is kept
+        pick_check      -- optional pick_check(block_num, action) -> bool reporting whether
+                           a grab/release held (e.g. a vacuum switch); the simulator's own
+                           settle model is used when absent
+        on_the_fly      -- lead in mm for picking/placing on the fly: the tool is switched
+                           this far above the pick and the arm lifts this far off the drop
+                           before the dwell, hiding the tool's latency behind the motion
+                           (validate with the simulator, e.g. benchmark.py --on-the-fly)
+        workspace       -- optional workspace.HeightMap (True for the default geometry) that
+                           tracks the blocks standing in the workspace; traverses then only
+                           climb as high as the blocks under them require, up to safe_height.
+                           The blocks are added to it before the first pass, at their journalled
+                           positions, or else where that pass expects them (picks for a transfer,
+                           drops for a return)
+        fast_protocol   -- talk to the arm through fast_dobot.FastDobot (preallocated frames,
+                           batched move writes) instead of pydobot.Dobot
+        speed_profiles  -- optional speed.SpeedProfiles (True for the defaults): traverses at
+                           full speed, gentler acceleration while carrying a block and a slow
+                           final approach onto each pick/drop, switched with queued
+                           parameter commands. None leaves the controller's speed alone
+        """
+        self.port = port
+        self.safe_height = safe_height
+        self.rotation = rotation
+        self.device = device
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.effector = make_effector(effector)
+        self.actuation_dwell = self.effector.dwell if actuation_dwell is None else actuation_dwell
+        if isinstance(adaptive_dwell, str):
+            adaptive_dwell = AdaptiveDwell(adaptive_dwell)
+        self.adaptive_dwell = adaptive_dwell
+        self.pick_check = pick_check
+        self.on_the_fly = on_the_fly or None
+        self.fast_protocol = fast_protocol
+        self.speed_profiles = SpeedProfiles() if speed_profiles is True else speed_profiles
+        self.overlaps = {}
+        # Queue index of each actuation awaiting feedback -> (block_num, action)
+        self.actuations = {}
+        self.pipelined = pipelined
+        self.clearance = clearance
+        self.jump = jump
+        self.ordering = ordering
+        self.tracer = tracer or Tracer([RingBufferSink()])
+        if verbose:
+            self.tracer.add_sink(ConsoleSink())
+        self.cycle_trace = None
+        self.motion = None
+        self.queued_blocks = []
+        # Orders and plans from a compiled job file, keyed by the poses of their moves
+        self.compiled_orders = {}
+        self.compiled_plans = {}
+        
+        self.blocks = blocks if isinstance(blocks, PalletLayout) else PalletLayout.from_blocks(blocks)
+        self.journal = JobJournal(journal, layout_fingerprint(self.blocks)) if journal else None
+        if workspace is True:
+            workspace = HeightMap()
+        self.height_map = workspace
+        # The map in use, once seed_workspace() has put the blocks in (until then traverses stay at safe_height)
+        self.workspace = None
+        # (pick, drop) poses of the queued blocks, in queued_blocks order, for the workspace map
+        self.queued_moves = []
+        self._dwell_scope = None
+        
+        self.connect()
+    
+    def set_layout(self, blocks):
+        """Switch to another pallet layout between passes
+
+        The journal is reopened for the new layout (so it resumes only a run of
+        that layout) and the workspace map is re-seeded from the new blocks by
+        the next pass. Setting the layout already in use keeps both as they are.
+        """
+        blocks = blocks if isinstance(blocks, PalletLayout) else PalletLayout.from_blocks(blocks)
+        fingerprint = layout_fingerprint(blocks)
+        if fingerprint == layout_fingerprint(self.blocks):
+            self.blocks = blocks
+            return
+        self.blocks = blocks
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = JobJournal(self.journal.path, fingerprint)
+        if self.height_map is not None:
+            self.height_map.clear()
+            self.workspace = None
+    
+    def log(self, message):
+        """Record a progress message; printed only when verbose"""
+        self.tracer.event(message)
+    
+    def _record_events(self, events):
+        """MotionSequencer.on_complete: persist block events, one fsync per batch"""
+        for operation, block_num, event in events:
+            self.journal.record(operation, block_num, event)
+        self.journal.commit()
+    
+    def _checkpoint(self, block_num, event, operation):
+        """Journal `event` for a block once the last queued command has run"""
+        if self.journal is not None and block_num is not None:
+            self.motion.checkpoint((operation, block_num, event))
+    
+    def _dropped(self):
+        """Journal that a held block was let go of mid-move (error or emergency stop)"""
+        if self.journal is None:
+            return
+        try:
+            self.motion.current_index()  # record anything that did finish first
+        except Exception:
+            pass
+        held = self.journal.held_block()
+        if held:
+            operation, block_num = held
+            self.journal.record(operation, block_num, DROPPED)
+            self.journal.commit()
+            source = "pick" if operation == "transfer" else "drop"
+            self.log(f"  Block {block_num} was released mid-move; put it back at its {source} position")
+    
+    def _location(self, block_num):
+        """Journalled slot of a block: "pick", "drop" or None while held"""
+        location, _ = self.journal.state(block_num)
+        return {AT_PICK: "pick", AT_DROP: "drop"}.get(location)
+    
+    def seed_workspace(self, location):
+        """Add the layout's blocks to the workspace map, once, before the first pass
+
+        location -- where the pass about to run expects them: "pick" for a transfer,
+                    "drop" for a return. A journal that has recorded events knows
+                    where each block really is and is used instead.
+        """
+        if self.height_map is None or self.workspace is not None:
+            return
+        if self.journal is not None and self.journal.events:
+            self.workspace = self.height_map.load(self.blocks, self._location)
+        else:
+            self.workspace = self.height_map.load(self.blocks, lambda block_num: location)
+    
+    def traverse_height(self, start, end, loaded=False):
+        """Height to traverse at between two (x, y, z, ...) points
+
+        safe_height, or with a workspace map the lowest height that clears
+        every block under the path (never above safe_height).
+        """
+        if self.workspace is None or start is None:
+            return self.safe_height
+        return self.workspace.leg_height(start, end, loaded, ceiling=self.safe_height)
+    
+    def _climb(self, height, r, phase):
+        """Rise straight up to `height` first if the arm is below it"""
+        current = self.motion.target
+        if current is not None and current[2] < height:
+            self.motion.move_to(current[0], current[1], height, r, phase=phase)
+    
+    def _speed(self, segment):
+        """Switch to the speed profile of a segment kind for the moves queued next"""
+        if self.speed_profiles is not None:
+            self.motion.set_speed(*self.speed_profiles[segment])
+    
+    def _descend(self, x, y, z, r, segment):
+        """Move straight down onto a block, the last stretch at the approach/place profile"""
+        if self.speed_profiles is None:
+            return self.motion.move_to(x, y, z, r, phase=DESCEND)
+        current = self.motion.target
+        start_z = current[2] if current is not None and current[:2] == (x, y) else None
+        for part_z, profile in self.speed_profiles.descent(start_z, z, segment):
+            self.motion.set_speed(*profile)
+            self.motion.move_to(x, y, part_z, r, phase=DESCEND)
+        return self.motion.last_index
+    
+    def _tool(self, enable):
+        return self.effector.actuate(self.device, enable)
+    
+    @property
+    def dwell_scope(self):
+        """Key learned dwells are stored under: the effector plus the current layout"""
+        if self._dwell_scope is None or self._dwell_scope[0] is not self.blocks:
+            self._dwell_scope = (self.blocks, f"{self.effector.name}:{layout_fingerprint(self.blocks)}")
+        return self._dwell_scope[1]
+    
+    @property
+    def pick_feedback(self):
+        """Whether a failed grab/release can be seen: a pick_check, or a simulator reporting slips"""
+        return self.pick_check is not None or hasattr(self.device, "take_slips")
+    
+    def dwell_for(self, block_num, action):
+        """Grab/release dwell for a block: learned when adaptive with pick feedback, else the fixed dwell
+
+        A learned dwell never drops below the tool's latency: the block
+        cannot start to settle before the tool has switched.
+        """
+        if self.adaptive_dwell is None or block_num is None or not self.pick_feedback:
+            return self.actuation_dwell
+        return self.adaptive_dwell.dwell(self.dwell_scope, block_num, action, self.actuation_dwell,
+                                         floor=min(self.effector.latency, self.actuation_dwell))
+    
+    def overlap(self, x, y, z, r):
+        """Seconds of tool latency hidden by the on-the-fly lead move at (x, y, z)
+
+        The tool switches while the arm covers the `on_the_fly` mm between
+        (x, y, z) and the point above it, so that move's MOVJ time comes off
+        the dwell - but never more than the tool's latency, since the block
+        only starts to settle once the tool has actually switched.
+        """
+        key = (x, y, z, r)
+        if key not in self.overlaps:
+            joints, errors = inverse_kinematics_batch([(x, y, z, r), (x, y, z + self.on_the_fly, r)])
+            move = 0.0 if errors else joint_move_times(joint_travel(joints))[0]
+            self.overlaps[key] = min(move, self.effector.latency)
+        return self.overlaps[key]
+    
+    def _switch(self, enable, block_num):
+        """Queue the tool command alone; returns its queue index"""
+        index = self.motion.actuate(self._tool, enable)
+        if self.adaptive_dwell is not None and block_num is not None and self.pick_feedback:
+            self.actuations[index] = (block_num, GRAB_ACTION if enable else RELEASE_ACTION)
+        return index
+    
+    def _settle(self, enable, block_num, phase, overlap=0.0):
+        """Queue the dwell after a switch, less any latency already overlapped with motion"""
+        dwell = self.dwell_for(block_num, GRAB_ACTION if enable else RELEASE_ACTION)
+        return self.motion.dwell(max(dwell - overlap, 0.0), phase=phase)
+    
+    def _actuate(self, enable, block_num, phase):
+        """Queue the tool command and its dwell; returns the dwell's queue index"""
+        self._switch(enable, block_num)
+        return self._settle(enable, block_num, phase)
+    
+    def review_actuations(self):
+        """Feed completed grabs/releases back to the adaptive dwell controller"""
+        if not self.actuations:
+            return
+        if self.pick_check is not None:
+            failed = {index for index, (block_num, action) in self.actuations.items()
+                      if not self.pick_check(block_num, action)}
+        else:
+            failed = set(self.device.take_slips())
+        for index, (block_num, action) in sorted(self.actuations.items()):
+            ok = index not in failed
+            if not ok:
+                self.log(f"  Block {block_num} {action} did not settle; backing off its dwell")
+                self.tracer.count("dwell.backoffs")
+            self.adaptive_dwell.report(self.dwell_scope, block_num, action, ok, self.actuation_dwell)
+        self.actuations = {}
+    
+    def export_trace(self, path):
+        """Write the last cycle's trace in Chrome trace-event format"""
+        records = self.cycle_trace.records() if self.cycle_trace else None
+        return self.tracer.export_chrome_trace(path, records)
+    
+    def connect(self):
+        """Connect to Dobot device"""
+        try:
+            self.log(f"Connecting to Dobot on {self.port}...")
+            if self.device is None:
+                self.device = (FastDobot if self.fast_protocol else Dobot)(port=self.port)
+            self.device = InstrumentedDevice(self.device, self.tracer)
+            self.motion = MotionSequencer(self.device, tolerance=self.tolerance, timeout=self.timeout,
+                                          tracer=self.tracer)
+            self.motion.on_complete = self._record_events
+            if self.speed_profiles is not None:
+                self.motion.set_limits(*self.speed_profiles.limits())
+            if self.adaptive_dwell is not None and not self.pick_feedback:
+                self.log(f"Adaptive dwell needs pick feedback (pick_check); keeping the fixed "
+                         f"{self.actuation_dwell:.2f}s dwell")
+            held = self.journal.held_block() if self.journal else None
+            if held:
+                self.log(f"Journal: block {held[1]} is still held from the {held[0]} pass, keeping the {self.effector.name} on")
+            else:
+                self.effector.actuate(self.device, False)  # Ensure the tool is off
+            self.log("Successfully connected to Dobot!")
+        except Exception as e:
+            self.log(f"Connection failed: {e}")
+            raise
+    
+    def move_block(self, pick_pos, drop_pos, block_num, operation="transfer", label=None):
+        """Move a single block from pick to drop position
+
+        label -- name of the block in log messages (default "Block <block_num>")
+        """
+        label = label or f"Block {block_num}"
+        self.log(f"\nHandling {label} ({operation}):")
+        
+        # Extract coordinates (and rotation, if the tool honours it)
+        pick_x, pick_y, pick_z, pick_r = self._pose(pick_pos)
+        drop_x, drop_y, drop_z, drop_r = self._pose(drop_pos)
+        
+        held = False
+        try:
+            # Move above pick point
+            self.log(f"  Moving above pick point...")
+            height = self.traverse_height(self.motion.target, (pick_x, pick_y, pick_z))
+            self._speed(TRAVEL)
+            self._climb(height, pick_r, APPROACH)
+            self.motion.move_to(pick_x, pick_y, height, pick_r, phase=APPROACH)
+            self.motion.wait()
+            
+            # Move down to pick (stopping short by the lead when picking on the fly)
+            self.log(f"  Moving down to pick...")
+            if self.on_the_fly:
+                self.motion.move_to(pick_x, pick_y, pick_z + self.on_the_fly, pick_r, phase=DESCEND)
+            else:
+                self._descend(pick_x, pick_y, pick_z, pick_r, FINAL_APPROACH)
+            self.motion.wait()
+            
+            # Engage the tool (on the fly: while covering the last of the descent)
+            self.log("  Picking up block...")
+            self._switch(True, block_num)
+            if self.on_the_fly:
+                self._speed(FINAL_APPROACH)
+                self.motion.move_to(pick_x, pick_y, pick_z, pick_r, phase=DESCEND)
+                self._settle(True, block_num, ACTUATE, self.overlap(pick_x, pick_y, pick_z, pick_r))
+            else:
+                self._settle(True, block_num, ACTUATE)
+            self._checkpoint(block_num, GRABBED, operation)
+            self.motion.wait()
+            if self.workspace is not None:
+                held = self.workspace.remove(pick_x, pick_y, pick_z)
+            
+            # Lift up
+            self.log(f"  Lifting block...")
+            height = self.traverse_height((pick_x, pick_y, pick_z), (drop_x, drop_y, drop_z), loaded=True)
+            self._speed(CARRY)
+            self.motion.move_to(pick_x, pick_y, height, pick_r, phase=LIFT)
+            self.motion.wait()
+            
+            # Move above drop point
+            self.log(f"  Moving above drop point...")
+            self.motion.move_to(drop_x, drop_y, height, drop_r, phase=TRAVERSE)
+            self.motion.wait()
+            
+            # Move down to drop
+            self.log(f"  Moving down to drop...")
+            self._descend(drop_x, drop_y, drop_z, drop_r, PLACE)
+            self.motion.wait()
+            
+            # Release the tool (on the fly: while starting the lift)
+            self.log("  Dropping block...")
+            self._switch(False, block_num)
+            if self.on_the_fly:
+                self._speed(TRAVEL)
+                self.motion.move_to(drop_x, drop_y, drop_z + self.on_the_fly, drop_r, phase=LIFT)
+                self._settle(False, block_num, RELEASE_PHASE, self.overlap(drop_x, drop_y, drop_z, drop_r))
+            else:
+                self._settle(False, block_num, RELEASE_PHASE)
+            self._checkpoint(block_num, RELEASED, operation)
+            self.motion.wait()
+            if self.workspace is not None:
+                self.workspace.add(drop_x, drop_y, drop_z)
+                held = False
+            
+            # Lift up after drop (clear of the block just placed; the next approach climbs further if needed)
+            self.log(f"  Lifting after drop...")
+            height = self.traverse_height((drop_x, drop_y, drop_z), (drop_x, drop_y, drop_z))
+            self._speed(TRAVEL)
+            self.motion.move_to(drop_x, drop_y, height, drop_r, phase=LIFT)
+            self.motion.wait()
+            
+            self.review_actuations()
+            self.log(f"  {label} {operation} completed successfully!")
+            return True
+            
+        except Exception as e:
+            self.log(f"  Error handling {label}: {e}")
+            try:
+                self.effector.actuate(self.device, False)  # Ensure the block is released
+            except:
+                pass
+            self._dropped()
+            if held:
+                self.workspace.add(pick_x, pick_y, pick_z)  # put back at its source, as journalled
+            return False
+    
+    def _pose(self, pos):
+        """Return an (x, y, z, r) tuple for a block position dict"""
+        return self.effector.pose(pos, self.rotation)
+    
+    def _plan_key(self, moves):
+        return tuple((self._pose(pick), self._pose(drop)) for pick, drop in moves)
+    
+    def load_plans(self, job):
+        """Reuse the pass orders and plans of a jobfile.CompiledJob instead of re-planning"""
+        for name, entry in job.passes.items():
+            moves = job.pass_moves(name)
+            order = entry["order"]
+            self.compiled_orders[self._plan_key(moves)] = order
+            self.compiled_plans[self._plan_key(moves[i] for i in order)] = entry["plan"]
+    
+    def order_moves(self, moves):
+        """Return (block_num, pick, drop) tuples in the configured visiting order"""
+        moves = list(moves)
+        order = self.compiled_orders.get(self._plan_key(moves)) if self.compiled_orders else None
+        if order is None:
+            order = range(len(moves))
+            if self.ordering is not None:
+                order = self.ordering.order([(self._pose(pick), self._pose(drop)) for pick, drop in moves])
+        return [(i + 1, moves[i][0], moves[i][1]) for i in order]
+    
+    def plan(self, moves):
+        """Plan a minimal waypoint sequence for (pick, drop) position dicts"""
+        moves = list(moves)
+        plan = self.compiled_plans.get(self._plan_key(moves)) if self.compiled_plans else None
+        if plan is not None:
+            return plan
+        workspace = self.workspace.copy() if self.workspace is not None else None
+        return plan_moves(((self._pose(pick), self._pose(drop)) for pick, drop in moves),
+                          safe_height=self.safe_height, clearance=self.clearance, jump=self.jump,
+                          lead=self.on_the_fly, workspace=workspace)
+    
+    def precheck(self, moves):
+        """Check every waypoint of a pass is reachable before any motion is sent
+
+        Returns a list of (point, reason) for the unreachable ones.
+        """
+        moves = list(moves)
+        if self.compiled_plans and self._plan_key(moves) in self.compiled_plans:
+            self.log("  Precheck: plan validated when the job was compiled")
+            return []
+        points = self.plan(moves).waypoints()
+        motion_points = len(points)
+        # Step-by-step mode always travels at safe_height
+        for pick, drop in moves:
+            for pos in (pick, drop):
+                x, y, _, r = self._pose(pos)
+                points.append((x, y, self.safe_height, r))
+        joints, errors = inverse_kinematics_batch(points)
+        problems = [(points[i], reason) for i, reason in sorted(errors.items())]
+        for point, reason in dict(problems).items():
+            self.log(f"  Unreachable waypoint ({point[0]:.1f}, {point[1]:.1f}, {point[2]:.1f}): {reason}")
+        if not problems:
+            motion = sum(joint_move_times(joint_travel(joints[:4 * motion_points])))
+            self.log(f"  Precheck: {len(points)} waypoints reachable, ~{motion:.1f}s joint motion")
+        return problems
+    
+    def enqueue_plan(self, plan, block_nums=None, operation=None):
+        """Queue every step of a trajectory plan without waiting
+
+        block_nums -- block number of each planned block, in plan order, to journal
+        """
+        block_nums = iter(block_nums or ())
+        block_num = None
+        picked = None
+        moves = []
+        if self.speed_profiles is not None:
+            steps = self.speed_profiles.profile_steps(plan.steps, plan.lead)
+        else:
+            steps = ((step, None) for step in plan.steps)
+        for step, profile in steps:
+            if profile is not None and profile != self.motion.speed_params:
+                if moves:
+                    self.motion.move_many(moves)
+                    moves = []
+                self.motion.set_speed(*profile)
+            if step.kind == MOVE:
+                # Runs of plain moves go out together (one write on devices that batch)
+                moves.append((step.x, step.y, step.z, step.r, step.phase))
+                continue
+            if moves:
+                self.motion.move_many(moves)
+                moves = []
+            if step.kind in (GRAB, RELEASE):
+                enable = step.kind == GRAB
+                if enable:
+                    block_num = next(block_nums, None)
+                    picked = step[1:4]
+                self._switch(enable, block_num)
+                if plan.lead is None:
+                    index = self._settle(enable, block_num, step.phase)
+                    self._settled(enable, block_num, operation, index, (picked, step[1:4]))
+            elif step.kind == SETTLE:
+                # On-the-fly plans wait only after the lead move that follows the switch
+                enable = step.phase == ACTUATE
+                index = self._settle(enable, block_num, step.phase, self.overlap(step.x, step.y, step.z, step.r))
+                self._settled(enable, block_num, operation, index, (picked, step[1:4]))
+            elif step.kind == JUMP:
+                self.motion.jump_to(step.x, step.y, step.z, step.r, step.height, phase=step.phase)
+        if moves:
+            self.motion.move_many(moves)
+        return self.motion.last_index
+    
+    def _settled(self, enable, block_num, operation, index, move):
+        """Book-keeping once a grab/release dwell (queue index `index`) is queued
+
+        move -- (pick, drop) slot positions of the block, for the workspace map
+        """
+        if enable:
+            self._checkpoint(block_num, GRABBED, operation)
+        else:
+            self.queued_blocks.append(index)
+            self.queued_moves.append(move)
+            self._checkpoint(block_num, RELEASED, operation)
+    
+    def _placed(self, count):
+        """Move the first `count` queued blocks to their drop slots in the workspace map"""
+        if self.workspace is not None:
+            for pick, drop in self.queued_moves[:count]:
+                self.workspace.move(pick, drop)
+        del self.queued_moves[:count]
+    
+    def retire(self):
+        """Count the queued blocks the controller has finished since the last call, without waiting"""
+        if not self.queued_blocks:
+            return 0
+        current = self.motion.current_index()
+        completed = sum(1 for index in self.queued_blocks if index <= current)
+        del self.queued_blocks[:completed]
+        self._placed(completed)
+        return completed
+    
+    def enqueue_block(self, pick_pos, drop_pos):
+        """Queue the full pick-and-place sequence for one block without waiting
+
+        Returns the queue index of the block's last command; call flush()
+        to wait for everything queued so far.
+        """
+        return self.enqueue_plan(self.plan([(pick_pos, drop_pos)]))
+    
+    def flush(self):
+        """Wait for every queued block to finish and return how many completed"""
+        if self.queued_blocks:
+            self.motion.wait()
+        completed = len(self.queued_blocks)
+        self.queued_blocks = []
+        self._placed(completed)
+        self.review_actuations()
+        return completed
+    
+    def abort_queue(self):
+        """Drop queued commands, release the tool, lift clear and count finished blocks
+
+        Only blocks whose release the controller had finished when it was
+        stopped count as moved.
+        """
+        completed = 0
+        try:
+            current = self.motion.abort()
+            if current is not None:
+                completed = sum(1 for index in self.queued_blocks if index <= current)
+            self.effector.actuate(self.device, False)
+            self._dropped()
+            self.lift_clear()
+        except Exception as e:
+            self.log(f"  Error aborting queue: {e}")
+        self.queued_blocks = []
+        # A block dropped mid-move is put back at its source, so only finished ones moved
+        self._placed(completed)
+        self.queued_moves = []
+        self.actuations = {}
+        return completed
+    
+    def lift_clear(self):
+        """Rise straight up to safe_height from wherever the arm stopped"""
+        position = self.device.get_pose().position
+        self._speed(TRAVEL)
+        self.motion.move_to(position.x, position.y, max(position.z, self.safe_height), position.r, phase=LIFT)
+        self.motion.wait()
+    
+    def move_blocks_queued(self, moves, block_nums=None, operation=None):
+        """Queue a batch of (pick, drop) moves in one go and wait only at the end"""
+        plan = self.plan(moves)
+        self.log(f"  Planned {plan.summary(dwell=self.actuation_dwell)}")
+        try:
+            with self.tracer.span("batch", blocks=plan.blocks, moves=plan.moves):
+                self.enqueue_plan(plan, block_nums, operation)
+                self.log(f"  Queued {len(self.queued_blocks)} blocks, waiting for completion...")
+                return self.flush()
+        except Exception as e:
+            self.log(f"  Error in queued block sequence: {e}")
+            return self.abort_queue()
+    
+    def resume_pass(self, operation, moves):
+        """Drop moves an earlier run already finished and complete a block still held
+
+        Returns (remaining moves, blocks already done). Without a journal,
+        or with an empty one, every move is still to do.
+        """
+        if self.journal is None or not self.journal.events:
+            return moves, 0
+        source = AT_PICK if operation == "transfer" else AT_DROP
+        held = self.journal.held_block()
+        remaining = []
+        done = 0
+        for i, pick, drop in moves:
+            location, held_pass = self.journal.state(i)
+            if held == (operation, i):
+                self.log(f"  Resuming block {i} from its lift phase")
+                if self.finish_held_block(drop, i, operation):
+                    done += 1
+            elif location == source:
+                remaining.append((i, pick, drop))
+            elif location == HELD:
+                self.log(f"  Block {i} is held by an unfinished {held_pass} pass, skipping it")
+            else:
+                done += 1
+        if done:
+            self.log(f"  Journal: {done} blocks already done, {len(remaining)} to go")
+        return remaining, done
+    
+    def finish_held_block(self, drop_pos, block_num, operation):
+        """Carry a block still held after a crash from wherever the arm is to its drop"""
+        x, y, z, r = self._pose(drop_pos)
+        try:
+            position = self.device.get_pose().position
+            self._speed(CARRY)
+            self.motion.move_to(position.x, position.y, max(position.z, self.safe_height), r, phase=LIFT)
+            self.motion.move_to(x, y, self.safe_height, r, phase=TRAVERSE)
+            self._descend(x, y, z, r, PLACE)
+            self._actuate(False, block_num, RELEASE_PHASE)
+            self._checkpoint(block_num, RELEASED, operation)
+            self._speed(TRAVEL)
+            self.motion.move_to(x, y, self.safe_height, r, phase=LIFT)
+            self.motion.wait()
+            if self.workspace is not None:
+                self.workspace.add(x, y, z)
+            self.review_actuations()
+            return True
+        except Exception as e:
+            self.log(f"  Error finishing block {block_num}: {e}")
+            self.effector.actuate(self.device, False)
+            self._dropped()
+            return False
+    
+    def transfer_blocks(self):
+        """Transfer all blocks from source to destination"""
+        self.log("=== Starting Block Transfer ===")
+        successful_transfers = 0
+        
+        self.seed_workspace("pick")
+        with self.tracer.span("transfer", blocks=len(self.blocks)) as span:
+            moves = self.order_moves((block["pick"], block["drop"]) for block in self.blocks)
+            if self.precheck((pick, drop) for _, pick, drop in moves):
+                self.log("  Skipping pass: unreachable block positions")
+                moves = []
+            moves, successful_transfers = self.resume_pass("transfer", moves)
+            if self.pipelined:
+                successful_transfers += self.move_blocks_queued([(pick, drop) for _, pick, drop in moves],
+                                                                [i for i, _, _ in moves], "transfer")
+            else:
+                for i, pick, drop in moves:
+                    if self.move_block(pick, drop, i, "transfer"):
+                        successful_transfers += 1
+                    else:
+                        self.log(f"Failed to transfer block {i}")
+            span["completed"] = successful_transfers
+        if self.adaptive_dwell is not None:
+            self.adaptive_dwell.save()
+        self.tracer.count("blocks.completed", successful_transfers)
+        self.tracer.count("blocks.failed", len(self.blocks) - successful_transfers)
+        
+        self.log(f"\n=== Transfer Complete: {successful_transfers}/{len(self.blocks)} blocks transferred ===")
+        return successful_transfers
+    
+    def return_blocks(self):
+        """Return all blocks to their original positions"""
+        self.log("\n=== Returning Blocks to Original Positions ===")
+        successful_returns = 0
+        
+        self.seed_workspace("drop")
+        with self.tracer.span("return", blocks=len(self.blocks)) as span:
+            # For return operation: pick from drop position, drop at pick position
+            moves = self.order_moves((block["pick"], block["drop"]) for block in self.blocks.reversed())
+            if self.precheck((pick, drop) for _, pick, drop in moves):
+                self.log("  Skipping pass: unreachable block positions")
+                moves = []
+            moves, successful_returns = self.resume_pass("return", moves)
+            if self.pipelined:
+                successful_returns += self.move_blocks_queued([(pick, drop) for _, pick, drop in moves],
+                                                              [i for i, _, _ in moves], "return")
+            else:
+                for i, pick, drop in moves:
+                    if self.move_block(pick, drop, i, "return"):
+                        successful_returns += 1
+                    else:
+                        self.log(f"Failed to return block {i}")
+            span["completed"] = successful_returns
+        if self.adaptive_dwell is not None:
+            self.adaptive_dwell.save()
+        self.tracer.count("blocks.completed", successful_returns)
+        self.tracer.count("blocks.failed", len(self.blocks) - successful_returns)
+        
+        if self.journal is not None and self.journal.events and all(
+                self.journal.state(i)[0] == AT_PICK for i in range(1, len(self.blocks) + 1)):
+            self.journal.reset()  # every block is home again: the job is finished
+        
+        self.log(f"\n=== Return Complete: {successful_returns}/{len(self.blocks)} blocks returned ===")
+        return successful_returns
+    
+    def run_complete_cycle(self):
+        """Run complete palletization cycle (transfer + return)"""
+        self.log("=== DOBOT PALLETIZATION CYCLE ===")
+        start_time = time.time()
+        # Keep this cycle's records apart so export_trace() writes just this cycle
+        self.cycle_trace = self.tracer.add_sink(RingBufferSink())
+        
+        try:
+            # Transfer blocks
+            transferred = self.transfer_blocks()
+            
+            if transferred > 0:
+                # Pause between operations
+                self.log("\nPausing for 3 seconds before return operation...")
+                time.sleep(3)
+                
+                # Return blocks
+                returned = self.return_blocks()
+                
+                # Results
+                total_time = time.time() - start_time
+                self.log(f"\n=== CYCLE RESULTS ===")
+                self.log(f"Blocks transferred: {transferred}/{len(self.blocks)}")
+                self.log(f"Blocks returned: {returned}/{len(self.blocks)}")
+                self.log(f"Total cycle time: {total_time:.2f} seconds")
+                
+                return {"transferred": transferred, "returned": returned, "time": total_time}
+            else:
+                self.log("No blocks were transferred successfully. Skipping return operation.")
+                return None
+                
+        except Exception as e:
+            self.log(f"Error during cycle: {e}")
+            self.emergency_stop()
+            return None
+        finally:
+            self.tracer.remove_sink(self.cycle_trace)
+    
+    def run_transfer_only(self):
+        """Run only the transfer operation (no return)"""
+        self.log("=== DOBOT TRANSFER OPERATION ===")
+        start_time = time.time()
+        
+        try:
+            transferred = self.transfer_blocks()
+            transfer_time = time.time() - start_time
+            
+            self.log(f"\n=== TRANSFER RESULTS ===")
+            self.log(f"Blocks transferred: {transferred}/{len(self.blocks)}")
+            self.log(f"Transfer time: {transfer_time:.2f} seconds")
+            
+            return {"transferred": transferred, "time": transfer_time}
+            
+        except Exception as e:
+            self.log(f"Error during transfer: {e}")
+            self.emergency_stop()
+            return None
+    
+    def run_return_only(self):
+        """Run only the return operation (assumes blocks are already transferred)"""
+        self.log("=== DOBOT RETURN OPERATION ===")
+        start_time = time.time()
+        
+        try:
+            returned = self.return_blocks()
+            return_time = time.time() - start_time
+            
+            self.log(f"\n=== RETURN RESULTS ===")
+            self.log(f"Blocks returned: {returned}/{len(self.blocks)}")
+            self.log(f"Return time: {return_time:.2f} seconds")
+            
+            return {"returned": returned, "time": return_time}
+            
+        except Exception as e:
+            self.log(f"Error during return: {e}")
+            self.emergency_stop()
+            return None
+    
+    def _stream_reachable(self, pick, drop, label):
+        """Check a streamed block's pick, drop and the traverse height above them"""
+        points = [pick, drop] + [(x, y, self.safe_height, r) for x, y, _, r in (pick, drop)]
+        _, errors = inverse_kinematics_batch(points)
+        for index, reason in sorted(errors.items()):
+            x, y, z, _ = points[index]
+            self.log(f"  Skipping {label}: ({x:.1f}, {y:.1f}, {z:.1f}) is unreachable: {reason}")
+        return not errors
+    
+    def _enqueue_stream_steps(self, plan):
+        """Queue the steps added to a stream's running plan since the last call"""
+        self.enqueue_plan(plan, operation=STREAM)
+        # The plan keeps its position (the next block continues from there) but not its history
+        del plan.steps[:]
+        del plan.segments[:]
+    
+    def run_stream(self, moves, buffer_size=BUFFER_SIZE):
+        """Move blocks from a stream of (pick, drop) position dicts until it ends
+
+        moves       -- stream.MoveBuffer, or any iterable of records stream.parse_move
+                       accepts (JSON lines, dicts, pairs); an iterable is read on a
+                       background thread into a MoveBuffer of buffer_size moves, and a
+                       full buffer stops reading it (backpressure)
+        Pipelined, each block is planned onto one running trajectory that continues
+        from the previous drop and is queued while the arm still works on earlier
+        ones, so the arm stays busy for as long as targets arrive; the controller
+        queue bounds how far ahead it runs. When the stream runs dry and the arm
+        has caught up, it lifts clear and waits. Unreachable targets are skipped.
+        Streamed blocks are not journalled and use the fixed dwell.
+        Returns None if the source failed (read error, connection reset); the
+        blocks already queued are finished first.
+        """
+        if not isinstance(moves, MoveBuffer):
+            moves = MoveBuffer(moves, buffer_size)
+        self.log("=== DOBOT STREAM OPERATION ===")
+        start_time = time.time()
+        received = moved = failed = unreachable = 0
+        plan = None
+        # Whether the arm has lifted clear of the last drop since it was queued
+        parked = True
+        
+        with self.tracer.span("stream") as span:
+            try:
+                while True:
+                    try:
+                        if self.pipelined and not parked:
+                            move = moves.get(timeout=self.motion.poll_interval)
+                        else:
+                            move = moves.get(timeout=1.0)
+                    except queue.Empty:
+                        if self.pipelined and not parked:
+                            moved += self.retire()
+                            if not self.queued_blocks:
+                                # Nothing left to do: lift clear of the last drop while waiting
+                                self._enqueue_stream_steps(plan.finish())
+                                self.motion.wait()
+                                moved += self.flush()
+                                parked = True
+                        continue
+                    if move is None:
+                        break
+                    received += 1
+                    label = f"Stream block {received}"
+                    pick_pos, drop_pos = move
+                    pick, drop = self._pose(pick_pos), self._pose(drop_pos)
+                    if not self._stream_reachable(pick, drop, label):
+                        unreachable += 1
+                        continue
+                    
+                    if not self.pipelined:
+                        if self.move_block(pick_pos, drop_pos, None, STREAM, label):
+                            moved += 1
+                        else:
+                            failed += 1
+                        continue
+                    
+                    if plan is None:
+                        workspace = self.workspace.copy() if self.workspace is not None else None
+                        plan = TrajectoryPlan(safe_height=self.safe_height, clearance=self.clearance,
+                                              jump=self.jump, lead=self.on_the_fly, workspace=workspace)
+                    plan.add_block(pick, drop)
+                    self._enqueue_stream_steps(plan)
+                    parked = False
+                    self.log(f"  Queued {label}")
+                    moved += self.retire()
+                
+                if plan is not None:
+                    self._enqueue_stream_steps(plan.finish())
+                    moved += self.flush()
+            except Exception as e:
+                self.log(f"  Error in stream: {e}")
+                pending = len(self.queued_blocks)
+                completed = self.abort_queue()
+                moved += completed
+                failed += pending - completed
+            span["moved"] = moved
+        
+        stream_time = time.time() - start_time
+        rejected = unreachable + moves.rejected
+        self.tracer.count("blocks.completed", moved)
+        self.tracer.count("blocks.failed", failed)
+        self.log(f"\n=== STREAM RESULTS ===")
+        self.log(f"Blocks moved: {moved}/{received}")
+        if rejected:
+            self.log(f"Targets rejected: {rejected}")
+        self.log(f"Stream time: {stream_time:.2f} seconds")
+        if moves.error is not None:
+            self.log(f"Stream source failed after {received} targets: {moves.error}")
+            self.tracer.count("stream.errors")
+            return None
+        return {"received": received, "moved": moved, "failed": failed, "rejected": rejected,
+                "time": stream_time}
+    
+    def emergency_stop(self):
+        """Emergency stop - release the tool and stop operations"""
+        self.log("\n!!! EMERGENCY STOP !!!")
+        try:
+            if self.device:
+                self.effector.actuate(self.device, False)
+                self._dropped()
+                self.log(f"{self.effector.label} released")
+        except Exception as e:
+            self.log(f"Error during emergency stop: {e}")
+    
+    def go_to_safe_position(self):
+        """Move to a safe position"""
+        try:
+            self.log("Moving to safe position...")
+            # Move to center position at safe height
+            current = self.motion.target
+            self._speed(TRAVEL)
+            if self.workspace is not None and current is not None:
+                # Climb clear of the blocks before heading over them
+                self._climb(self.traverse_height(current, (300, 0, current[2])), 0, None)
+            self.motion.move_to(300, 0, self.safe_height, 0)
+            self.motion.wait()
+            self.log("Safe position reached")
+            return True
+        except Exception as e:
+            self.log(f"Error moving to safe position: {e}")
+            return False
+    
+    def disconnect(self):
+        """Safely disconnect from Dobot"""
+        try:
+            if self.device:
+                self.log("Disconnecting from Dobot...")
+                self.effector.actuate(self.device, False)  # Ensure the tool is off
+                self.go_to_safe_position()  # Move to safe position
+                self.device.close()
+                self.device = None
+                self.log("Dobot disconnected successfully")
+        except Exception as e:
+            self.log(f"Error during disconnect: {e}")
+        if self.journal is not None:
+            self.journal.close()
+        self.tracer.flush()
@@ -0,0 +1,170 @@
+import struct
+
+from pydobot.message import Message
+
+# Dobot frame: AA AA len id ctrl params... checksum, with len = 2 + len(params)
+HEADER = b"\xaa\xaa"
+OVERHEAD = 6
+MAX_FRAME = OVERHEAD + 255
+
+# Message ids of the commands a palletizing run repeats
+GET_POSE = 10
+GET_ALARMS = 20
+SUCTION_CUP = 62
+GRIPPER = 63
+PTP_CMD = 84
+WAIT_CMD = 110
+QUEUED_CMD_INDEX = 246
+
+# ctrl bits: 0x01 write, 0x02 queued
+CTRL_READ = 0x00
+CTRL_QUEUED = 0x03
+
+# Parameter layouts
+PTP_PARAMS = struct.Struct("<B4f")
+TOOL_PARAMS = struct.Struct("<BB")
+WAIT_PARAMS = struct.Struct("<I")
+POSE_REPLY = struct.Struct("<8f")
+INDEX_REPLY = struct.Struct("<I")
+
+# Frames written back to back in one write() at most; the controller reads its
+# serial line into a small buffer, so batches stay well short of the queue size
+MAX_BATCH = 8
+
+
+def checksum(view):
+    """Dobot checksum of the id + ctrl + params bytes"""
+    return -sum(view) & 0xFF
+
+
+class FrameWriter:
+    """Preallocated output buffer that frames are packed into back to back
+
+    Frames are encoded in place (no per-command Message or bytearray), and
+    everything added since the last take() goes out in one write().
+    """
+
+    def __init__(self, frames=MAX_BATCH):
+        self.buffer = bytearray(frames * MAX_FRAME)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.count = 0
+
+    def _frame(self, msg_id, ctrl, size):
+        start = self.length
+        end = start + OVERHEAD + size
+        if end > len(self.buffer):
+            raise ValueError("Frame buffer full; take() the pending frames first")
+        buffer = self.buffer
+        buffer[start] = buffer[start + 1] = 0xAA
+        buffer[start + 2] = 2 + size
+        buffer[start + 3] = msg_id
+        buffer[start + 4] = ctrl
+        return start, end
+
+    def _close(self, start, end):
+        self.buffer[end - 1] = checksum(self.view[start + 3:end - 1])
+        self.length = end
+        self.count += 1
+
+    def add(self, msg_id, ctrl, layout=None, *values):
+        """Encode one frame whose params are `values` packed with struct `layout`"""
+        start, end = self._frame(msg_id, ctrl, layout.size if layout is not None else 0)
+        if layout is not None:
+            layout.pack_into(self.buffer, start + 5, *values)
+        self._close(start, end)
+
+    def add_params(self, msg_id, ctrl, params=b""):
+        """Encode one frame with ready-made param bytes"""
+        start, end = self._frame(msg_id, ctrl, len(params))
+        self.buffer[start + 5:end - 1] = params
+        self._close(start, end)
+
+    def take(self):
+        """View of the pending frames (valid until the next add); resets the writer"""
+        pending = self.view[:self.length]
+        self.length = 0
+        self.count = 0
+        return pending
+
+
+class FrameReader:
+    """Read reply frames from a blocking serial port into one reused buffer
+
+    Replies are returned as (msg_id, params) with params a memoryview
+    into the buffer, valid until the next read.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.buffer = bytearray(MAX_FRAME)
+        self.view = memoryview(self.buffer)
+        self.dropped = 0
+
+    def _fill(self, start, end):
+        got = self.port.readinto(self.view[start:end])
+        if got != end - start:
+            raise TimeoutError("Dobot reply timed out")
+
+    def read(self):
+        """Next frame with a valid checksum; resynchronises on the header after noise"""
+        buffer = self.buffer
+        self._fill(0, 3)
+        while True:
+            if buffer[0] == 0xAA and buffer[1] == 0xAA:
+                end = 4 + buffer[2]
+                if buffer[2] >= 2:
+                    self._fill(3, end)
+                    if not sum(self.view[3:end]) & 0xFF:
+                        return buffer[3], self.view[5:end - 1]
+                # Bad length or checksum: skip the frame and look for the next header
+                self.dropped += 1
+                self._fill(0, 3)
+                continue
+            self.dropped += 1
+            buffer[0], buffer[1] = buffer[1], buffer[2]
+            self._fill(2, 3)
+
+    def read_reply(self, msg_id):
+        """Params of the next reply to `msg_id`, skipping stale replies to earlier requests"""
+        while True:
+            reply_id, params = self.read()
+            if reply_id == msg_id:
+                return params
+            self.dropped += 1
+
+
+class FrameParser:
+    """Incrementally split a byte stream into Dobot frames (AA AA len id ctrl params checksum)"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.dropped = 0
+
+    def feed(self, data):
+        """Add received bytes and return every complete, valid Message"""
+        self.buffer.extend(data)
+        messages = []
+        while True:
+            start = self.buffer.find(HEADER)
+            if start < 0:
+                # Keep a trailing 0xAA, it may be the first half of a header
+                keep = 1 if self.buffer.endswith(HEADER[:1]) else 0
+                self.dropped += len(self.buffer) - keep
+                del self.buffer[:len(self.buffer) - keep]
+                return messages
+            if start:
+                self.dropped += start
+                del self.buffer[:start]
+            if len(self.buffer) < 3:
+                return messages
+            end = 4 + self.buffer[2]
+            if len(self.buffer) < end:
+                return messages
+            if self.buffer[2] < 2 or sum(self.buffer[3:end]) & 0xFF:
+                # Bad length or checksum: resynchronise on the next header
+                self.dropped += 1
+                del self.buffer[:1]
+                continue
+            messages.append(Message(bytes(self.buffer[:end])))
+            del self.buffer[:end]
@@ -1,32 +1,150 @@
 from serial.tools import list_ports
 from pydobot import Dobot
+from pydobot.message import Message
+from concurrent.futures import ThreadPoolExecutor
+import json
+import serial
+import struct
 import time
 import os
 
-def find_dobot_ports():
+# Known arm ports, keyed by USB VID:PID:serial number
+CACHE_PATH = os.path.expanduser("~/.cache/dobot_ports.json")
+
+def _log(verbose, message):
+    if verbose:
+        print(message)
+
+def find_dobot_ports(verbose=True):
     """Find potential Dobot ports by looking for USB devices"""
     ports = list(list_ports.comports())
     
-    print("=== ALL DETECTED PORTS ===")
+    _log(verbose, "=== ALL DETECTED PORTS ===")
     for i, p in enumerate(ports):
-        print(f"{i}: {p.device} - {p.description} - {p.manufacturer}")
+        _log(verbose, f"{i}: {p.device} - {p.description} - {p.manufacturer}")
     
-    print("\n=== FILTERING FOR POTENTIAL DOBOT PORTS ===")
+    _log(verbose, "\n=== FILTERING FOR POTENTIAL DOBOT PORTS ===")
     potential_ports = []
     
     for p in ports:
         # Look for USB ports or ports with relevant keywords
         if any(keyword in str(p.description).lower() for keyword in ['usb', 'serial', 'ch340', 'ch341', 'ftdi', 'cp210']):
             potential_ports.append(p)
-            print(f"✓ Potential Dobot: {p.device} - {p.description}")
+            _log(verbose, f"✓ Potential Dobot: {p.device} - {p.description}")
         elif 'ttyUSB' in p.device or 'ttyACM' in p.device:
             potential_ports.append(p)
-            print(f"✓ USB Serial: {p.device} - {p.description}")
+            _log(verbose, f"✓ USB Serial: {p.device} - {p.description}")
         else:
-            print(f"✗ Unlikely: {p.device} - {p.description}")
+            _log(verbose, f"✗ Unlikely: {p.device} - {p.description}")
     
     return potential_ports
 
+def port_key(port):
+    """Cache key identifying the USB adapter behind a port, or None if it has no USB identity"""
+    if port.vid is None:
+        return None
+    return f"{port.vid:04X}:{port.pid:04X}:{port.serial_number or ''}"
+
+def handshake(port_device, timeout=0.5, baudrate=115200):
+    """Send one GetPose request and check for a well-formed reply
+
+    Much cheaper than constructing a Dobot (which resets the queue and
+    rewrites motion parameters). Returns (x, y, z, r); raises on timeout,
+    I/O errors or a malformed reply.
+    """
+    request = Message()
+    request.id = 10
+    with serial.Serial(port_device, baudrate=baudrate, timeout=timeout, write_timeout=timeout) as ser:
+        ser.reset_input_buffer()
+        ser.write(request.bytes())
+        deadline = time.monotonic() + timeout
+        data = bytearray()
+        while time.monotonic() < deadline:
+            data.extend(ser.read(max(ser.in_waiting, 1)))
+            start = data.find(b"\xaa\xaa")
+            if start < 0 or len(data) < start + 3:
+                continue
+            end = start + 4 + data[start + 2]
+            if len(data) < end:
+                continue
+            reply = data[start:end]
+            if reply[3] != 10 or sum(reply[3:]) & 0xFF or len(reply) < 22:
+                raise IOError(f"Unexpected reply {bytes(reply).hex()}")
+            return struct.unpack_from("<4f", reply, 5)
+    raise TimeoutError(f"No reply within {timeout}s")
+
+def probe_port(port_device, timeout=0.5):
+    """Handshake with one port; returns a result dict instead of raising"""
+    start = time.perf_counter()
+    try:
+        pose = handshake(port_device, timeout)
+        return {"device": port_device, "ok": True, "pose": pose, "error": None,
+                "latency": time.perf_counter() - start}
+    except Exception as e:
+        return {"device": port_device, "ok": False, "pose": None, "error": str(e),
+                "latency": time.perf_counter() - start}
+
+def probe_ports(port_devices, timeout=0.5, max_workers=8):
+    """Probe several ports concurrently, each bounded by its own timeout"""
+    port_devices = list(port_devices)
+    if not port_devices:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(port_devices))) as pool:
+        return list(pool.map(lambda device: probe_port(device, timeout), port_devices))
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, path=CACHE_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError:
+        pass  # the cache is only an optimisation
+
+def locate_dobots(ports=None, timeout=0.5, cache_path=CACHE_PATH, use_cache=True, verbose=False,
+                  all_ports=False):
+    """Return the devices of every port that answers as a Dobot
+
+    Ports whose USB identity is in the cache are tried first; if one of
+    them answers, the remaining ports are not probed at all. Otherwise all
+    candidate ports are probed in parallel and the cache is refreshed.
+
+    all_ports -- always probe every port (cached ones listed first), so newly
+                 attached arms are found too; for discovering a fleet
+    """
+    if ports is None:
+        ports = find_dobot_ports(verbose)
+    cache = load_cache(cache_path) if use_cache else {}
+    cached = [p.device for p in ports if port_key(p) in cache]
+    if cached and not all_ports:
+        found = [result["device"] for result in probe_ports(cached, timeout) if result["ok"]]
+        if found:
+            _log(verbose, f"Reconnected to cached Dobot port(s): {', '.join(found)}")
+            return found
+
+    devices = cached + [p.device for p in ports if p.device not in cached]
+    results = probe_ports(devices, timeout)
+    for result in results:
+        _log(verbose, f"{'✓' if result['ok'] else '✗'} {result['device']} "
+                      f"({result['latency'] * 1000:.0f} ms) {result['error'] or result['pose']}")
+    found = [result["device"] for result in results if result["ok"]]
+    if use_cache:
+        # Forget adapters that were just probed and did not answer
+        probed = {port_key(p) for p in ports}
+        cache = {key: value for key, value in cache.items() if key not in probed}
+        for p in ports:
+            key = port_key(p)
+            if key and p.device in found:
+                cache[key] = {"device": p.device, "description": p.description, "last_seen": time.time()}
+        save_cache(cache, cache_path)
+    return found
+
 def test_dobot_connection(port_device):
     """Test connection to a specific port"""
     print(f"\n=== TESTING CONNECTION TO {port_device} ===")
@@ -86,11 +204,12 @@ def main():
     
     print(f"\nFound {len(potential_ports)} potential port(s)")
     
-    # Test each potential port
+    # Probe every potential port at once (cached arm ports first)
+    found = locate_dobots(potential_ports, verbose=True)
     success = False
-    for port in potential_ports:
-        if test_dobot_connection(port.device):
-            print(f"\n🎉 SUCCESS! Dobot found on {port.device}")
+    for device in found:
+        if test_dobot_connection(device):
+            print(f"\n🎉 SUCCESS! Dobot found on {device}")
             success = True
             break
     
@@ -0,0 +1,126 @@
+from collections import namedtuple
+
+from trajectory import ACTUATE, DESCEND, GRAB, JUMP, MOVE, RELEASE, SETTLE, Step
+
+# Velocity and acceleration of a segment as % of the controller limits (SetPTPCommonParams ratios)
+SpeedProfile = namedtuple("SpeedProfile", ["velocity", "acceleration"])
+
+# Segment kinds
+TRAVEL = "travel"      # unloaded moves: approach, lift after a drop
+CARRY = "carry"        # moves with a block held: lift and traverse to the drop
+APPROACH = "approach"  # final approach onto a pick
+PLACE = "place"        # final approach onto a drop, carrying the block
+SEGMENTS = (TRAVEL, CARRY, APPROACH, PLACE)
+
+# Joint (deg/s, deg/s^2) and linear (mm/s, mm/s^2) limits the ratios apply to;
+# the controller boots with 200 for all four, as pydobot leaves them
+JOINT_VELOCITY = 300.0
+JOINT_ACCELERATION = 300.0
+LINEAR_VELOCITY = 300.0
+LINEAR_ACCELERATION = 300.0
+
+
+class SpeedProfiles:
+    """Per-segment velocity/acceleration for palletizing moves
+
+    Long moves run at full speed (`travel`), moves carrying a block with
+    gentler acceleration so it does not shift (`carry`), and the last
+    `approach_distance` mm onto a pick (`approach`) or drop (`place`)
+    slowly, for placement accuracy. Longer descents are split so only
+    that final stretch is slow.
+
+    The limits are set once when the palletizer connects (SetPTPJointParams
+    / SetPTPCoordinateParams); each profile change is one queued
+    SetPTPCommonParams command, so switching costs no host round trip
+    beyond the command itself.
+    """
+
+    def __init__(self, travel=(100, 100), carry=(100, 80), approach=(60, 60), place=(50, 50),
+                 approach_distance=5.0, joint_velocity=JOINT_VELOCITY,
+                 joint_acceleration=JOINT_ACCELERATION, linear_velocity=LINEAR_VELOCITY,
+                 linear_acceleration=LINEAR_ACCELERATION):
+        """Create a profile set
+
+        travel, carry, approach, place -- (velocity %, acceleration %) of each segment kind
+        approach_distance              -- length in mm of the slow final approach (0 disables
+                                          splitting: descents then run at travel/carry speed)
+        joint_velocity ...             -- controller limits the percentages are taken of
+        """
+        self.profiles = {TRAVEL: SpeedProfile(*travel), CARRY: SpeedProfile(*carry),
+                         APPROACH: SpeedProfile(*approach), PLACE: SpeedProfile(*place)}
+        self.approach_distance = approach_distance
+        self.joint_velocity = joint_velocity
+        self.joint_acceleration = joint_acceleration
+        self.linear_velocity = linear_velocity
+        self.linear_acceleration = linear_acceleration
+
+    def __getitem__(self, segment):
+        return self.profiles[segment]
+
+    def __repr__(self):
+        profiles = ", ".join(f"{segment}={tuple(profile)}" for segment, profile in self.profiles.items())
+        return f"SpeedProfiles({profiles}, approach_distance={self.approach_distance})"
+
+    def limits(self):
+        """(joint velocity, joint acceleration, linear velocity, linear acceleration)"""
+        return (self.joint_velocity, self.joint_acceleration, self.linear_velocity, self.linear_acceleration)
+
+    def descent(self, start_z, z, segment):
+        """[(z, profile)] moves for a straight descent from start_z onto a block at z
+
+        segment -- APPROACH or PLACE, the profile of the final stretch
+        """
+        loaded = CARRY if segment == PLACE else TRAVEL
+        distance = self.approach_distance
+        if not distance or distance <= 0:
+            return [(z, self.profiles[loaded])]
+        if start_z is None or start_z - z <= distance + 0.01:
+            return [(z, self.profiles[segment])]
+        return [(z + distance, self.profiles[loaded]), (z, self.profiles[segment])]
+
+    def profile_steps(self, steps, lead=None):
+        """Yield (step, profile) for the steps of a trajectory plan
+
+        profile is None for grab/release/settle steps. A move or jump that
+        ends on a block is split so its last approach_distance mm run at
+        the approach/place profile. With an on-the-fly lead the lead move
+        after the grab is that final approach, so the descent before it is
+        not split.
+        """
+        steps = list(steps)
+        loaded = False
+        position = None
+        for i, step in enumerate(steps):
+            if step.kind not in (MOVE, JUMP):
+                if step.kind == GRAB:
+                    loaded = True
+                elif step.kind == RELEASE:
+                    loaded = False
+                yield step, None
+                continue
+            following = steps[i + 1] if i + 1 < len(steps) else None
+            segment = None
+            if following is not None and (step.kind == JUMP or step.phase == DESCEND):
+                if following.kind == RELEASE:
+                    segment = PLACE
+                elif following.kind == GRAB and not lead:
+                    segment = APPROACH
+                elif following.kind == SETTLE and following.phase == ACTUATE:
+                    segment = APPROACH
+            if segment is None:
+                yield step, self.profiles[CARRY if loaded else TRAVEL]
+            elif step.kind == JUMP:
+                parts = self.descent(max(step.height, step.z), step.z, segment)
+                if len(parts) == 2:
+                    # Jump to just above the block, then finish the descent slowly
+                    yield step._replace(z=parts[0][0]), parts[0][1]
+                    yield Step(MOVE, step.x, step.y, step.z, step.r, None, DESCEND), parts[1][1]
+                else:
+                    yield step, parts[0][1]
+            else:
+                vertical = (position is not None and abs(position[0] - step.x) <= 0.01 and
+                            abs(position[1] - step.y) <= 0.01)
+                parts = self.descent(position[2] if vertical else None, step.z, segment)
+                for z, profile in parts:
+                    yield step._replace(z=z), profile
+            position = (step.x, step.y, step.z, step.r)
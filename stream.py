@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+# Moves buffered between the source and the palletizer; a full buffer stops
+# reading the source, so producers are throttled to the arm's pace
+BUFFER_SIZE = 8
+
+# Marks the end of the stream in a MoveBuffer
+_END = object()
+
+
+class StreamError(ValueError):
+    """Raised for a stream record that is not a valid pick/drop move"""
+    pass
+
+
+def _check_position(where, pos):
+    if not isinstance(pos, dict):
+        raise StreamError(f"{where}: expected an object with x, y, z")
+    for key in ("x", "y", "z"):
+        if key not in pos:
+            raise StreamError(f"{where}: missing {key!r}")
+    for key, value in pos.items():
+        if key not in ("x", "y", "z", "r"):
+            raise StreamError(f"{where}: unknown key {key!r}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise StreamError(f"{where}.{key}: expected a number, got {value!r}")
+    return pos
+
+
+def parse_move(record):
+    """(pick, drop) position dicts from a stream record, or None for a blank line
+
+    record -- a JSON line ({"pick": {"x": .., "y": .., "z": .., "r": ..}, "drop": {...}}),
+              the decoded object, or a (pick, drop) pair
+    """
+    if isinstance(record, bytes):
+        record = record.decode()
+    if isinstance(record, str):
+        record = record.strip()
+        if not record:
+            return None
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise StreamError(f"not JSON: {e}") from None
+    if isinstance(record, dict):
+        if "pick" not in record or "drop" not in record:
+            raise StreamError("expected {\"pick\": {...}, \"drop\": {...}}")
+        pick, drop = record["pick"], record["drop"]
+    elif isinstance(record, (tuple, list)) and len(record) == 2:
+        pick, drop = record
+    else:
+        raise StreamError(f"unexpected record {record!r}")
+    return _check_position("pick", pick), _check_position("drop", drop)
+
+
+class MoveBuffer:
+    """Bounded buffer between a source of moves and the palletizer
+
+    A background thread reads `source` (any iterable of records parse_move
+    accepts) and blocks once `maxsize` moves are waiting, so the source is
+    only read as fast as the arm consumes it. Invalid records are counted
+    in `rejected` and skipped.
+    """
+
+    def __init__(self, source, maxsize=BUFFER_SIZE, parse=parse_move):
+        self.source = source
+        self.parse = parse
+        self.queue = queue.Queue(maxsize)
+        self.read = 0
+        self.rejected = 0
+        self.last_error = None
+        self.error = None
+        self.finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name="move-buffer", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Poll so close() can end a producer waiting on a full buffer
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for record in self.source:
+                if self._stop.is_set():
+                    break
+                try:
+                    move = self.parse(record)
+                except StreamError as e:
+                    self.rejected += 1
+                    self.last_error = str(e)
+                    continue
+                if move is None:
+                    continue
+                self.read += 1
+                if not self._put(move):
+                    break
+        except Exception as e:
+            self.error = e  # reported as the end of the stream
+        finally:
+            self._put(_END)
+
+    def get(self, timeout=None):
+        """Next (pick, drop), or None once the stream has ended
+
+        Raises queue.Empty if nothing arrives within `timeout` seconds.
+        """
+        if self.finished:
+            return None
+        item = self.queue.get(timeout=timeout)
+        if item is _END:
+            self.finished = True
+            return None
+        return item
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def close(self):
+        """Stop reading the source (a blocked read of the source itself is left to finish)"""
+        self._stop.set()
+
+
+def tail_lines(path, poll_interval=0.2, stop=None):
+    """Yield lines as they are appended to a file, like tail -f (from its start)
+
+    stop -- optional threading.Event that ends the stream
+    """
+    partial = ""
+    with open(path) as f:
+        while stop is None or not stop.is_set():
+            line = f.readline()
+            if not line:
+                time.sleep(poll_interval)
+                continue
+            partial += line
+            if partial.endswith("\n"):
+                yield partial
+                partial = ""
+
+
+def socket_lines(path, stop=None, timeout=0.5):
+    """Yield lines sent by clients of a Unix socket listening at `path`, one client at a time
+
+    Lines are only read as they are consumed, so a client writing faster
+    than the arm works blocks once the socket buffers are full.
+    """
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from an earlier run
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen(1)
+        server.settimeout(timeout)
+        while stop is None or not stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            with conn, conn.makefile("r") as lines:
+                for line in lines:
+                    yield line
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def open_source(spec, stop=None):
+    """Records from a source spec: "-" (stdin JSON lines), "unix:PATH" (Unix socket),
+    "tail:PATH" (follow a file) or a file path (read once)
+    """
+    if spec == "-":
+        return sys.stdin
+    if spec.startswith("unix:"):
+        return socket_lines(spec[len("unix:"):], stop)
+    if spec.startswith("tail:"):
+        return tail_lines(spec[len("tail:"):], stop=stop)
+    with open(spec) as f:
+        return f.readlines()
+
+
+def main(argv=None):
+    import pydobot_gripper
+    import pydobot_suction
+    from dobot_sim import SimulatedDobot
+
+    palletizers = {"suction": pydobot_suction.DobotPalletizer, "gripper": pydobot_gripper.DobotPalletizer}
+    parser = argparse.ArgumentParser(description="Palletize pick/drop targets streamed as JSON lines")
+    parser.add_argument("source", help='"-" for stdin, unix:PATH for a socket, tail:PATH to follow a file, '
+                                       'or a file to read once')
+    parser.add_argument("--effector", choices=sorted(palletizers), default="suction")
+    parser.add_argument("--port", default="/dev/ttyACM0")
+    parser.add_argument("--sim", action="store_true", help="use the simulated Dobot")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="simulator speed-up factor")
+    parser.add_argument("--buffer", type=int, default=BUFFER_SIZE, help="moves buffered ahead of the arm")
+    parser.add_argument("--step", action="store_true", help="wait for each move instead of queueing ahead")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    device = SimulatedDobot(time_scale=args.time_scale) if args.sim else None
+    palletizer = palletizers[args.effector](port=args.port, device=device, pipelined=not args.step,
+                                            verbose=not args.quiet)
+    stop = threading.Event()
+    try:
+        results = palletizer.run_stream(open_source(args.source, stop), args.buffer)
+    except KeyboardInterrupt:
+        palletizer.emergency_stop()
+        results = None
+    finally:
+        stop.set()
+        palletizer.disconnect()
+    if results is not None:
+        print(json.dumps(results))
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() is not None else 1)
@@ -0,0 +1,204 @@
+import mmap
+import struct
+import threading
+import time
+from array import array
+
+from pydobot.message import Message
+
+# Values stored per sample: monotonic timestamp, pose and joint angles
+FIELDS = ("t", "x", "y", "z", "r", "j1", "j2", "j3", "j4")
+WIDTH = len(FIELDS)
+
+# Binary log layout: header, then fixed-size little-endian float64 records
+LOG_MAGIC = b"DPOS"
+LOG_HEADER = struct.Struct("<4sIIQ")
+LOG_HEADER_SIZE = 32
+LOG_RECORD = struct.Struct(f"<{WIDTH}d")
+
+
+class PoseRing:
+    """Fixed-size ring of pose samples stored in one preallocated array('d')
+
+    There is a single writer (the sampler thread). Readers never take a
+    lock: they copy a range of slots and then re-check the write counter,
+    discarding any samples the writer overwrote while they were copying.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.data = array("d", bytes(8 * WIDTH * capacity))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def write(self, values):
+        """Store one sample of WIDTH values (the writer thread only)"""
+        start = (self.count % self.capacity) * WIDTH
+        self.data[start:start + WIDTH] = values
+        # Publish only after the slot is complete
+        self.count += 1
+
+    def read(self, cursor=0):
+        """Copy every sample written since `cursor`
+
+        Returns (samples, next_cursor, dropped): samples is a flat
+        array('d') of WIDTH values per sample in write order, next_cursor
+        is passed to the following read, and dropped counts samples that
+        were overwritten before they could be read.
+        """
+        end = self.count
+        first = max(cursor, end - self.capacity)
+        samples = array("d")
+        for index in range(first, end):
+            start = (index % self.capacity) * WIDTH
+            samples.extend(self.data[start:start + WIDTH])
+        # Anything the writer lapped (or is writing now) during the copy is unreliable
+        valid = max(first, self.count + 1 - self.capacity)
+        if valid > first:
+            del samples[:(valid - first) * WIDTH]
+        return samples, end, valid - cursor
+
+    def latest(self):
+        """Most recent sample as a tuple, or None before the first write"""
+        while True:
+            count = self.count
+            if count == 0:
+                return None
+            start = ((count - 1) % self.capacity) * WIDTH
+            sample = tuple(self.data[start:start + WIDTH])
+            if self.count - count < self.capacity - 1:
+                return sample
+
+
+class PoseLog:
+    """Memory-mapped binary log holding the last `capacity` samples, written circularly"""
+
+    def __init__(self, path, capacity=100000):
+        self.path = path
+        self.capacity = capacity
+        size = LOG_HEADER_SIZE + LOG_RECORD.size * capacity
+        self.file = open(path, "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.count = 0
+        self._write_header()
+
+    def _write_header(self):
+        LOG_HEADER.pack_into(self.map, 0, LOG_MAGIC, WIDTH, self.capacity, self.count)
+
+    def write(self, values):
+        offset = LOG_HEADER_SIZE + (self.count % self.capacity) * LOG_RECORD.size
+        LOG_RECORD.pack_into(self.map, offset, *values)
+        self.count += 1
+        self._write_header()
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+def read_log(path):
+    """Samples from a PoseLog file as a list of tuples, oldest first"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, width, capacity, count = LOG_HEADER.unpack_from(data, 0)
+    if magic != LOG_MAGIC or width != WIDTH:
+        raise ValueError(f"{path} is not a pose log")
+    first = max(0, count - capacity)
+    return [LOG_RECORD.unpack_from(data, LOG_HEADER_SIZE + (index % capacity) * LOG_RECORD.size)
+            for index in range(first, count)]
+
+
+class PoseSampler:
+    """Sample the arm pose on a background thread into a PoseRing (and optionally a PoseLog)"""
+
+    def __init__(self, device, rate=None, capacity=4096, log_path=None, log_capacity=100000,
+                 clock=time.monotonic):
+        """Prepare a sampler; call start() to begin
+
+        rate     -- samples per second, or None to poll as fast as the link allows
+        capacity -- samples kept in memory
+        log_path -- optional file for a memory-mapped binary log
+        """
+        self.device = device
+        self.rate = rate
+        self.ring = PoseRing(capacity)
+        self.log = PoseLog(log_path, log_capacity) if log_path else None
+        self.clock = clock
+        self.errors = 0
+        self.started = None
+        self.stopped = None
+        self._stop = threading.Event()
+        self._thread = None
+        # Reuse one request frame; proxies without a raw link fall back to get_pose()
+        self._request = Message()
+        self._request.id = 10
+        self._raw = hasattr(device, "_send_command")
+
+    def _sample(self, values):
+        if self._raw:
+            reply = self.device._send_command(self._request)
+            values[1:] = array("d", struct.unpack_from("<8f", reply.params, 0))
+        else:
+            pose, joints = self.device.get_pose()
+            values[1:] = array("d", list(pose) + list(joints))
+        values[0] = self.clock()
+
+    def _run(self):
+        values = array("d", bytes(8 * WIDTH))
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_tick = self.clock()
+        while not self._stop.is_set():
+            try:
+                self._sample(values)
+            except Exception:
+                self.errors += 1
+                self._stop.wait(0.1)
+                continue
+            self.ring.write(values)
+            if self.log is not None:
+                self.log.write(values)
+            if interval:
+                next_tick += interval
+                delay = next_tick - self.clock()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    next_tick = self.clock()  # fell behind; don't try to catch up
+
+    def start(self):
+        self.started = self.clock()
+        self._thread = threading.Thread(target=self._run, name="pose-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = self.clock()
+        if self.log is not None:
+            self.log.close()
+
+    def latest(self):
+        """Most recent (t, x, y, z, r, j1, j2, j3, j4) sample, without blocking"""
+        return self.ring.latest()
+
+    def read(self, cursor=0):
+        """New samples since `cursor`; see PoseRing.read"""
+        return self.ring.read(cursor)
+
+    @property
+    def achieved_rate(self):
+        """Samples per second since start()"""
+        end = self.stopped or self.clock()
+        return self.ring.count / (end - self.started) if self.started and end > self.started else 0.0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,64 @@
+import sys
+
+import pytest
+
+from dobot_sim import SimulatedDobot
+
+if sys.platform == "win32":
+    collect_ignore_glob = ["test_*.py"]  # the fake serial device is a POSIX pseudo-terminal
+
+# Simulated seconds per wall-clock second: moves and dwells finish as soon as they
+# are queued, so a run only costs what the host side (serial, motion loop) costs
+INSTANT = 1e6
+
+
+class RecordingDobot(SimulatedDobot):
+    """SimulatedDobot that records what it executes
+
+    executed -- message id of every queued command run
+    visited  -- (x, y, z, r) target of every completed move
+    dwells   -- seconds of every queued wait (SetWAITCmd) run
+    busy     -- simulated seconds the controller spent executing
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executed = []
+        self.visited = []
+        self.dwells = []
+        self.busy = 0.0
+
+    def _finish(self, command):
+        super()._finish(command)
+        self.executed.append(command.msg_id)
+        if command.target is not None:
+            self.visited.append(command.target)
+        elif command.msg_id == 110:
+            self.dwells.append(command.duration)
+        self.busy += command.duration
+
+
+@pytest.fixture
+def serve():
+    """Factory serving a simulator on a pty: serve(sim=None) -> dobot_sim.SimulatedSerialPort
+
+    The default simulator has no serial latency and runs INSTANT times
+    faster than real time; replies are not held back.
+    """
+    from dobot_sim import SimulatedSerialPort
+
+    servers = []
+
+    def start(sim=None):
+        server = SimulatedSerialPort(sim or RecordingDobot(latency=0.0, time_scale=INSTANT), realtime=False)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def server(serve):
+    return serve()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+import tty
+
+import pytest
+from pydobot.dobot import DobotException
+
+from async_dobot import AsyncDobot, AsyncPalletizer, SerialTransport, SimulatedTransport, frame
+from conftest import INSTANT, RecordingDobot
+from journal import AT_PICK
+from protocol import FrameParser
+
+
+async def connect(sim):
+    device = AsyncDobot(SimulatedTransport(sim))
+    await device.initialize()
+    return device
+
+
+def test_cycle_runs_the_shared_palletizer_beside_telemetry(tmp_path):
+    sim = RecordingDobot(latency=0.0, time_scale=INSTANT)
+    poses = []
+
+    async def cycle():
+        device = await connect(sim)
+        palletizer = AsyncPalletizer(device, verbose=False, on_the_fly=15, workspace=True, speed_profiles=True,
+                                     journal=str(tmp_path / "job.journal"))
+        telemetry = asyncio.ensure_future(palletizer.watch_pose(0.001, poses.append))
+        try:
+            return palletizer, await palletizer.run_complete_cycle(pause=0)
+        finally:
+            telemetry.cancel()
+            await asyncio.gather(telemetry, return_exceptions=True)
+            await palletizer.disconnect()
+
+    palletizer, results = asyncio.run(cycle())
+    blocks = len(palletizer.blocks)
+    assert (results["transferred"], results["returned"]) == (blocks, blocks)
+    assert poses
+    engine = palletizer.palletizer
+    # Options reach the shared engine: on-the-fly switching and the workspace map were in use
+    assert engine.overlaps
+    assert engine.workspace is not None
+    assert all(engine.journal.state(block)[0] == AT_PICK for block in range(1, blocks + 1))
+    assert engine.journal.file.closed
+    assert not sim.alarms
+    assert not sim.suction
+
+
+def test_emergency_stop_unwinds_the_worker_thread():
+    sim = RecordingDobot(latency=0.0, time_scale=20)
+
+    async def cycle():
+        device = await connect(sim)
+        palletizer = AsyncPalletizer(device, verbose=False)
+        asyncio.get_running_loop().call_later(0.3, lambda: asyncio.ensure_future(palletizer.emergency_stop()))
+        try:
+            return palletizer, await palletizer.run_complete_cycle(pause=0)
+        finally:
+            await palletizer.disconnect()
+
+    palletizer, results = asyncio.run(cycle())
+    assert results is None
+    # The pass on the worker thread unwound through its own abort; only releases are left queued
+    assert palletizer.palletizer.queued_blocks == []
+    assert all(command.msg_id == 62 for command in sim.queue)
+
+
+def pose_reply(x):
+    return frame(10, params=struct.pack("<8f", x, 0, 0, 0, 0, 0, 0, 0))
+
+
+@pytest.fixture
+def pty_peer():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    yield master, os.ttyname(slave)
+    os.close(master)
+    os.close(slave)
+
+
+def test_serial_transport_drops_a_late_reply(pty_peer):
+    master, name = pty_peer
+    timeout = 0.1
+
+    def peer():
+        parser = FrameParser()
+        answered = 0
+        while answered < 2:
+            for _ in parser.feed(os.read(master, 4096)):
+                if answered == 0:
+                    time.sleep(timeout * 1.5)  # too late for the first request
+                os.write(master, pose_reply(float(answered + 1)).bytes())
+                answered += 1
+
+    async def exchange():
+        transport = SerialTransport(name, quiet=0.05)
+        device = AsyncDobot(transport, timeout=timeout)
+        try:
+            with pytest.raises(DobotException):
+                await device.get_pose()
+            pose = await device.get_pose()
+            return pose, transport.resyncs
+        finally:
+            transport.close()
+
+    thread = threading.Thread(target=peer, daemon=True)
+    thread.start()
+    pose, resyncs = asyncio.run(exchange())
+    thread.join(1.0)
+    # The late answer to the first request is not taken for the second one's
+    assert pose.position.x == 2.0
+    assert resyncs == 1
+
+
+def test_emergency_stop_during_the_pause_skips_the_return_pass():
+    sim = RecordingDobot(latency=0.0, time_scale=INSTANT)
+    returns = []
+
+    async def cycle():
+        device = await connect(sim)
+        palletizer = AsyncPalletizer(device, verbose=False)
+        palletizer.return_blocks = lambda: returns.append(True)
+        asyncio.get_running_loop().call_later(0.3, lambda: asyncio.ensure_future(palletizer.emergency_stop()))
+        start = time.monotonic()
+        try:
+            return await palletizer.run_complete_cycle(pause=5.0), time.monotonic() - start
+        finally:
+            await palletizer.disconnect()
+
+    results, elapsed = asyncio.run(cycle())
+    assert results is None
+    assert elapsed < 2.0
+    assert not returns
+
+
+def test_queued_dwell_and_wait_for_cmd():
+    sim = RecordingDobot(latency=0.0, time_scale=100.0)
+
+    async def run():
+        device = await connect(sim)
+        index = await device.dwell(5.0)  # 50 ms at 100x: outlasts the first poll
+        with pytest.raises(DobotException):
+            await device.wait_for_cmd(index, timeout=0.001)
+        await device.wait_for_cmd(index, timeout=1.0)
+        return index, await device.current_index()
+
+    index, current = asyncio.run(run())
+    assert current >= index
+    assert sim.dwells == [5.0]
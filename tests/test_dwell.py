@@ -0,0 +1,28 @@
+import json
+
+from dwell import GRAB, AdaptiveDwell
+
+
+def test_dwell_shrinks_backs_off_and_respects_floors():
+    dwell = AdaptiveDwell(path=None, confirm=2, step=0.5, margin=0.25, backoff=2.0)
+    for _ in range(4):
+        dwell.report("scope", 1, GRAB, True, 2.0)
+    assert dwell.dwell("scope", 1, GRAB, 2.0) == 0.5
+    assert dwell.dwell("scope", 1, GRAB, 2.0, floor=0.8) == 0.8
+    dwell.report("scope", 1, GRAB, False, 2.0)
+    # Backed off, and never again below the failing dwell plus the margin
+    assert dwell.dwell("scope", 1, GRAB, 2.0) == 1.0
+    for _ in range(10):
+        dwell.report("scope", 1, GRAB, True, 2.0)
+    assert dwell.dwell("scope", 1, GRAB, 2.0) == 0.625
+
+
+def test_save_to_a_bare_filename(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dwell = AdaptiveDwell("dwell.json")
+    for _ in range(dwell.confirm):
+        dwell.report("scope", 1, GRAB, True, 2.0)
+    dwell.save()
+    assert not dwell.dirty
+    assert json.loads((tmp_path / "dwell.json").read_text()) == dwell.entries
+    assert AdaptiveDwell("dwell.json").dwell("scope", 1, GRAB, 2.0) < 2.0
@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+import pydobot_suction
+from fleet import CollisionZone, FleetArm, FleetController, PalletJob
+from journal import layout_fingerprint
+
+BLOCKS = pydobot_suction.BLOCKS
+
+
+def test_job_footprint_covers_every_point():
+    job = PalletJob("job", BLOCKS)
+    xmin, ymin, xmax, ymax = job.footprint(offset=(0.0, 100.0), margin=10.0)
+    for block in BLOCKS:
+        for end in ("pick", "drop"):
+            assert xmin <= block[end]["x"] <= xmax
+            assert ymin <= block[end]["y"] + 100.0 <= ymax
+    assert CollisionZone("mid", xmin, ymin, xmax, ymax).overlaps(job.footprint(offset=(0.0, 100.0)))
+
+
+def visits(sim, pos):
+    """How many moves the simulated arm finished at a block position dict"""
+    return sum(1 for target in sim.visited if math.dist(target[:3], (pos["x"], pos["y"], pos["z"])) < 1e-3)
+
+
+def test_arm_switches_layout_between_jobs(server, tmp_path):
+    arm = FleetArm("arm1", port=server.name, journal=str(tmp_path / "arm1.journal"), workspace=True)
+    # The second pallet carries blocks 3 and 4 back, as its blocks 1 and 2
+    back = [{"pick": block["drop"], "drop": block["pick"]} for block in BLOCKS[2:]]
+    try:
+        assert arm.run(PalletJob("first", BLOCKS, "transfer")) == len(BLOCKS)
+        second = PalletJob("second", back, "transfer")
+        assert arm.run(second) == 2
+        palletizer = arm.palletizer
+        assert palletizer.journal.fingerprint == layout_fingerprint(second.blocks)
+        assert len(palletizer.workspace) == 2
+    finally:
+        arm.disconnect()
+    # The first job's journal did not mark them done: both were really carried back
+    assert all(visits(server.sim, block["pick"]) == 2 for block in BLOCKS[2:])
+
+
+def test_controller_runs_every_job(serve):
+    arms = [FleetArm(f"arm{i}", port=serve().name) for i in (1, 2)]
+    controller = FleetController(arms)
+    for i in range(4):
+        controller.submit(PalletJob(f"job{i}", BLOCKS, "transfer", arm="arm1" if i == 0 else None))
+    try:
+        stats = controller.run()
+    finally:
+        controller.disconnect()
+    assert stats["jobs"] == 4
+    assert stats["failed_jobs"] == 0
+    assert stats["blocks"] == 4 * len(BLOCKS)
+    with pytest.raises(ValueError):
+        controller.submit(PalletJob("stray", BLOCKS, arm="arm9"))
@@ -0,0 +1,31 @@
+import re
+
+import get_robot_position
+from dobot_sim import SimulatedDobot
+
+
+def test_prints_pose_over_serial(server, capsys):
+    get_robot_position.main(argv=["--port", server.name])
+    out = capsys.readouterr().out
+    assert "Dobot connected successfully!" in out
+    assert "Pose: Position(x=300.0, y=0.0, z=50.0, r=0.0)" in out
+
+
+def test_streams_pose_telemetry(server, capsys, tmp_path):
+    get_robot_position.main(argv=["--port", server.name, "--stream", "--duration", "0.3",
+                                  "--log", str(tmp_path / "pose.log")])
+    out = capsys.readouterr().out
+    match = re.search(r"Streamed (\d+) samples \((\d+) Hz, (\d+) errors\)", out)
+    assert match, out
+    assert int(match.group(1)) > 0
+    assert int(match.group(3)) == 0
+    assert (tmp_path / "pose.log").stat().st_size > 0
+
+
+def test_uses_an_injected_device(capsys):
+    get_robot_position.main(device=SimulatedDobot(pose=(250.0, 10.0, 20.0, 5.0)), argv=[])
+    assert "Pose: Position(x=250.0, y=10.0, z=20.0, r=5.0)" in capsys.readouterr().out
+
+
+def test_connect_sim_needs_no_port():
+    assert isinstance(get_robot_position.connect("unused", sim=True), SimulatedDobot)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import jobfile
+
+BLOCK = {"x": 288.34, "y": -41.49, "z": -41.33}
+
+JOB = """effector = "suction"
+
+[motion]
+safe_height = {safe_height}
+ordering = true
+
+[[blocks]]
+pick = {{ x = 288.34, y = -41.49, z = -41.33 }}
+drop = {{ x = 281.02, y = 93.43, z = -40.75 }}
+
+[[blocks]]
+pick = {{ x = 344.29, y = 22.79, z = -42.85 }}
+drop = {{ x = 332.51, y = 158.89, z = -42.41 }}
+"""
+
+
+def test_cache_is_reused_until_the_job_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "job.toml"
+    cache = str(tmp_path / "cache")
+    path.write_text(JOB.format(safe_height=50))
+    first = jobfile.load_job(str(path), cache_dir=cache)
+    assert os.listdir(cache) == [f"{first.digest}.json"]
+
+    # An unchanged file is served from the cache without compiling
+    def no_compile(*args, **kwargs):
+        raise AssertionError("compiled again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(jobfile, "compile_job", no_compile)
+        cached = jobfile.load_job(str(path), cache_dir=cache)
+    assert cached.as_dict() == first.as_dict()
+
+    # Editing the file gives a new key, and the new plan reflects the edit
+    path.write_text(JOB.format(safe_height=80))
+    edited = jobfile.load_job(str(path), cache_dir=cache)
+    assert edited.digest != first.digest
+    assert edited.motion["safe_height"] == 80
+    assert max(z for _, _, z, _ in edited.passes["transfer"]["plan"].waypoints()) == 80
+    assert len(os.listdir(cache)) == 2
+
+
+def test_damaged_cache_entry_is_recompiled(tmp_path):
+    path = tmp_path / "job.toml"
+    cache = tmp_path / "cache"
+    path.write_text(JOB.format(safe_height=50))
+    job = jobfile.load_job(str(path), cache_dir=str(cache))
+    (cache / f"{job.digest}.json").write_text("{not json")
+    assert jobfile.load_job(str(path), cache_dir=str(cache)).as_dict() == job.as_dict()
+
+
+@pytest.mark.parametrize("spec, where", [
+    ({"blocks": [1]}, "job.blocks[0]"),
+    ({"blocks": [{"pick": BLOCK, "drop": BLOCK}, "oops"]}, "job.blocks[1]"),
+    ({"blocks": [{"pick": BLOCK, "drop": BLOCK, "via": BLOCK}]}, "job.blocks[0]"),
+    ({"blocks": [{"pick": BLOCK}]}, "job.blocks[0].drop"),
+    ({"blocks": {"pick": BLOCK, "drop": BLOCK}}, "job.blocks"),
+    ({"pallet": [1]}, "job.pallet"),
+    ({"motion": 1, "blocks": [{"pick": BLOCK, "drop": BLOCK}]}, "job.motion"),
+])
+def test_malformed_entries_name_their_place(spec, where):
+    with pytest.raises(jobfile.JobFileError) as error:
+        jobfile.parse_job(spec)
+    assert str(error.value).startswith(f"{where}:")
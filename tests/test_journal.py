@@ -0,0 +1,128 @@
+import math
+
+import pytest
+
+import pydobot_suction
+from conftest import INSTANT, RecordingDobot
+from journal import AT_DROP, AT_PICK, DROPPED, GRABBED, HELD, RELEASED, JobJournal
+
+BLOCKS = pydobot_suction.BLOCKS
+
+
+def test_state_follows_each_blocks_events(tmp_path):
+    journal = JobJournal(str(tmp_path / "job.journal"), "layout")
+    journal.record("transfer", 1, GRABBED)
+    journal.record("transfer", 1, RELEASED)
+    journal.record("transfer", 2, GRABBED)
+    journal.record("transfer", 2, DROPPED)
+    journal.record("return", 1, GRABBED)
+    assert journal.state(1) == (HELD, "return")
+    assert journal.state(2) == (AT_PICK, None)
+    assert journal.state(3) == (AT_PICK, None)
+    assert journal.held_block() == ("return", 1)
+    journal.record("return", 1, DROPPED)
+    assert journal.state(1) == (AT_DROP, None)
+    assert journal.held_block() is None
+    journal.close()
+
+
+def test_reload_restores_state_and_drops_a_torn_write(tmp_path):
+    path = str(tmp_path / "job.journal")
+    journal = JobJournal(path, "layout")
+    for block in (1, 2):
+        journal.record("transfer", block, GRABBED)
+        journal.record("transfer", block, RELEASED)
+    journal.record("transfer", 3, GRABBED)
+    journal.close()
+    journal.close()  # closing twice is harmless
+    with open(path, "a") as f:
+        f.write('{"p":"transfer","b":3,"e":"rel')
+
+    journal = JobJournal(path, "layout")
+    assert [journal.state(block)[0] for block in (1, 2, 3, 4)] == [AT_DROP, AT_DROP, HELD, AT_PICK]
+    assert journal.held_block() == ("transfer", 3)
+    # Events recorded after resuming survive the next reload too
+    journal.record("transfer", 3, RELEASED)
+    journal.commit()
+    journal.record("transfer", 4, GRABBED)
+    journal.record("transfer", 4, RELEASED)
+    journal.close()
+
+    journal = JobJournal(path, "layout")
+    assert [journal.state(block)[0] for block in (1, 2, 3, 4)] == [AT_DROP] * 4
+    assert len(journal.events) == 8
+    journal.close()
+
+    # A journal written for another layout is not resumed
+    journal = JobJournal(path, "other")
+    assert journal.events == []
+    assert journal.state(1) == (AT_PICK, None)
+    assert journal.held_block() is None
+    journal.close()
+
+
+def test_held_block_is_the_last_grabbed(tmp_path):
+    journal = JobJournal(str(tmp_path / "job.journal"))
+    journal.record("transfer", 5, GRABBED)
+    journal.record("transfer", 2, GRABBED)
+    assert journal.held_block() == ("transfer", 2)
+    journal.record("transfer", 5, GRABBED)
+    assert journal.held_block() == ("transfer", 5)
+    journal.record("transfer", 5, RELEASED)
+    assert journal.held_block() == ("transfer", 2)
+    journal.reset()
+    assert journal.held_block() is None
+    journal.close()
+
+
+class CrashingDobot(RecordingDobot):
+    """Simulator whose host process dies as the arm lifts its `crash_after`-th grabbed block"""
+
+    def __init__(self, crash_after, **kwargs):
+        super().__init__(**kwargs)
+        self.crash_after = crash_after
+        self.grabs = 0
+
+    def _finish(self, command):
+        holding = self.suction
+        super()._finish(command)
+        if not holding and self.suction:
+            self.grabs += 1
+        elif command.target is not None and self.grabs == self.crash_after and self.suction:
+            self.crash_after = None
+            raise KeyboardInterrupt  # not an Exception: nothing on the host gets to clean up
+
+
+def test_rerun_resumes_after_a_crash(tmp_path):
+    path = str(tmp_path / "job.journal")
+    sim = CrashingDobot(3, latency=0.0, time_scale=INSTANT)
+    crashed = pydobot_suction.DobotPalletizer(device=sim, verbose=False, pipelined=False, journal=path)
+    with pytest.raises(KeyboardInterrupt):
+        crashed.transfer_blocks()
+    assert sim.suction
+
+    journal = JobJournal(path, crashed.journal.fingerprint)
+    assert [journal.state(block)[0] for block in (1, 2, 3, 4)] == [AT_DROP, AT_DROP, HELD, AT_PICK]
+    journal.close()
+
+    before = len(sim.visited)
+    palletizer = pydobot_suction.DobotPalletizer(device=sim, verbose=False, journal=path)
+    try:
+        assert sim.suction  # the held block is not let go of on connect
+        assert palletizer.transfer_blocks() == len(BLOCKS)
+        assert all(palletizer.journal.state(block)[0] == AT_DROP for block in (1, 2, 3, 4))
+    finally:
+        palletizer.disconnect()
+        crashed.journal.close()
+
+    rerun = sim.visited[before:]
+
+    def visited(pos):
+        return any(math.dist(target[:3], (pos["x"], pos["y"], pos["z"])) < 1e-3 for target in rerun)
+
+    # Finished blocks are left alone, the held one is carried on from its lift, the last one is moved
+    assert not any(visited(BLOCKS[i][end]) for i in (0, 1) for end in ("pick", "drop"))
+    assert not visited(BLOCKS[2]["pick"])
+    assert visited(BLOCKS[2]["drop"])
+    assert visited(BLOCKS[3]["pick"]) and visited(BLOCKS[3]["drop"])
+    assert not sim.suction
@@ -0,0 +1,46 @@
+import math
+import time
+
+import pytest
+from pydobot.message import Message
+
+from conftest import RecordingDobot
+from motion import FORCE_STOP_CMD_ID, MotionSequencer
+
+# About 0.7 s from the simulator's home pose
+TARGET = (300.0, 150.0, 50.0, 0.0)
+
+
+def stop_exec(device, msg_id):
+    msg = Message()
+    msg.id = msg_id
+    msg.ctrl = 0x01
+    device._send_command(msg)
+
+
+@pytest.mark.parametrize("msg_id", [241, FORCE_STOP_CMD_ID], ids=["plain", "force"])
+def test_simulated_stop_and_clear(msg_id):
+    sim = RecordingDobot(latency=0.0)
+    index = sim.move_to(*TARGET)
+    time.sleep(0.05)
+    stop_exec(sim, msg_id)
+    sim._set_queued_cmd_clear()
+    sim._set_queued_cmd_start_exec()
+    time.sleep(1.0)
+    # A plain stop lets the move in progress finish; a force stop halts the arm on the way
+    reached = sim._get_queued_cmd_current_index() >= index
+    assert reached == (msg_id == 241)
+    assert (math.dist(sim.get_pose().position[:3], TARGET[:3]) < 1e-3) == reached
+
+
+def test_abort_index_is_final():
+    sim = RecordingDobot(latency=0.0)
+    motion = MotionSequencer(sim)
+    index = motion.move_to(*TARGET)
+    time.sleep(0.05)
+    finished = motion.abort()
+    time.sleep(1.0)
+    # The move cut short is not reported done, and it never completes afterwards
+    assert finished < index
+    assert motion.current_index() == finished
+    assert sim.visited == []
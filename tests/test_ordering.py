@@ -0,0 +1,38 @@
+import itertools
+import random
+
+from ordering import BlockOrderer, stacking_dependencies
+
+
+def random_moves(count, seed):
+    rng = random.Random(seed)
+
+    def pose():
+        return (rng.uniform(200, 320), rng.uniform(-150, 150), -40.0, 0.0)
+
+    return [(pose(), pose()) for _ in range(count)]
+
+
+def test_exact_order_is_the_shortest_route():
+    orderer = BlockOrderer()
+    start = (300.0, 0.0, 50.0, 0.0)
+    for seed in range(3):
+        moves = random_moves(6, seed)
+        best = min(orderer.route_cost(moves, order, start) for order in itertools.permutations(range(6)))
+        assert orderer.route_cost(moves, orderer.order(moves, start=start), start) <= best + 1e-6
+
+
+def test_large_batches_improve_on_the_layout_order():
+    orderer = BlockOrderer(exact_limit=4)
+    moves = random_moves(30, 7)
+    order = orderer.order(moves)
+    assert sorted(order) == list(range(30))
+    assert orderer.route_cost(moves, order) < orderer.route_cost(moves, range(30))
+
+
+def test_stacked_drops_are_placed_bottom_up():
+    low = ((250.0, 100.0, -40.0, 0.0), (300.0, 0.0, -40.0, 0.0))
+    high = ((250.0, -100.0, -40.0, 0.0), (300.0, 0.0, -15.0, 0.0))
+    moves = [high, low]
+    assert stacking_dependencies(moves) == {0: {1}}
+    assert BlockOrderer().order(moves, start=high[0]) == [1, 0]
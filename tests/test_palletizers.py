@@ -0,0 +1,165 @@
+import math
+
+import pytest
+
+import pydobot_gripper
+import pydobot_suction
+from conftest import INSTANT, RecordingDobot
+from dwell import AdaptiveDwell
+
+# Module of each DobotPalletizer and the message id of its tool command
+PALLETIZERS = {"suction": (pydobot_suction, 62), "gripper": (pydobot_gripper, 63)}
+
+OPTIONS = {
+    "pipelined": {},
+    "step": {"pipelined": False},
+    "fast-protocol": {"fast_protocol": True},
+    "jump": {"jump": True},
+    "tuned": {"workspace": True, "on_the_fly": 15, "speed_profiles": True},
+}
+
+
+@pytest.fixture(params=sorted(PALLETIZERS))
+def effector(request):
+    return request.param
+
+
+def visits(sim, pose, tolerance=1e-3):
+    """Whether the simulated arm finished a move at (x, y, z) of `pose`"""
+    return any(math.dist(target[:3], pose[:3]) <= tolerance for target in sim.visited)
+
+
+@pytest.mark.parametrize("options", list(OPTIONS.values()), ids=list(OPTIONS))
+def test_transfer_and_return_move_every_block(server, effector, options):
+    module, tool = PALLETIZERS[effector]
+    palletizer = module.DobotPalletizer(port=server.name, verbose=False, **options)
+    try:
+        assert palletizer.transfer_blocks() == len(module.BLOCKS)
+        assert palletizer.return_blocks() == len(module.BLOCKS)
+        poses = [palletizer._pose(block[end]) for block in module.BLOCKS for end in ("pick", "drop")]
+    finally:
+        palletizer.disconnect()
+
+    sim = server.sim
+    assert not sim.alarms
+    assert sim.slip_count == 0
+    assert all(visits(sim, pose) for pose in poses)
+    # A grab and a release per block and pass, with the other tool never touched
+    assert sim.executed.count(tool) >= 4 * len(module.BLOCKS)
+    assert (63 if tool == 62 else 62) not in sim.executed
+    assert not (sim.suction or sim.gripper)
+    # disconnect() parks the arm at the safe position
+    assert math.dist(sim.position[:3], (300, 0, palletizer.safe_height)) < 1e-3
+
+
+def test_complete_cycle_reports_results(server, effector):
+    module, _ = PALLETIZERS[effector]
+    palletizer = module.DobotPalletizer(port=server.name, verbose=False)
+    try:
+        results = palletizer.run_complete_cycle()
+    finally:
+        palletizer.disconnect()
+    assert results["transferred"] == results["returned"] == len(module.BLOCKS)
+    assert results["time"] > 0
+
+
+def test_gripper_turns_to_block_rotation(server):
+    blocks = [{"pick": {"x": 290.0, "y": -40.0, "z": -40.0, "r": 30.0},
+               "drop": {"x": 280.0, "y": 90.0, "z": -40.0, "r": -15.0}}]
+    palletizer = pydobot_gripper.DobotPalletizer(port=server.name, verbose=False, blocks=blocks)
+    try:
+        assert palletizer.transfer_blocks() == 1
+    finally:
+        palletizer.disconnect()
+    rotations = {round(target[3], 3) for target in server.sim.visited}
+    assert {30.0, -15.0} <= rotations
+
+
+def test_unreachable_block_skips_the_pass(server, effector):
+    module, _ = PALLETIZERS[effector]
+    blocks = [{"pick": {"x": 600.0, "y": 0.0, "z": -40.0}, "drop": {"x": 280.0, "y": 90.0, "z": -40.0}}]
+    palletizer = module.DobotPalletizer(port=server.name, verbose=False, blocks=blocks)
+    try:
+        assert palletizer.transfer_blocks() == 0
+    finally:
+        palletizer.disconnect()
+    assert not server.sim.alarms
+    assert not visits(server.sim, (600.0, 0.0, -40.0))
+
+
+class StallingDobot(RecordingDobot):
+    """Controller that stops executing once the dwell after its `stall_after`-th release ends"""
+
+    def __init__(self, stall_after, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_after = stall_after
+        self.releases = 0
+
+    def _finish(self, command):
+        holding = self.suction
+        super()._finish(command)
+        if holding and not self.suction:
+            self.releases += 1
+        elif command.msg_id == 110 and self.releases == self.stall_after:
+            self.executing = False  # until the host restarts the queue
+
+
+def test_stalled_batch_counts_confirmed_blocks_and_lifts_clear(serve):
+    sim = StallingDobot(2, latency=0.0, time_scale=INSTANT)
+    server = serve(sim)
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, timeout=0.2)
+    try:
+        assert palletizer.transfer_blocks() == 2
+        assert palletizer.tracer.counters["motion.timeouts"] == 1
+        # Straight up from the second drop, with the tool off
+        drop = palletizer._pose(pydobot_suction.BLOCKS[1]["drop"])
+        assert math.dist(sim.visited[-1][:3], (drop[0], drop[1], palletizer.safe_height)) < 1e-3
+        assert palletizer.motion.target is not None
+        assert not sim.suction
+    finally:
+        palletizer.disconnect()
+
+
+def test_adaptive_dwell_needs_pick_feedback(server):
+    # pydobot over the pty reports no slips: without a pick_check nothing is learned
+    dwell = AdaptiveDwell(path=None)
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, adaptive_dwell=dwell)
+    try:
+        for _ in range(3):
+            palletizer.transfer_blocks()
+            palletizer.return_blocks()
+        assert dwell.entries == {}
+        waits = {round(seconds, 3) for seconds in server.sim.dwells}
+    finally:
+        palletizer.disconnect()
+    assert waits == {palletizer.actuation_dwell}
+
+
+def test_adaptive_dwell_shortens_with_pick_feedback(server):
+    dwell = AdaptiveDwell(path=None)
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, adaptive_dwell=dwell,
+                                                 pick_check=lambda block_num, action: True)
+    try:
+        for _ in range(3):
+            palletizer.transfer_blocks()
+            palletizer.return_blocks()
+        learned = dwell.dwell(palletizer.dwell_scope, 1, "grab", palletizer.actuation_dwell)
+    finally:
+        palletizer.disconnect()
+    assert learned < palletizer.actuation_dwell
+    assert palletizer.effector.latency <= min(server.sim.dwells) < palletizer.actuation_dwell
+
+
+def test_pipelined_pass_near_real_time_outlasts_the_command_timeout():
+    # Serial latency and a 10x clock: the batch runs for longer than any one command may take
+    sim = RecordingDobot(latency=0.002, time_scale=10.0)
+    palletizer = pydobot_suction.DobotPalletizer(device=sim, verbose=False, timeout=1.0)
+    try:
+        start = sim.now()
+        assert palletizer.transfer_blocks() == len(pydobot_suction.BLOCKS)
+        assert (sim.now() - start) / sim.time_scale > palletizer.timeout
+        assert palletizer.tracer.counters["motion.timeouts"] == 0
+    finally:
+        palletizer.disconnect()
+    assert sim.slip_count == 0
+    assert not sim.suction
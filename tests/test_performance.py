@@ -0,0 +1,113 @@
+"""Performance budgets, run against the simulator on a pty
+
+Host-side budgets (commands/s, wall time, memory) have several times
+headroom over a laptop run so they only trip on real regressions; set
+DOBOT_PERF_SLACK (e.g. 3) to loosen them on slow CI machines. The
+simulated cycle time is deterministic and budgeted tightly: it is what
+the arm would take, so planner regressions fail here first.
+"""
+import os
+import time
+import tracemalloc
+
+import pytest
+from pydobot import Dobot
+
+import pydobot_gripper
+import pydobot_suction
+from fast_dobot import FastDobot, command_rate
+
+pytestmark = pytest.mark.perf
+
+SLACK = float(os.environ.get("DOBOT_PERF_SLACK", "1"))
+
+# Minimum commands per second through the pty (measured ~7500 pydobot, ~11000 FastDobot)
+MIN_COMMAND_RATE = {Dobot: 1500, FastDobot: 2500}
+# FastDobot must stay ahead of pydobot on the hot commands (measured 1.4-1.6x)
+MIN_FAST_SPEEDUP = 1.15
+
+# Host wall seconds per transfer + return cycle with instant motion (measured 18 / 10-13 / 40-48 ms)
+MAX_CYCLE_WALL = {"pipelined": 0.1, "fast-protocol": 0.07, "step": 0.25}
+# Peak traced Python allocations over pipelined cycles (measured ~75 KiB)
+MAX_CYCLE_MEMORY = 512 * 1024
+# Simulated controller seconds per cycle with the default options (measured 65.22 / 64.19)
+MAX_SIMULATED_CYCLE = {"suction": 66.5, "gripper": 65.5}
+
+PALLETIZERS = {"suction": pydobot_suction, "gripper": pydobot_gripper}
+OPTIONS = {"pipelined": {}, "fast-protocol": {"fast_protocol": True}, "step": {"pipelined": False}}
+
+
+def run_cycle(palletizer):
+    """Transfer and return every block; returns the wall seconds taken"""
+    start = time.perf_counter()
+    assert palletizer.transfer_blocks() == len(palletizer.blocks)
+    assert palletizer.return_blocks() == len(palletizer.blocks)
+    return time.perf_counter() - start
+
+
+@pytest.fixture
+def palletizer(server):
+    """Factory for a connected DobotPalletizer on the pty, disconnected after the test"""
+    created = []
+
+    def make(effector, **options):
+        created.append(PALLETIZERS[effector].DobotPalletizer(port=server.name, verbose=False, **options))
+        return created[-1]
+
+    yield make
+    for palletizer in created:
+        palletizer.disconnect()
+
+
+@pytest.mark.parametrize("cls", [Dobot, FastDobot], ids=["pydobot", "fast"])
+def test_command_rate(server, cls):
+    device = cls(port=server.name)
+    try:
+        rates = command_rate(device, 200)
+    finally:
+        device.close()
+    for command, rate in rates.items():
+        assert rate * SLACK >= MIN_COMMAND_RATE[cls], f"{command}: {rate:.0f} commands/s"
+
+
+def test_fast_protocol_beats_pydobot(serve):
+    rates = {}
+    for cls in (Dobot, FastDobot):
+        device = cls(port=serve().name)
+        try:
+            # Best of three, so one scheduler hiccup does not decide it
+            rates[cls] = max(command_rate(device, 200)["move_to"] for _ in range(3))
+        finally:
+            device.close()
+    assert rates[FastDobot] >= MIN_FAST_SPEEDUP * rates[Dobot], rates
+
+
+@pytest.mark.parametrize("effector", sorted(PALLETIZERS))
+@pytest.mark.parametrize("mode", list(OPTIONS))
+def test_cycle_wall_time(palletizer, effector, mode):
+    pallet = palletizer(effector, **OPTIONS[mode])
+    run_cycle(pallet)  # warm up: plans, caches, first-use imports
+    wall = min(run_cycle(pallet) for _ in range(3))
+    assert wall <= MAX_CYCLE_WALL[mode] * SLACK, f"{wall:.3f}s per cycle"
+
+
+@pytest.mark.parametrize("effector", sorted(PALLETIZERS))
+def test_cycle_memory_high_water_mark(palletizer, effector):
+    pallet = palletizer(effector)
+    run_cycle(pallet)
+    tracemalloc.start()
+    try:
+        for _ in range(3):
+            run_cycle(pallet)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak <= MAX_CYCLE_MEMORY, f"{peak / 1024:.0f} KiB peak"
+
+
+@pytest.mark.parametrize("effector", sorted(PALLETIZERS))
+def test_simulated_cycle_time(server, palletizer, effector):
+    pallet = palletizer(effector)
+    server.sim.busy = 0.0
+    run_cycle(pallet)
+    assert server.sim.busy <= MAX_SIMULATED_CYCLE[effector], f"{server.sim.busy:.2f}s simulated"
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+from serial.tools.list_ports_common import ListPortInfo
+
+import pydobot_port
+from dobot_sim import HOME_POSE
+
+
+def port_info(device, description, vid=None, pid=None, serial_number=None):
+    info = ListPortInfo(device)
+    info.description = description
+    info.vid, info.pid, info.serial_number = vid, pid, serial_number
+    return info
+
+
+@pytest.fixture
+def silent_tty():
+    """A pty nothing answers on, like a serial adapter with no arm behind it"""
+    master, slave = os.openpty()
+    yield os.ttyname(slave)
+    os.close(master)
+    os.close(slave)
+
+
+@pytest.fixture
+def comports(monkeypatch):
+    """Set the ports list_ports.comports() reports: comports(*ListPortInfo)"""
+    def set_ports(*ports):
+        monkeypatch.setattr(pydobot_port.list_ports, "comports", lambda: list(ports))
+    return set_ports
+
+
+def test_find_dobot_ports_filters_usb_serial(comports):
+    usb = port_info("/dev/ttyUSB7", "USB2.0-Serial")
+    acm = port_info("/dev/ttyACM3", "n/a")
+    builtin = port_info("/dev/ttyS0", "n/a")
+    comports(builtin, usb, acm)
+    assert pydobot_port.find_dobot_ports(verbose=False) == [usb, acm]
+
+
+def test_find_dobot_ports_lists_every_port(comports, capsys):
+    comports(port_info("/dev/ttyS0", "n/a"))
+    assert pydobot_port.find_dobot_ports() == []
+    assert "✗ Unlikely: /dev/ttyS0" in capsys.readouterr().out
+
+
+def test_handshake_reads_the_pose(server):
+    assert pydobot_port.handshake(server.name) == pytest.approx(HOME_POSE)
+
+
+def test_probe_times_out_on_a_silent_port(silent_tty):
+    result = pydobot_port.probe_port(silent_tty, timeout=0.2)
+    assert not result["ok"]
+    assert "No reply" in result["error"]
+
+
+def test_locate_dobots_finds_the_arm_and_caches_it(server, silent_tty, comports, tmp_path):
+    arm = port_info(server.name, "USB Serial", vid=0x1A86, pid=0x7523, serial_number="A1")
+    other = port_info(silent_tty, "USB Serial", vid=0x0403, pid=0x6001)
+    comports(other, arm)
+    cache_path = str(tmp_path / "ports.json")
+
+    ports = pydobot_port.find_dobot_ports(verbose=False)
+    assert pydobot_port.locate_dobots(ports, timeout=0.2, cache_path=cache_path) == [server.name]
+    assert set(pydobot_port.load_cache(cache_path)) == {"1A86:7523:A1"}
+
+    # The cached adapter is tried first, so the silent one is not probed again
+    requests = server.requests
+    assert pydobot_port.locate_dobots(ports, timeout=0.2, cache_path=cache_path) == [server.name]
+    assert server.requests == requests + 1
+
+
+def test_locate_dobots_all_ports_finds_new_arms(serve, comports, tmp_path):
+    first, second = serve(), serve()
+    known = port_info(first.name, "USB Serial", vid=0x1A86, pid=0x7523, serial_number="A1")
+    new = port_info(second.name, "USB Serial", vid=0x1A86, pid=0x7523, serial_number="B2")
+    cache_path = str(tmp_path / "ports.json")
+    comports(known)
+    pydobot_port.locate_dobots(pydobot_port.find_dobot_ports(verbose=False), timeout=0.2, cache_path=cache_path)
+
+    # A second arm is plugged in: the fast path stops at the cached one, discovery finds both
+    comports(new, known)
+    ports = pydobot_port.find_dobot_ports(verbose=False)
+    assert pydobot_port.locate_dobots(ports, timeout=0.2, cache_path=cache_path) == [first.name]
+    assert pydobot_port.locate_dobots(ports, timeout=0.2, cache_path=cache_path,
+                                      all_ports=True) == [first.name, second.name]
+    assert set(pydobot_port.load_cache(cache_path)) == {"1A86:7523:A1", "1A86:7523:B2"}
@@ -0,0 +1,169 @@
+import json
+import math
+import socket
+import threading
+import time
+
+import pytest
+
+import pydobot_gripper
+import pydobot_suction
+import stream
+
+PALLETIZERS = {"suction": pydobot_suction, "gripper": pydobot_gripper}
+OPTIONS = {"pipelined": {}, "step": {"pipelined": False}, "tuned": {"on_the_fly": 15, "speed_profiles": True}}
+
+A = {"x": 288.34, "y": -41.49, "z": -41.33}
+B = {"x": 281.02, "y": 93.43, "z": -40.75}
+
+
+def record(pick, drop):
+    return json.dumps({"pick": pick, "drop": drop}) + "\n"
+
+
+def test_parse_move_accepts_lines_objects_and_pairs():
+    assert stream.parse_move(record(A, B)) == (A, B)
+    assert stream.parse_move(record(A, B).encode()) == (A, B)
+    assert stream.parse_move({"pick": A, "drop": B}) == (A, B)
+    assert stream.parse_move((A, B)) == (A, B)
+    assert stream.parse_move("  \n") is None
+
+
+@pytest.mark.parametrize("bad", [
+    "{not json",
+    '{"pick": {"x": 1, "y": 2, "z": 3}}',
+    '{"pick": {"x": 1, "y": 2}, "drop": {"x": 1, "y": 2, "z": 3}}',
+    '{"pick": {"x": 1, "y": 2, "z": "3"}, "drop": {"x": 1, "y": 2, "z": 3}}',
+    '{"pick": {"x": 1, "y": 2, "z": 3, "w": 0}, "drop": {"x": 1, "y": 2, "z": 3}}',
+    "[1, 2, 3]",
+])
+def test_parse_move_rejects_malformed_records(bad):
+    with pytest.raises(stream.StreamError):
+        stream.parse_move(bad)
+
+
+def test_move_buffer_reads_only_as_fast_as_it_is_consumed():
+    pulled = []
+
+    def source():
+        for i in range(20):
+            pulled.append(i)
+            yield (A, B)
+
+    moves = stream.MoveBuffer(source(), maxsize=3)
+    try:
+        time.sleep(0.3)
+        # A full buffer, plus the record the producer is waiting to put
+        assert len(moves) == 3
+        assert len(pulled) <= 4
+        assert moves.get(timeout=1.0) == (A, B)
+        received = 1
+        while moves.get(timeout=1.0) is not None:
+            received += 1
+        assert received == 20
+    finally:
+        moves.close()
+
+
+def test_move_buffer_counts_rejected_records():
+    moves = stream.MoveBuffer([record(A, B), "oops\n", "\n", record(B, A)])
+    assert moves.get(timeout=1.0) == (A, B)
+    assert moves.get(timeout=1.0) == (B, A)
+    assert moves.get(timeout=1.0) is None
+    assert moves.get() is None
+    assert (moves.read, moves.rejected) == (2, 1)
+    assert moves.last_error.startswith("not JSON")
+
+
+def test_socket_lines_serves_each_client(tmp_path):
+    path = str(tmp_path / "moves.sock")
+    stop = threading.Event()
+    moves = stream.MoveBuffer(stream.open_source(f"unix:{path}", stop))
+    try:
+        for lines in ([record(A, B), record(B, A)], [record(A, B)]):
+            deadline = time.monotonic() + 5
+            while True:
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    client.connect(path)
+                    break
+                except OSError:
+                    client.close()
+                    assert time.monotonic() < deadline, "socket never came up"
+                    time.sleep(0.05)
+            with client:
+                client.sendall("".join(lines).encode())
+        assert [moves.get(timeout=2.0) for _ in range(3)] == [(A, B), (B, A), (A, B)]
+    finally:
+        stop.set()
+        moves.close()
+
+
+@pytest.mark.parametrize("effector", sorted(PALLETIZERS))
+@pytest.mark.parametrize("options", list(OPTIONS.values()), ids=list(OPTIONS))
+def test_run_stream_moves_every_reachable_block(server, effector, options):
+    far = {"x": 600.0, "y": 0.0, "z": -40.0}
+    lines = [record(A, B), "garbage\n", record(B, A), record(far, A), record(A, B)]
+    palletizer = PALLETIZERS[effector].DobotPalletizer(port=server.name, verbose=False, **options)
+    try:
+        results = palletizer.run_stream(lines, buffer_size=2)
+    finally:
+        palletizer.disconnect()
+
+    assert (results["received"], results["moved"], results["failed"]) == (4, 3, 0)
+    assert results["rejected"] == 2
+    sim = server.sim
+    assert not sim.alarms
+    assert sim.slip_count == 0
+    assert not (sim.suction or sim.gripper)
+    assert not any(math.dist(target[:2], (600.0, 0.0)) < 1 for target in sim.visited)
+
+
+def test_run_stream_lifts_clear_while_waiting(server):
+    parked = []
+
+    def trickle():
+        yield record(A, B)
+        time.sleep(1.5)
+        parked.append(server.sim.visited[-1])
+        yield record(B, A)
+
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False)
+    try:
+        results = palletizer.run_stream(trickle())
+    finally:
+        palletizer.disconnect()
+    assert results["moved"] == 2
+    # Before the second target arrives the arm waits at safe_height above the first drop
+    assert math.dist(parked[0][:3], (B["x"], B["y"], palletizer.safe_height)) < 1e-3
+
+
+def test_cli_reads_a_file(tmp_path, capsys):
+    path = tmp_path / "moves.jsonl"
+    path.write_text(record(A, B) + record(B, A))
+    results = stream.main([str(path), "--sim", "--time-scale", "1000", "--quiet"])
+    assert (results["received"], results["moved"]) == (2, 2)
+    assert json.loads(capsys.readouterr().out)["moved"] == 2
+
+
+def test_run_stream_reports_a_failed_source(server):
+    def dropped_connection():
+        yield record(A, B)
+        raise ConnectionResetError("client went away")
+
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False)
+    try:
+        assert palletizer.run_stream(dropped_connection()) is None
+        assert palletizer.tracer.counters["stream.errors"] == 1
+    finally:
+        palletizer.disconnect()
+    # The block received before the failure was still placed
+    assert any(math.dist(target[:3], (B["x"], B["y"], B["z"])) < 1e-3 for target in server.sim.visited)
+
+
+def test_scripts_reject_an_unknown_operation(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        pydobot_suction.main(["--sim", "--operation", "everything"])
+    assert exit_info.value.code == 2
+    assert "invalid choice" in capsys.readouterr().err
+    assert pydobot_suction.parse_args(["--operation", "return"]).operation == "return"
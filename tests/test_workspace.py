@@ -0,0 +1,66 @@
+import pytest
+
+import pydobot_suction
+from pallet import PalletLayout
+from workspace import HeightMap
+
+BLOCKS = pydobot_suction.BLOCKS
+
+
+def poses(end):
+    return [(block[end]["x"], block[end]["y"], block[end]["z"]) for block in BLOCKS]
+
+
+def test_leg_height_clears_blocks_under_the_path():
+    heights = HeightMap(margin=10.0)
+    heights.add(300.0, 0.0, -40.0)
+    # Over the block: its top plus the margin, plus a block height when carrying one
+    assert heights.leg_height((300.0, -100.0, -40.0), (300.0, 100.0, -40.0)) == pytest.approx(-30.0)
+    assert heights.leg_height((300.0, -100.0, -40.0), (300.0, 100.0, -40.0), loaded=True) == pytest.approx(-5.0)
+    assert heights.leg_height((300.0, -100.0, -40.0), (300.0, 100.0, -40.0), ceiling=-35.0) == -35.0
+    assert heights.remove(300.0, 0.0, -40.0)
+    assert not heights.remove(300.0, 0.0, -40.0)
+    assert heights.highest((300.0, -100.0), (300.0, 100.0)) is None
+
+
+def test_load_places_blocks_where_they_stand():
+    layout = PalletLayout.from_blocks(BLOCKS)
+    heights = HeightMap().load(layout, lambda block_num: "drop" if block_num == 1 else "pick")
+    assert len(heights) == len(BLOCKS)
+    assert heights.remove(*poses("drop")[0])
+    assert not heights.remove(*poses("pick")[0])
+
+
+@pytest.mark.parametrize("options", [{}, {"pipelined": False}], ids=["pipelined", "step"])
+def test_return_only_seeds_the_map_with_blocks_at_their_drops(server, options):
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, workspace=True, **options)
+    try:
+        assert palletizer.workspace is None  # nothing known until a pass says where the blocks are
+        assert palletizer.run_return_only()["returned"] == len(BLOCKS)
+        heights = palletizer.workspace
+    finally:
+        palletizer.disconnect()
+    # Every block went from its drop back to its pick, with none left behind or doubled up
+    assert len(heights) == len(BLOCKS)
+    assert all(heights.remove(*pick) for pick in poses("pick"))
+    assert not any(heights.remove(*drop) for drop in poses("drop"))
+    assert len(heights) == 0
+
+
+def test_journal_seeds_the_map(server, tmp_path):
+    journal = str(tmp_path / "job.journal")
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, journal=journal)
+    try:
+        assert palletizer.transfer_blocks() == len(BLOCKS)
+    finally:
+        palletizer.disconnect()
+
+    # A return-only run with the journal takes the block positions from it, not the pass
+    palletizer = pydobot_suction.DobotPalletizer(port=server.name, verbose=False, journal=journal, workspace=True)
+    try:
+        palletizer.seed_workspace("pick")
+        heights = palletizer.workspace.copy()
+    finally:
+        palletizer.disconnect()
+    assert all(heights.remove(*drop) for drop in poses("drop"))
+    assert len(heights) == 0
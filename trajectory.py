@@ -0,0 +1,219 @@
+import math
+from collections import namedtuple
+
+# Step kinds
+MOVE = "move"
+JUMP = "jump"
+GRAB = "grab"
+RELEASE = "release"
+# Controller-side wait after an on-the-fly grab/release (height holds the lead in mm)
+SETTLE = "settle"
+
+# pydobot's default PTP coordinate parameters (mm/s, mm/s^2)
+DEFAULT_VELOCITY = 200.0
+DEFAULT_ACCELERATION = 200.0
+
+# Moves the hand-written move_block sequence issues per block
+NAIVE_MOVES_PER_BLOCK = 6
+
+# Cycle phases steps are attributed to
+APPROACH = "approach"
+DESCEND = "descend"
+ACTUATE = "actuate"
+LIFT = "lift"
+TRAVERSE = "traverse"
+RELEASE_PHASE = "release"
+PHASES = (APPROACH, DESCEND, ACTUATE, LIFT, TRAVERSE, RELEASE_PHASE)
+
+Step = namedtuple("Step", ["kind", "x", "y", "z", "r", "height", "phase"])
+
+
+def segment_time(distance, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION):
+    """Time for a point-to-point move under a trapezoidal velocity profile"""
+    if distance <= 0:
+        return 0.0
+    if distance >= velocity * velocity / acceleration:
+        return distance / velocity + velocity / acceleration
+    return 2.0 * math.sqrt(distance / acceleration)
+
+
+class TrajectoryPlan:
+    """Minimal waypoint sequence for a list of pick-and-place moves"""
+
+    def __init__(self, safe_height=50, clearance=None, jump=False, tolerance=0.01, lead=None,
+                 workspace=None):
+        """Create an empty plan
+
+        safe_height -- absolute z every traverse is capped at
+        clearance   -- per-leg height above the higher endpoint; None keeps
+                       every traverse at safe_height
+        jump        -- use single JUMP (arc) moves instead of lift/traverse/descend
+        tolerance   -- waypoints closer than this (mm) are treated as the same
+        lead        -- pick/place on the fly: switch the tool `lead` mm above the pick
+                       and lift `lead` mm off the drop before the settle wait, so the
+                       tool's switching time overlaps the motion
+        workspace   -- optional workspace.HeightMap of the blocks standing at the start
+                       of the plan; each traverse then only clears what is under it
+                       (overrides clearance). The plan updates it as blocks move.
+        """
+        self.safe_height = safe_height
+        self.clearance = clearance
+        self.jump = jump
+        self.tolerance = tolerance
+        self.lead = lead or None
+        self.workspace = workspace
+        self.steps = []
+        self.segments = []
+        self.position = None
+        self.blocks = 0
+
+    @property
+    def distance(self):
+        """Total planned end effector travel in mm"""
+        return sum(self.segments)
+
+    @property
+    def moves(self):
+        """Number of motion commands in the plan"""
+        return sum(1 for step in self.steps if step.kind in (MOVE, JUMP))
+
+    @property
+    def merged(self):
+        """Motion commands saved against the naive per-block sequence"""
+        # On the fly adds the short lead moves the naive sequence would need too
+        naive = NAIVE_MOVES_PER_BLOCK + (2 if self.lead else 0)
+        return naive * self.blocks - self.moves
+
+    def leg_height(self, start, end, loaded=False):
+        """Clearance height for a traverse between two points"""
+        if start is None:
+            return self.safe_height
+        if self.workspace is not None:
+            return self.workspace.leg_height(start, end, loaded, ceiling=self.safe_height)
+        if self.clearance is None:
+            return self.safe_height
+        return min(self.safe_height, max(start[2], end[2]) + self.clearance)
+
+    def _same(self, a, b):
+        return (a is not None and
+                abs(a[0] - b[0]) <= self.tolerance and
+                abs(a[1] - b[1]) <= self.tolerance and
+                abs(a[2] - b[2]) <= self.tolerance and
+                abs(a[3] - b[3]) <= self.tolerance)
+
+    def _move(self, x, y, z, r, phase):
+        target = (x, y, z, r)
+        if self._same(self.position, target):
+            return
+        if self.position is not None:
+            self.segments.append(math.dist(self.position[:3], target[:3]))
+        self.steps.append(Step(MOVE, x, y, z, r, None, phase))
+        self.position = target
+
+    def travel_to(self, target, loaded=False):
+        """Move from the current position down onto `target` (x, y, z, r)
+
+        loaded marks a leg carrying a block, which is attributed to the
+        lift/traverse phases rather than the approach phase.
+        """
+        x, y, z, r = target
+        lift, traverse = (LIFT, TRAVERSE) if loaded else (APPROACH, APPROACH)
+        height = self.leg_height(self.position, target, loaded)
+
+        if self.jump and self.position is not None and not self._same(self.position, target):
+            start = self.position
+            self.segments.append(max(height - start[2], 0))
+            self.segments.append(math.dist(start[:2], target[:2]))
+            self.segments.append(max(height - z, 0))
+            self.steps.append(Step(JUMP, x, y, z, r, height, traverse))
+            self.position = target
+            return
+
+        if self.position is not None:
+            self._move(self.position[0], self.position[1], max(self.position[2], height), self.position[3], lift)
+        self._move(x, y, height, r, traverse)
+        self._move(x, y, z, r, DESCEND)
+
+    def add_block(self, pick, drop):
+        """Append one pick-and-place move given (x, y, z, r) tuples"""
+        if self.workspace is not None:
+            # Plan the loaded leg without the block being carried standing in the way
+            self.workspace.remove(*pick[:3])
+        if self.lead is None:
+            self.travel_to(pick)
+            self.steps.append(Step(GRAB, *pick, None, ACTUATE))
+            self.travel_to(drop, loaded=True)
+            self.steps.append(Step(RELEASE, *drop, None, RELEASE_PHASE))
+        else:
+            x, y, z, r = pick
+            self.travel_to((x, y, z + self.lead, r))
+            self.steps.append(Step(GRAB, *pick, None, ACTUATE))
+            self._move(x, y, z, r, DESCEND)
+            self.steps.append(Step(SETTLE, *pick, self.lead, ACTUATE))
+            x, y, z, r = drop
+            self.travel_to(drop, loaded=True)
+            self.steps.append(Step(RELEASE, *drop, None, RELEASE_PHASE))
+            self._move(x, y, z + self.lead, r, LIFT)
+            self.steps.append(Step(SETTLE, *drop, self.lead, RELEASE_PHASE))
+        if self.workspace is not None:
+            self.workspace.add(*drop[:3])
+        self.blocks += 1
+
+    def finish(self):
+        """Lift clear of the last drop so the plan ends at a safe height"""
+        if self.position is not None:
+            x, y, z, r = self.position
+            self._move(x, y, max(z, self.safe_height), r, LIFT)
+        return self
+
+    def waypoints(self):
+        """Every Cartesian point the arm passes through, including jump apexes"""
+        points = []
+        for step in self.steps:
+            if step.kind == JUMP:
+                start = points[-1]
+                points.append((start[0], start[1], max(step.height, start[2]), start[3]))
+                points.append((step.x, step.y, max(step.height, step.z), step.r))
+            if step.kind in (MOVE, JUMP):
+                points.append((step.x, step.y, step.z, step.r))
+        return points
+
+    def estimated_time(self, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION, dwell=0.0):
+        """Predicted execution time in seconds (motion plus actuation dwell)"""
+        motion = sum(segment_time(d, velocity, acceleration) for d in self.segments)
+        actions = sum(1 for step in self.steps if step.kind in (GRAB, RELEASE))
+        return motion + actions * dwell
+
+    def summary(self, dwell=0.0):
+        """One-line description of the plan for console output"""
+        return (f"{self.blocks} blocks, {self.moves} moves ({self.merged} merged), "
+                f"{self.distance:.0f} mm travel, ~{self.estimated_time(dwell=dwell):.1f}s estimated")
+
+    def as_dict(self):
+        """JSON-serialisable form of a finished plan (see from_dict)"""
+        return {"safe_height": self.safe_height, "clearance": self.clearance, "jump": self.jump,
+                "tolerance": self.tolerance, "lead": self.lead, "blocks": self.blocks,
+                "position": self.position, "segments": self.segments,
+                "steps": [list(step) for step in self.steps]}
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls(data["safe_height"], data["clearance"], data["jump"], data["tolerance"], data["lead"])
+        plan.steps = [Step(*step) for step in data["steps"]]
+        plan.segments = list(data["segments"])
+        plan.position = tuple(data["position"]) if data["position"] is not None else None
+        plan.blocks = data["blocks"]
+        return plan
+
+
+def plan_moves(moves, safe_height=50, clearance=None, jump=False, lead=None, workspace=None):
+    """Build a finished TrajectoryPlan from (pick, drop) pairs of (x, y, z, r)
+
+    workspace is updated in place as the plan moves blocks; pass a copy to
+    keep the original.
+    """
+    plan = TrajectoryPlan(safe_height=safe_height, clearance=clearance, jump=jump, lead=lead,
+                          workspace=workspace)
+    for pick, drop in moves:
+        plan.add_block(pick, drop)
+    return plan.finish()
@@ -0,0 +1,145 @@
+import math
+
+# Default block geometry (mm): the lab's foam cubes
+BLOCK_SIZE = 25.0
+BLOCK_HEIGHT = 25.0
+
+
+class HeightMap:
+    """Occupancy and height map of the blocks standing in the workspace
+
+    The work surface is divided into square cells of `cell` mm. Each cell
+    lists the heights of the blocks whose footprint, widened by the swept
+    half-width of the tool and any carried block, covers it. A block's
+    height is the z the tool engages it at, i.e. the z of its pick/drop
+    slot. The table is taken to be `block_height` below the lowest block
+    added, unless a floor is given.
+
+    leg_height() then gives the lowest height a traverse can fly at
+    without passing over anything closer than `margin`, so Z travel is
+    only as large as the current pallet state requires.
+    """
+
+    def __init__(self, cell=5.0, footprint=BLOCK_SIZE, block_height=BLOCK_HEIGHT, margin=10.0,
+                 radius=None, floor=None):
+        """Create an empty map
+
+        cell         -- grid resolution in mm
+        footprint    -- side length of a block in mm
+        block_height -- height of a block in mm (how far a carried block hangs below the tool)
+        margin       -- vertical gap kept above anything under the path; must also cover
+                        any part of a block above the z the tool engages it at
+        radius       -- horizontal half-width swept by the tool and a carried block, plus
+                        how far joint moves bow off the straight line (default: half a footprint)
+        floor        -- z of the table surface (default: derived from the blocks added)
+        """
+        self.cell = cell
+        self.footprint = footprint
+        self.block_height = block_height
+        self.margin = margin
+        self.radius = footprint / 2.0 if radius is None else radius
+        self.floor = floor
+        self.derived_floor = floor is None
+        self.cells = {}
+        self.blocks = 0
+
+    def __len__(self):
+        return self.blocks
+
+    def copy(self):
+        """Independent copy, e.g. for a planner to play a pass forward on"""
+        other = HeightMap(self.cell, self.footprint, self.block_height, self.margin, self.radius, self.floor)
+        other.derived_floor = self.derived_floor
+        other.cells = {key: list(tops) for key, tops in self.cells.items()}
+        other.blocks = self.blocks
+        return other
+
+    def clear(self):
+        """Forget every block (and a floor derived from them)"""
+        self.cells = {}
+        self.blocks = 0
+        if self.derived_floor:
+            self.floor = None
+
+    def _index(self, value):
+        return math.floor(value / self.cell)
+
+    def _covered(self, x, y):
+        """Cells a block standing at (x, y) blocks for the tool"""
+        half = self.footprint / 2.0 + self.radius
+        columns = range(self._index(x - half), self._index(x + half) + 1)
+        rows = range(self._index(y - half), self._index(y + half) + 1)
+        return [(i, j) for i in columns for j in rows]
+
+    def add(self, x, y, z):
+        """Record a block standing at slot (x, y, z)"""
+        for key in self._covered(x, y):
+            self.cells.setdefault(key, []).append(z)
+        self.blocks += 1
+        if self.derived_floor and (self.floor is None or z - self.block_height < self.floor):
+            self.floor = z - self.block_height
+
+    def remove(self, x, y, z, tolerance=0.01):
+        """Forget the block at slot (x, y, z); returns False if there was none"""
+        covered = self._covered(x, y)
+        tops = self.cells.get(covered[0], ())
+        if not any(abs(top - z) <= tolerance for top in tops):
+            return False
+        for key in covered:
+            tops = self.cells[key]
+            for i, top in enumerate(tops):
+                if abs(top - z) <= tolerance:
+                    del tops[i]
+                    break
+            if not tops:
+                del self.cells[key]
+        self.blocks -= 1
+        return True
+
+    def move(self, pick, drop):
+        """Update the map for a block carried from slot `pick` to slot `drop` ((x, y, z, ...) tuples)"""
+        self.remove(*pick[:3])
+        self.add(*drop[:3])
+
+    def load(self, layout, locations=None):
+        """Add every block of a pallet.PalletLayout
+
+        locations -- optional callable(block_num) -> "pick", "drop" or None (in
+                     neither, e.g. still held); by default every block is at its pick
+        """
+        for block_num, (pick, drop) in enumerate(layout.poses(), 1):
+            location = "pick" if locations is None else locations(block_num)
+            if location == "pick":
+                self.add(*pick[:3])
+            elif location == "drop":
+                self.add(*drop[:3])
+        return self
+
+    def highest(self, start, end):
+        """Top of the tallest block under the straight path from `start` to `end` (or None)"""
+        (x0, y0), (x1, y1) = start[:2], end[:2]
+        samples = int(math.hypot(x1 - x0, y1 - y0) / (self.cell / 2.0)) + 1
+        top = None
+        seen = set()
+        for k in range(samples + 1):
+            t = k / samples
+            key = (self._index(x0 + (x1 - x0) * t), self._index(y0 + (y1 - y0) * t))
+            if key in seen:
+                continue
+            seen.add(key)
+            for z in self.cells.get(key, ()):
+                if top is None or z > top:
+                    top = z
+        return top
+
+    def leg_height(self, start, end, loaded=False, ceiling=math.inf):
+        """Lowest collision-free height for a traverse between two (x, y, z, ...) points
+
+        loaded -- a block hangs `block_height` below the tool during this leg
+        ceiling -- upper bound, normally the palletizer's safe_height
+        """
+        tops = [z for z in (self.highest(start, end), self.floor) if z is not None]
+        height = max(start[2], end[2])
+        if tops:
+            height = max(height, max(tops) + self.margin + (self.block_height if loaded else 0.0))
+        return min(ceiling, height)